@@ -3,17 +3,20 @@
 import streamlit as st
 import io
 import os
+import uuid
 from utils.exportar import generar_docx_concepto
 from utils.resumen import generar_resumen
-from utils.viabilidad import evaluar_viabilidad
-from utils.por_secciones import generar_seccion
-from utils.rag import generar_resumen_con_rag, evaluar_viabilidad_con_rag, generar_seccion_con_rag
-from utils.vector_rag import generar_resumen_vector_rag, evaluar_viabilidad_vector_rag, generar_seccion_vector_rag
+from utils.viabilidad import evaluar_viabilidad_stream
+from utils.por_secciones import generar_seccion_async, generar_seccion_stream, generar_secciones_concurrentes, MAX_CONCURRENCIA_SECCIONES
+from utils.rag import generar_resumen_con_rag, evaluar_viabilidad_con_rag_stream, generar_seccion_con_rag_async, generar_seccion_con_rag_stream
+from utils.vector_rag import generar_resumen_vector_rag, evaluar_viabilidad_vector_rag_stream, generar_seccion_vector_rag_async, generar_seccion_vector_rag_stream
 from utils.knowledge_manager import render_knowledge_manager
 from utils.poder import render_poder_module
 from utils.transcripcion import render_transcripcion_module, render_transcripcion_inline
 from utils.expediente import render_cargar_expediente
-from utils.documento_referencia import generar_seccion_con_referencia
+from utils.documento_referencia import generar_seccion_con_referencia_async, generar_seccion_con_referencia_stream
+from utils.llm import AvisoError, obtener_gateway, establecer_regeneracion, regenerar
+from utils.metricas import establecer_contexto_metricas
 from docx import Document
 
 # Ruta del logo (con manejo de error si no existe)
@@ -184,6 +187,130 @@ def render_phase_card(title: str, icon: str, content: str):
     </div>
     """, unsafe_allow_html=True)
 
+def mostrar_stream(fragmentos, placeholder=None) -> str:
+    """
+    Muestra el texto a medida que llega del modelo y devuelve el texto completo.
+
+    Si el stream falla a mitad de camino (AvisoError), el aviso reemplaza al
+    texto parcial: no se devuelve una respuesta truncada.
+    """
+    if placeholder is None:
+        placeholder = st.empty()
+    texto = ""
+    for fragmento in fragmentos:
+        if isinstance(fragmento, AvisoError):
+            texto = str(fragmento)
+            break
+        texto += fragmento
+        placeholder.markdown(texto + "▌")
+    placeholder.markdown(texto)
+    return texto.strip()
+
+def stream_seccion(rag_mode: str, seccion: str, comentario_usuario: str = ""):
+    """Selecciona la generación en streaming de una sección según patrones de referencia y modo RAG"""
+    args = (seccion, st.session_state.hechos, st.session_state.resumen, st.session_state.concepto)
+    # Si hay patrones de referencia cargados automáticamente, usarlos
+    if st.session_state.patrones_referencia:
+        return generar_seccion_con_referencia_stream(
+            *args, st.session_state.patrones_referencia, comentario_usuario=comentario_usuario
+        )
+    # Usar RAG según el modo seleccionado
+    if rag_mode == "RAG Básico":
+        return generar_seccion_con_rag_stream(*args, comentario_usuario=comentario_usuario)
+    if rag_mode in ("RAG Vectorial", "RAG Híbrido"):
+        return generar_seccion_vector_rag_stream(*args, comentario_usuario=comentario_usuario, hibrido=rag_mode == "RAG Híbrido")
+    return generar_seccion_stream(*args, comentario_usuario=comentario_usuario)
+
+def generador_seccion(rag_mode: str):
+    """Corrutina seccion -> texto con los datos del caso ya capturados (no lee st.session_state)"""
+    hechos = st.session_state.hechos
+    resumen = st.session_state.resumen
+    concepto = st.session_state.concepto
+    patrones = st.session_state.patrones_referencia
+    if patrones:
+        return lambda seccion: generar_seccion_con_referencia_async(seccion, hechos, resumen, concepto, patrones)
+    if rag_mode == "RAG Básico":
+        return lambda seccion: generar_seccion_con_rag_async(seccion, hechos, resumen, concepto)
+    if rag_mode in ("RAG Vectorial", "RAG Híbrido"):
+        hibrido = rag_mode == "RAG Híbrido"
+        return lambda seccion: generar_seccion_vector_rag_async(seccion, hechos, resumen, concepto, hibrido=hibrido)
+    return lambda seccion: generar_seccion_async(seccion, hechos, resumen, concepto)
+
+def render_generar_todas(rag_mode: str):
+    """Redacta en paralelo todas las secciones vacías de la demanda, mostrando el avance por sección"""
+    secciones = list(st.session_state.secciones_demanda.keys())
+    pendientes = [s for s in secciones if not st.session_state.secciones_demanda[s]]
+    
+    with st.expander(f"⚡ Redactar todas las secciones pendientes ({len(pendientes)})", expanded=False):
+        if not pendientes:
+            st.success("✅ Todas las secciones tienen una redacción")
+            return
+        
+        max_concurrencia = st.number_input(
+            "Secciones simultáneas:",
+            min_value=1,
+            max_value=len(secciones),
+            value=min(MAX_CONCURRENCIA_SECCIONES, len(secciones)),
+            help="Número máximo de secciones que se redactan al mismo tiempo"
+        )
+        
+        if st.button("⚡ Generar todas las secciones", type="primary", use_container_width=True):
+            progreso = st.progress(0.0, text=f"0 de {len(pendientes)} secciones")
+            estado = st.empty()
+            lineas = {s: f"⏳ {s}" for s in pendientes}
+            estado.markdown("\n\n".join(lineas.values()))
+            
+            errores = 0
+            resultados = generar_secciones_concurrentes(pendientes, generador_seccion(rag_mode), int(max_concurrencia))
+            for terminadas, (seccion, texto, error) in enumerate(resultados, 1):
+                if error is None:
+                    st.session_state.secciones_demanda[seccion] = texto
+                    lineas[seccion] = f"✅ {seccion}"
+                else:
+                    errores += 1
+                    lineas[seccion] = f"❌ {seccion}: {error}"
+                progreso.progress(terminadas / len(pendientes), text=f"{terminadas} de {len(pendientes)} secciones")
+                estado.markdown("\n\n".join(lineas.values()))
+            
+            if errores:
+                st.error(f"❌ {errores} secciones no se pudieron redactar. Puedes reintentar.")
+            else:
+                st.rerun()
+
+# Identificadores para atribuir tokens y costo de cada llamada al LLM
+if "sesion_id" not in st.session_state:
+    st.session_state.sesion_id = uuid.uuid4().hex[:12]
+if "caso_id" not in st.session_state:
+    st.session_state.caso_id = uuid.uuid4().hex[:12]
+establecer_contexto_metricas(st.session_state.sesion_id, st.session_state.caso_id)
+
+def render_resumen_metricas():
+    """Consumo de tokens, latencia y costo de la sesión actual, por etapa"""
+    metricas = obtener_gateway().metricas
+    if metricas is None:
+        return
+    resumen = metricas.resumen_sesion(st.session_state.sesion_id)
+    if not resumen:
+        return
+    with st.expander("📊 Consumo de la sesión"):
+        filas = []
+        for etapa, total in sorted(resumen.items()):
+            llamadas_api = total["llamadas"] - total["cache"] - total["dedup"]
+            filas.append({
+                "Etapa": etapa,
+                "Llamadas": total["llamadas"],
+                "Caché": total["cache"],
+                "Compartidas": total["dedup"],
+                "Tokens entrada": total["prompt_tokens"],
+                "% en caché": round(100 * total["cached_tokens"] / total["prompt_tokens"]) if total["prompt_tokens"] else 0,
+                "Tokens salida": total["completion_tokens"],
+                "Latencia media (s)": round(total["latencia_s"] / llamadas_api, 2) if llamadas_api else 0.0,
+                "Costo (USD)": round(total["costo_usd"], 4),
+            })
+        st.dataframe(filas, hide_index=True, use_container_width=True)
+        costo_total = sum(total["costo_usd"] for total in resumen.values())
+        st.caption(f"💵 Costo estimado de la sesión: ${costo_total:.4f} USD")
+
 # Sidebar para navegación y configuración
 with st.sidebar:
     if logo_path and os.path.exists(logo_path):
@@ -211,8 +338,8 @@ with st.sidebar:
         st.header("⚙️ Configuración RAG")
         rag_mode = st.selectbox(
             "Modo de RAG:",
-            ["Sin RAG", "RAG Básico", "RAG Vectorial"],
-            help="RAG Básico: Búsqueda por palabras clave\nRAG Vectorial: Búsqueda semántica con embeddings"
+            ["Sin RAG", "RAG Básico", "RAG Vectorial", "RAG Híbrido"],
+            help="RAG Básico: Búsqueda por palabras clave\nRAG Vectorial: Búsqueda semántica con embeddings\nRAG Híbrido: Búsqueda semántica combinada con BM25 (artículos, radicados de sentencias)"
         )
         
         if rag_mode != "Sin RAG":
@@ -224,6 +351,19 @@ with st.sidebar:
         else:
             st.info("💡 Activa RAG para respuestas más precisas")
         
+        regenerar_sin_cache = st.checkbox(
+            "♻️ Regenerar sin caché",
+            help="Ignora las respuestas guardadas y vuelve a consultar el modelo"
+        )
+        establecer_regeneracion(regenerar_sin_cache)
+        
+        cache_llm = obtener_gateway().cache
+        if cache_llm is not None:
+            stats_cache = cache_llm.estadisticas()
+            st.caption(f"🗄️ Caché LLM: {stats_cache['aciertos']} aciertos / {stats_cache['fallos']} fallos · {stats_cache['entradas']} entradas")
+        
+        render_resumen_metricas()
+        
         st.markdown("---")
         
         # Información del caso
@@ -232,7 +372,7 @@ with st.sidebar:
             st.caption("Hechos ingresados")
             if st.button("🔄 Reiniciar Caso"):
                 for key in list(st.session_state.keys()):
-                    if key not in ["rag_mode_sidebar"]:
+                    if key not in ["rag_mode_sidebar", "sesion_id"]:
                         del st.session_state[key]
                 st.rerun()
 
@@ -302,7 +442,7 @@ if page == "🏠 Asistente Jurídico":
     # Obtener modo RAG del sidebar
     rag_mode = st.sidebar.selectbox(
         "Modo de RAG:",
-        ["Sin RAG", "RAG Básico", "RAG Vectorial"],
+        ["Sin RAG", "RAG Básico", "RAG Vectorial", "RAG Híbrido"],
         key="rag_mode_sidebar"
     )
 
@@ -452,8 +592,8 @@ if page == "🏠 Asistente Jurídico":
                         # Usar RAG según el modo seleccionado
                         if rag_mode == "RAG Básico":
                             resumen = generar_resumen_con_rag(hechos)
-                        elif rag_mode == "RAG Vectorial":
-                            resumen = generar_resumen_vector_rag(hechos)
+                        elif rag_mode in ("RAG Vectorial", "RAG Híbrido"):
+                            resumen = generar_resumen_vector_rag(hechos, hibrido=rag_mode == "RAG Híbrido")
                         else:
                             resumen = generar_resumen(hechos)
                             
@@ -489,20 +629,19 @@ if page == "🏠 Asistente Jurídico":
         st.info(st.session_state.hechos)
 
         if st.button("📘 Emitir Concepto Jurídico", type="primary", use_container_width=True):
-            with st.spinner("🤖 Evaluando viabilidad jurídica con IA..."):
-                # Usar RAG según el modo seleccionado
-                if rag_mode == "RAG Básico":
-                    concepto = evaluar_viabilidad_con_rag(st.session_state.hechos)
-                elif rag_mode == "RAG Vectorial":
-                    concepto = evaluar_viabilidad_vector_rag(st.session_state.hechos)
-                else:
-                    concepto = evaluar_viabilidad(st.session_state.hechos)
+            # Usar RAG según el modo seleccionado
+            if rag_mode == "RAG Básico":
+                fragmentos = evaluar_viabilidad_con_rag_stream(st.session_state.hechos)
+            elif rag_mode in ("RAG Vectorial", "RAG Híbrido"):
+                fragmentos = evaluar_viabilidad_vector_rag_stream(st.session_state.hechos, hibrido=rag_mode == "RAG Híbrido")
+            else:
+                fragmentos = evaluar_viabilidad_stream(st.session_state.hechos)
+            
+            with st.expander("📑 Ver Concepto Jurídico", expanded=True):
+                concepto = mostrar_stream(fragmentos)
                     
             st.session_state.concepto = concepto
             st.success("✅ Concepto generado exitosamente!")
-            
-            with st.expander("📑 Ver Concepto Jurídico", expanded=True):
-                st.markdown(concepto)
 
             # Descargar concepto
             doc = generar_docx_concepto(st.session_state.hechos, concepto)
@@ -624,6 +763,9 @@ if page == "🏠 Asistente Jurídico":
             else:
                 st.session_state.nombre_abogado = nombre.strip()
 
+                # Redacción de todas las secciones pendientes en paralelo
+                render_generar_todas(rag_mode)
+
                 # Redacción guiada sección por sección
                 secciones = list(st.session_state.secciones_demanda.keys())
                 seccion = secciones[st.session_state.seccion_actual]
@@ -636,39 +778,12 @@ if page == "🏠 Asistente Jurídico":
                 """, unsafe_allow_html=True)
 
                 if st.session_state.secciones_demanda[seccion] == "":
-                    with st.spinner(f"🤖 Redactando la sección: {seccion}..."):
-                        # Si hay patrones de referencia cargados automáticamente, usarlos
-                        if st.session_state.patrones_referencia:
-                            texto_generado = generar_seccion_con_referencia(
-                                seccion,
-                                st.session_state.hechos,
-                                st.session_state.resumen,
-                                st.session_state.concepto,
-                                st.session_state.patrones_referencia
-                            )
-                        # Usar RAG según el modo seleccionado
-                        elif rag_mode == "RAG Básico":
-                            texto_generado = generar_seccion_con_rag(
-                                seccion,
-                                st.session_state.hechos,
-                                st.session_state.resumen,
-                                st.session_state.concepto
-                            )
-                        elif rag_mode == "RAG Vectorial":
-                            texto_generado = generar_seccion_vector_rag(
-                                seccion,
-                                st.session_state.hechos,
-                                st.session_state.resumen,
-                                st.session_state.concepto
-                            )
-                        else:
-                            texto_generado = generar_seccion(
-                                seccion,
-                                st.session_state.hechos,
-                                st.session_state.resumen,
-                                st.session_state.concepto
-                            )
-                            
+                    aviso = st.empty()
+                    aviso.info(f"🤖 Redactando la sección: {seccion}...")
+                    vista_previa = st.empty()
+                    texto_generado = mostrar_stream(stream_seccion(rag_mode, seccion), vista_previa)
+                    vista_previa.empty()
+                    aviso.empty()
                     st.session_state.secciones_demanda[seccion] = texto_generado
 
                 st.text_area(
@@ -729,42 +844,9 @@ if page == "🏠 Asistente Jurídico":
                         placeholder="Ej: Hacer más énfasis en la subordinación, mencionar jurisprudencia específica..."
                     )
                     if st.button("🔁 Reescribir esta sección con los comentarios", type="primary", use_container_width=True):
-                        with st.spinner("🤖 Reescribiendo sección..."):
-                            # Si hay patrones de referencia cargados automáticamente, usarlos
-                            if st.session_state.patrones_referencia:
-                                nueva_redaccion = generar_seccion_con_referencia(
-                                    seccion,
-                                    st.session_state.hechos,
-                                    st.session_state.resumen,
-                                    st.session_state.concepto,
-                                    st.session_state.patrones_referencia,
-                                    comentario_usuario=comentario
-                                )
-                            # Usar RAG según el modo seleccionado
-                            elif rag_mode == "RAG Básico":
-                                nueva_redaccion = generar_seccion_con_rag(
-                                    seccion,
-                                    st.session_state.hechos,
-                                    st.session_state.resumen,
-                                    st.session_state.concepto,
-                                    comentario_usuario=comentario
-                                )
-                            elif rag_mode == "RAG Vectorial":
-                                nueva_redaccion = generar_seccion_vector_rag(
-                                    seccion,
-                                    st.session_state.hechos,
-                                    st.session_state.resumen,
-                                    st.session_state.concepto,
-                                    comentario_usuario=comentario
-                                )
-                            else:
-                                nueva_redaccion = generar_seccion(
-                                    seccion,
-                                    st.session_state.hechos,
-                                    st.session_state.resumen,
-                                    st.session_state.concepto,
-                                    comentario_usuario=comentario
-                                )
+                        st.info("🤖 Reescribiendo sección...")
+                        with regenerar():
+                            nueva_redaccion = mostrar_stream(stream_seccion(rag_mode, seccion, comentario_usuario=comentario))
                                 
                         st.session_state.secciones_demanda[seccion] = nueva_redaccion
                         st.rerun()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark del índice aproximado (IVF) y del almacenamiento cuantizado frente a la búsqueda exacta.
+
+Genera corpus sintéticos de embeddings normalizados (agrupados en temas, como
+los fragmentos de jurisprudencia) y reporta, por tamaño de corpus y método,
+recall@k respecto de la búsqueda exacta, la latencia p50/p99 por consulta y
+los bytes por vector que la búsqueda mantiene en memoria.
+
+Uso:
+    python benchmark_ann.py [--tamanos 10000 100000 1000000] [--dimension 256] [--k 10]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from utils.cuantizacion import MODOS, VectoresCuantizados
+from utils.indice_ivf import IndiceIVF, listas_automaticas
+from utils.indice_vectorial import normalizar, top_k
+
+
+def corpus_sintetico(n: int, dimension: int, rng: np.random.Generator, temas: int = 1000, bloque: int = 100000) -> np.ndarray:
+    """Embeddings normalizados alrededor de `temas` centros, generados por bloques"""
+    centros = normalizar(rng.standard_normal((temas, dimension), dtype=np.float32))
+    vectores = np.empty((n, dimension), dtype=np.float32)
+    for inicio in range(0, n, bloque):
+        m = min(bloque, n - inicio)
+        ruido = rng.standard_normal((m, dimension), dtype=np.float32) * 0.08
+        vectores[inicio:inicio + m] = normalizar(centros[rng.integers(0, temas, m)] + ruido)
+    return vectores
+
+
+def percentiles_ms(tiempos: list) -> tuple:
+    ms = np.asarray(tiempos) * 1000
+    return float(np.percentile(ms, 50)), float(np.percentile(ms, 99))
+
+
+def medir_exacto(vectores: np.ndarray, consultas: np.ndarray, k: int) -> tuple:
+    """Vecinos exactos (verdad de referencia) y latencia de la búsqueda exacta consulta a consulta"""
+    tiempos, vecinos = [], []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        indices, _ = top_k(vectores, consulta[None, :], k)
+        tiempos.append(time.perf_counter() - inicio)
+        vecinos.append(indices[0])
+    return np.array(vecinos), tiempos
+
+
+def medir(buscar, consultas: np.ndarray, exactos: np.ndarray) -> tuple:
+    """recall@k medio y latencias de una función consulta (1, d) -> (indices, puntajes)"""
+    tiempos, aciertos = [], 0
+    for consulta, esperados in zip(consultas, exactos):
+        inicio = time.perf_counter()
+        indices, _ = buscar(consulta[None, :])
+        tiempos.append(time.perf_counter() - inicio)
+        aciertos += len(np.intersect1d(indices[0], esperados))
+    return aciertos / exactos.size, tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compara el índice IVF con la búsqueda exacta: recall@k y latencia p50/p99'
+    )
+    parser.add_argument(
+        '--tamanos', type=int, nargs='+',
+        default=[10000, 100000, 1000000],
+        help='Tamaños de corpus (número de fragmentos) a evaluar (default: 10000 100000 1000000)'
+    )
+    parser.add_argument('--dimension', type=int, default=256, help='Dimensión de los embeddings (default: 256)')
+    parser.add_argument('--k', type=int, default=10, help='Resultados por consulta (default: 10)')
+    parser.add_argument('--consultas', type=int, default=200, help='Consultas por tamaño (default: 200)')
+    parser.add_argument(
+        '--nprobe', type=int, nargs='+',
+        default=[4, 8, 16, 32, 64],
+        help='Valores de nprobe a evaluar (default: 4 8 16 32 64)'
+    )
+    parser.add_argument('--listas', type=int, default=0, help='Listas IVF; 0 = automático, ≈ √n (default: 0)')
+    parser.add_argument(
+        '--reordenar', type=int, nargs='+', default=[10],
+        help='Candidatos por resultado reordenados con float32 en modo cuantizado (default: 10)'
+    )
+    parser.add_argument('--semilla', type=int, default=0, help='Semilla aleatoria (default: 0)')
+
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.semilla)
+
+    for n in args.tamanos:
+        print("-" * 60)
+        print(f"📚 Corpus: {n:,} fragmentos × {args.dimension} dimensiones, k={args.k}")
+        vectores = corpus_sintetico(n, args.dimension, rng)
+        # Consultas: fragmentos del corpus ligeramente perturbados
+        consultas = normalizar(
+            vectores[rng.integers(0, n, args.consultas)]
+            + rng.standard_normal((args.consultas, args.dimension), dtype=np.float32) * 0.05
+        )
+
+        inicio = time.perf_counter()
+        ivf = IndiceIVF.entrenar(vectores, args.listas or listas_automaticas(n), semilla=args.semilla)
+        print(f"🏗️  IVF entrenado: {ivf.n_listas} listas en {time.perf_counter() - inicio:.1f} s")
+
+        exactos, tiempos = medir_exacto(vectores, consultas, args.k)
+        p50, p99 = percentiles_ms(tiempos)
+        print(f"{'método':<22}{'recall@' + str(args.k):>12}{'p50 ms':>10}{'p99 ms':>10}{'bytes/vector':>14}")
+        print(f"{'exacto':<22}{1.0:>12.3f}{p50:>10.2f}{p99:>10.2f}{4 * args.dimension:>14}")
+        for nprobe in args.nprobe:
+            if nprobe > ivf.n_listas:
+                continue
+            recall, tiempos = medir(lambda c: ivf.buscar(vectores, c, args.k, nprobe), consultas, exactos)
+            p50, p99 = percentiles_ms(tiempos)
+            print(f"{'ivf nprobe=' + str(nprobe):<22}{recall:>12.3f}{p50:>10.2f}{p99:>10.2f}{'':>14}")
+        for modo in MODOS:
+            cuantizados = VectoresCuantizados.desde_vectores(modo, vectores)
+            for factor in args.reordenar:
+                recall, tiempos = medir(lambda c: cuantizados.buscar(vectores, c, args.k, factor), consultas, exactos)
+                p50, p99 = percentiles_ms(tiempos)
+                nombre = f"{modo} reordenar={factor}"
+                print(f"{nombre:<22}{recall:>12.3f}{p50:>10.2f}{p99:>10.2f}{cuantizados.bytes_por_vector:>14}")
+        del vectores
+
+    print("-" * 60)
+    print("💡 Ajusta VECTOR_IVF_NPROBE (recall/latencia) y VECTOR_IVF_LISTAS según estos resultados")
+
+
+if __name__ == "__main__":
+    main()
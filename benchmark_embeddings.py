@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Comparación de backends de embeddings (calidad y velocidad) sobre el corpus legal.
+
+Calidad: autorrecuperación. Cada documento del corpus se busca con un pasaje
+suyo (su segunda mitad) y se mide recall@k y MRR de encontrar el documento
+original. Velocidad: textos por segundo al embeber el corpus y latencia p50
+de una consulta.
+
+Uso:
+    python benchmark_embeddings.py [--backends local openai] [--k 5] [--repeticiones 20]
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from utils.embeddings import BACKENDS, obtener_embedder
+from utils.indice_vectorial import normalizar, top_k
+from utils.vector_rag import cargar_corpus_legal
+
+
+def consultas_autorrecuperacion(documentos: list) -> list:
+    """(índice del documento, pasaje) para los documentos con texto suficiente"""
+    consultas = []
+    for i, doc in enumerate(documentos):
+        palabras = doc["content"].split()
+        if len(palabras) >= 12:
+            consultas.append((i, " ".join(palabras[len(palabras) // 2:])))
+    return consultas
+
+
+async def evaluar(backend: str, documentos: list, k: int, repeticiones: int) -> dict:
+    embedder = obtener_embedder(backend)
+    textos = [doc["content"] for doc in documentos]
+
+    # Velocidad de indexación: el corpus repetido con un sufijo (textos distintos), sin caché como al indexar
+    volumen = [f"{texto} [{r}]" for r in range(repeticiones) for texto in textos]
+    inicio = time.perf_counter()
+    await embedder.embeber_lotes_async(volumen, usar_cache=False)
+    textos_por_s = len(volumen) / (time.perf_counter() - inicio)
+
+    matriz = normalizar(await embedder.embeber_lotes_async(textos, usar_cache=False))
+    consultas = consultas_autorrecuperacion(documentos)
+    latencias, aciertos, rango_reciproco = [], 0, 0.0
+    for esperado, pasaje in consultas:
+        inicio = time.perf_counter()
+        vector = normalizar(await embedder.embeber_async(f"{pasaje} ?"))
+        indices, _ = top_k(matriz, vector[None, :], k)
+        latencias.append(time.perf_counter() - inicio)
+        posiciones = np.flatnonzero(indices[0] == esperado)
+        if len(posiciones):
+            aciertos += 1
+            rango_reciproco += 1 / (posiciones[0] + 1)
+    return {
+        "modelo": embedder.modelo,
+        "consultas": len(consultas),
+        "recall": aciertos / max(1, len(consultas)),
+        "mrr": rango_reciproco / max(1, len(consultas)),
+        "textos_por_s": textos_por_s,
+        "p50_ms": float(np.percentile(np.asarray(latencias) * 1000, 50)) if latencias else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compara backends de embeddings: recall@k de autorrecuperación, velocidad y latencia'
+    )
+    parser.add_argument(
+        '--backends', nargs='+', default=list(BACKENDS),
+        help=f"Backends a evaluar (default: {' '.join(BACKENDS)})"
+    )
+    parser.add_argument('--k', type=int, default=5, help='Resultados por consulta (default: 5)')
+    parser.add_argument(
+        '--repeticiones', type=int, default=20,
+        help='Veces que se embebe el corpus para medir textos por segundo (default: 20)'
+    )
+    parser.add_argument('--conocimiento', default='legal_knowledge.json', help='Base de conocimiento (default: legal_knowledge.json)')
+
+    args = parser.parse_args()
+    documentos = cargar_corpus_legal(args.conocimiento)
+    print(f"📚 Corpus: {len(documentos)} fragmentos")
+    print("-" * 60)
+    print(f"{'backend':<10}{'recall@' + str(args.k):>10}{'MRR':>8}{'textos/s':>12}{'p50 ms':>10}  modelo")
+    for backend in args.backends:
+        try:
+            r = asyncio.run(evaluar(backend, documentos, args.k, args.repeticiones))
+        except Exception as e:
+            print(f"{backend:<10}❌ {str(e)}")
+            continue
+        print(f"{backend:<10}{r['recall']:>10.3f}{r['mrr']:>8.3f}{r['textos_por_s']:>12.0f}{r['p50_ms']:>10.2f}  {r['modelo']}")
+    print("-" * 60)
+    print("💡 Elige el backend con EMBEDDINGS_BACKEND=openai|local")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,14 +10,10 @@ import sys
 import json
 import os
 import argparse
-from dotenv import load_dotenv
-from openai import OpenAI
 from utils.expediente import extraer_texto_pdf, extraer_texto_pdf_ocr
+from utils.llm import completar_async, ejecutar
 import io
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 def extraer_texto_documento(ruta_archivo: str, usar_ocr: bool = False) -> str:
     """
     Extrae texto de un archivo PDF o TXT.
@@ -59,7 +55,7 @@ def extraer_texto_documento(ruta_archivo: str, usar_ocr: bool = False) -> str:
     else:
         raise ValueError(f"Formato no soportado: {extension}. Use PDF o TXT")
 
-def extraer_patrones_documento(texto_documento: str) -> dict:
+async def extraer_patrones_documento_async(texto_documento: str) -> dict:
     """
     Extrae patrones de redacción de cada sección del documento de referencia usando IA.
     
@@ -124,21 +120,18 @@ IMPORTANTE:
 """
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
+        contenido = await completar_async(
+            "patrones",
+            [
                 {
                     "role": "system", 
                     "content": "Eres un experto en análisis de documentos legales colombianos. Extraes patrones de redacción de manera precisa y estructurada. Siempre respondes en formato JSON válido."
                 },
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.2,
             max_tokens=6000
         )
         
-        contenido = response.choices[0].message.content.strip()
-        
         # Limpiar el contenido si tiene markdown
         if contenido.startswith("```json"):
             contenido = contenido[7:]
@@ -163,6 +156,10 @@ IMPORTANTE:
         print(f"❌ Error al extraer patrones: {str(e)}")
         return {}
 
+def extraer_patrones_documento(texto_documento: str) -> dict:
+    """Versión síncrona de extraer_patrones_documento_async"""
+    return ejecutar(extraer_patrones_documento_async(texto_documento))
+
 def main():
     parser = argparse.ArgumentParser(
         description='Extrae patrones de redacción de un documento de referencia de demanda laboral'
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Ingesta masiva de sentencias (PDF, TXT o JSONL) en la base de conocimiento.
+
+Recorre el directorio, extrae el texto en paralelo, descarta los documentos
+repetidos (por huella del contenido), los guarda en lotes y, al final, pone
+al día el índice semántico. Si se interrumpe, al volver a ejecutarlo se
+saltan los archivos ya confirmados.
+
+Uso:
+    python ingestar_corpus.py <directorio> [--categoria jurisprudencia] [--tipo sentencias] [--trabajadores 4]
+"""
+
+import argparse
+import os
+import sys
+
+from utils.ingesta import (
+    CATEGORIA_DEFECTO, DOCUMENTOS_POR_LOTE, TIPO_DEFECTO, TRABAJADORES, EstadoIngesta, ingerir_directorio
+)
+
+
+def mostrar_progreso(estado: EstadoIngesta, ruta_estado: str = ""):
+    if ruta_estado:
+        # Ingesta lanzada desde la interfaz: publicar el avance y atender la cancelación
+        estado.guardar(ruta_estado)
+        if os.path.exists(ruta_estado + ".cancelar"):
+            estado.cancelar.set()
+    print(
+        f"\r⏳ {estado.fase}: {estado.fraccion:6.1%} "
+        f"({estado.archivos_procesados + estado.archivos_omitidos}/{estado.archivos_total} archivos, "
+        f"{estado.documentos_agregados} documentos, {estado.duplicados} duplicados, {len(estado.errores)} errores)",
+        end="", flush=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Ingiere un directorio de sentencias (PDF, TXT o JSONL) en la base de conocimiento'
+    )
+    parser.add_argument('directorio', help='Directorio con los archivos (se recorre recursivamente)')
+    parser.add_argument('--conocimiento', default='legal_knowledge.json', help='Base de conocimiento (default: legal_knowledge.json)')
+    parser.add_argument('--categoria', default=CATEGORIA_DEFECTO, help=f'Categoría de los documentos (default: {CATEGORIA_DEFECTO})')
+    parser.add_argument('--tipo', default=TIPO_DEFECTO, help=f'Tipo de documento (default: {TIPO_DEFECTO})')
+    parser.add_argument('--trabajadores', type=int, default=TRABAJADORES, help=f'Procesos de extracción (default: {TRABAJADORES})')
+    parser.add_argument('--lote', type=int, default=DOCUMENTOS_POR_LOTE, help=f'Documentos por transacción (default: {DOCUMENTOS_POR_LOTE})')
+    parser.add_argument('--reiniciar', action='store_true', help='Procesar de nuevo todos los archivos, aunque ya se hayan ingerido')
+    parser.add_argument('--sin-indice', action='store_true', help='No actualizar el índice semántico al terminar')
+    parser.add_argument('--estado', default='', help='Archivo JSON donde publicar el avance (lo usa la interfaz)')
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directorio):
+        print(f"❌ Error: {args.directorio} no es un directorio")
+        sys.exit(1)
+
+    print(f"📂 Ingiriendo {args.directorio} en {args.conocimiento} ({args.trabajadores} procesos)...")
+    estado = EstadoIngesta(args.directorio)
+    try:
+        ingerir_directorio(
+            args.directorio,
+            knowledge_file=args.conocimiento,
+            categoria=args.categoria,
+            tipo=args.tipo,
+            trabajadores=args.trabajadores,
+            documentos_por_lote=args.lote,
+            reanudar=not args.reiniciar,
+            actualizar_indice=not args.sin_indice,
+            estado=estado,
+            progreso=lambda e: mostrar_progreso(e, args.estado)
+        )
+    except KeyboardInterrupt:
+        print("\n⚠️ Interrumpido: los lotes confirmados se conservan; vuelve a ejecutar para reanudar")
+        sys.exit(130)
+
+    print()
+    print("-" * 60)
+    resumen = estado.resumen()
+    print(f"✅ Documentos agregados: {resumen['documentos_agregados']}")
+    print(f"♻️  Duplicados descartados: {resumen['duplicados']}")
+    print(f"⏭️  Archivos ya ingeridos: {resumen['archivos_omitidos']}")
+    print(f"⏱️  Tiempo: {resumen['segundos']} s")
+    if estado.errores:
+        print(f"⚠️ Errores ({len(estado.errores)}):")
+        for ruta, error in estado.errores[:20]:
+            print(f"   - {ruta}: {error}")
+    if estado.fase == "fallida":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# tests/conftest.py
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Los módulos se importan como en la aplicación (``from utils.x import ...``)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sin caché en disco, métricas ni claves reales al importar el gateway
+os.environ.setdefault("LLM_CACHE_ACTIVA", "0")
+os.environ.setdefault("LLM_METRICAS_ACTIVAS", "0")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+class ClienteFalso:
+    """
+    Cliente OpenAI asíncrono en memoria para el gateway.
+
+    ``create`` registra cada llamada en ``llamadas``, espera ``retraso`` segundos
+    (antes de responder o entre fragmentos de un stream) y devuelve ``texto``
+    con un uso de ``total_tokens`` tokens, o lanza ``error`` si está definido.
+    Con ``con_uso=False`` los streams terminan sin el fragmento de uso.
+    """
+
+    def __init__(self, texto: str = "Hola mundo", retraso: float = 0.0, total_tokens: int = 120):
+        self.texto = texto
+        self.retraso = retraso
+        self.total_tokens = total_tokens
+        self.error = None
+        self.con_uso = True
+        self.llamadas = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, stream: bool = False, **params):
+        self.llamadas.append(params)
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.retraso)
+        if self.error is not None:
+            raise self.error
+        mensaje = SimpleNamespace(content=self.texto)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=mensaje, finish_reason="stop")],
+            usage=SimpleNamespace(total_tokens=self.total_tokens),
+        )
+
+    async def _stream(self):
+        for i, palabra in enumerate(self.texto.split(" ")):
+            await asyncio.sleep(self.retraso)
+            if self.error is not None:
+                raise self.error
+            delta = SimpleNamespace(content=palabra if i == 0 else " " + palabra)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(finish_reason=None, delta=delta)])
+        if self.con_uso:
+            yield SimpleNamespace(usage=SimpleNamespace(total_tokens=self.total_tokens), choices=[])
+
+
+@pytest.fixture
+def cliente_falso():
+    return ClienteFalso()
+
+
+@pytest.fixture
+def gateway(cliente_falso):
+    """Gateway sin caché, planificador ni métricas, conectado al cliente falso"""
+    from utils.llm import LLMGateway
+
+    gateway = LLMGateway()
+    gateway._client = cliente_falso
+    return gateway
@@ -0,0 +1,146 @@
+# tests/test_almacen_conocimiento.py
+
+import json
+
+import pytest
+
+from utils import almacen_conocimiento
+from utils.almacen_conocimiento import AlmacenConocimiento
+
+REGISTRO = {"content": "Sentencia SL-1 de 2020", "source": "CSJ", "added_date": "2024-01-01"}
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    ruta = tmp_path / "conocimiento.json"
+    ruta.write_text(json.dumps({"contrato_realidad": {"concepto": "Primacía de la realidad", "elementos": ["Subordinación"]}}))
+    return str(ruta)
+
+
+def test_crea_la_base_desde_el_json(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    assert almacen.datos == {"contrato_realidad": {"concepto": "Primacía de la realidad", "elementos": ["Subordinación"]}}
+    assert almacen.ruta_db.endswith("conocimiento.sqlite3")
+
+
+def test_agregar_persiste_y_sube_la_version(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    version, _ = almacen.instantanea()
+    almacen.agregar("jurisprudencia", "sentencias", REGISTRO)
+    assert almacen.version == version + 1
+    assert almacen.datos["jurisprudencia"]["sentencias"] == [REGISTRO]
+    assert AlmacenConocimiento(ruta).datos["jurisprudencia"]["sentencias"] == [REGISTRO]
+
+
+def test_la_vista_entregada_no_cambia_con_las_escrituras(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    _, antes = almacen.instantanea()
+    almacen.agregar("contrato_realidad", "elementos", "Continuidad")
+    assert antes["contrato_realidad"]["elementos"] == ["Subordinación"]
+    assert almacen.datos["contrato_realidad"]["elementos"] == ["Subordinación", "Continuidad"]
+
+
+def test_valor_suelto_pasa_a_lista(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    almacen.agregar("contrato_realidad", "concepto", "Artículo 23 CST")
+    esperado = ["Primacía de la realidad", "Artículo 23 CST"]
+    assert almacen.datos["contrato_realidad"]["concepto"] == esperado
+    assert AlmacenConocimiento(ruta).datos["contrato_realidad"]["concepto"] == esperado
+
+
+def test_escrituras_de_otro_proceso_se_leen_de_forma_incremental(ruta, monkeypatch):
+    almacen = AlmacenConocimiento(ruta)
+    almacen.instantanea()
+    recargas = []
+    recargar = almacen._recargar
+    monkeypatch.setattr(almacen, "_recargar", lambda *args: (recargas.append(args), recargar(*args)))
+
+    otro = AlmacenConocimiento(ruta)
+    otro.agregar_lote([("jurisprudencia", "sentencias", REGISTRO), ("contrato_realidad", "elementos", "Continuidad")])
+
+    assert almacen.datos == otro.datos
+    assert almacen.version == otro.version
+    assert recargas == []
+
+
+def test_reemplazo_de_otro_proceso_recarga_todo(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    almacen.instantanea()
+    AlmacenConocimiento(ruta).reemplazar({"normativa": {"leyes": ["Ley 50 de 1990"]}})
+    assert almacen.datos == {"normativa": {"leyes": ["Ley 50 de 1990"]}}
+    almacen.agregar("normativa", "leyes", "Ley 789 de 2002")
+    assert AlmacenConocimiento(ruta).datos == {"normativa": {"leyes": ["Ley 50 de 1990", "Ley 789 de 2002"]}}
+
+
+def test_derivado_se_calcula_una_vez_por_version(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    calculos = []
+
+    def contar(datos):
+        calculos.append(1)
+        return sum(len(v) if isinstance(v, list) else 1 for tipos in datos.values() for v in tipos.values())
+
+    assert almacen.derivado("conteo", contar) == 2
+    assert almacen.derivado("conteo", contar) == 2
+    almacen.agregar("contrato_realidad", "elementos", "Continuidad")
+    assert almacen.derivado("conteo", contar) == 3
+    assert len(calculos) == 2
+
+
+def test_derivado_con_actualizacion_incremental(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    calculos = []
+
+    def calcular(datos):
+        calculos.append(1)
+        return list(datos["contrato_realidad"]["elementos"])
+
+    def actualizar(valor, datos, categoria, tipo, entrada):
+        if (categoria, tipo) == ("contrato_realidad", "elementos"):
+            valor.append(entrada)
+
+    almacen.derivado("elementos", calcular, actualizar)
+    almacen.agregar("contrato_realidad", "elementos", "Continuidad")
+    AlmacenConocimiento(ruta).agregar("contrato_realidad", "elementos", "Remuneración")
+    version, valor = almacen.derivado("elementos", calcular, actualizar, con_version=True)
+    assert valor == ["Subordinación", "Continuidad", "Remuneración"]
+    assert version == almacen.version
+    assert len(calculos) == 1
+
+
+def test_derivado_aplaza_las_escrituras_de_otros_procesos(ruta, monkeypatch):
+    monkeypatch.setattr(almacen_conocimiento, "DERIVADOS_INTERVALO_S", 3600)
+    almacen = AlmacenConocimiento(ruta)
+    claves = sorted
+    assert almacen.derivado("claves", claves) == ["contrato_realidad"]
+
+    AlmacenConocimiento(ruta).agregar("normativa", "leyes", "Ley 50 de 1990")
+    assert almacen.derivado("claves", claves) == ["contrato_realidad"]
+    # Una escritura propia invalida el valor de inmediato
+    almacen.agregar("jurisprudencia", "sentencias", REGISTRO)
+    assert almacen.derivado("claves", claves) == ["contrato_realidad", "jurisprudencia", "normativa"]
+
+
+def test_buscar_texto_completo(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    almacen.agregar("jurisprudencia", "sentencias", REGISTRO)
+    resultados = almacen.buscar("primacia")
+    assert [r["contenido"] for r in resultados] == ["Primacía de la realidad"]
+    # Prefijos, sin acentos ni mayúsculas; las filas nuevas ya están indexadas
+    assert [r["fuente"] for r in almacen.buscar("sentenc SL")] == ["CSJ"]
+    assert almacen.buscar("   ") == []
+
+
+def test_buscar_tras_reemplazar(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    almacen.reemplazar({"normativa": {"leyes": ["Ley 50 de 1990"]}})
+    assert almacen.buscar("primacia") == []
+    assert [r["tipo"] for r in almacen.buscar("ley")] == ["leyes"]
+    almacen.agregar("normativa", "leyes", "Ley 789 de 2002")
+    assert len(almacen.buscar("ley")) == 2
+
+
+def test_base_sin_indice_de_texto_completo_se_indexa_al_abrir(ruta):
+    almacen = AlmacenConocimiento(ruta)
+    almacen._conn.execute("DROP TABLE documentos_fts")
+    assert [r["contenido"] for r in AlmacenConocimiento(ruta).buscar("realidad")] == ["Primacía de la realidad"]
@@ -0,0 +1,81 @@
+# tests/test_cache_llm.py
+
+import pytest
+
+from utils import cache_llm
+from utils.cache_llm import CacheCompletions, clave_completion
+
+
+def peticion(texto: str, **ajustes):
+    params = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": texto}], "temperature": 0.1, "max_tokens": 100}
+    params.update(ajustes)
+    return params
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj manual: cada entrada de la caché recibe una marca de tiempo distinta"""
+    ahora = [1000.0]
+    monkeypatch.setattr(cache_llm.time, "time", lambda: ahora[0])
+    return ahora
+
+
+def test_clave_depende_solo_de_los_campos_de_la_respuesta():
+    assert clave_completion(peticion("hola")) == clave_completion(peticion("hola", stream=True, user="x"))
+    assert clave_completion(peticion("hola")) != clave_completion(peticion("hola", temperature=0.2))
+    assert clave_completion(peticion("hola")) != clave_completion(peticion("adiós"))
+
+
+def test_guardar_y_obtener(tmp_path):
+    cache = CacheCompletions(ruta=str(tmp_path / "cache.sqlite3"))
+    assert cache.obtener(peticion("hola")) is None
+    cache.guardar(peticion("hola"), "respuesta")
+    assert cache.obtener(peticion("hola")) == "respuesta"
+    estadisticas = cache.estadisticas()
+    assert (estadisticas["aciertos"], estadisticas["fallos"], estadisticas["entradas"]) == (1, 1, 1)
+
+
+def test_no_guarda_respuestas_vacias(tmp_path):
+    cache = CacheCompletions(ruta=str(tmp_path / "cache.sqlite3"))
+    cache.guardar(peticion("hola"), "")
+    assert cache.estadisticas()["entradas"] == 0
+
+
+def test_desaloja_la_menos_usada_al_superar_max_entradas(tmp_path, reloj):
+    cache = CacheCompletions(ruta=str(tmp_path / "cache.sqlite3"), max_entradas=2)
+    cache.guardar(peticion("a"), "A")
+    reloj[0] += 1
+    cache.guardar(peticion("b"), "B")
+    reloj[0] += 1
+    # Leer "a" la vuelve la más reciente: la desalojada debe ser "b"
+    assert cache.obtener(peticion("a")) == "A"
+    reloj[0] += 1
+    cache.guardar(peticion("c"), "C")
+    assert cache.obtener(peticion("b")) is None
+    assert cache.obtener(peticion("a")) == "A"
+    assert cache.obtener(peticion("c")) == "C"
+    assert cache.estadisticas()["entradas"] == 2
+
+
+def test_desaloja_por_bytes(tmp_path, reloj):
+    cache = CacheCompletions(ruta=str(tmp_path / "cache.sqlite3"), max_bytes=25)
+    for texto in "abc":
+        reloj[0] += 1
+        cache.guardar(peticion(texto), texto * 10)
+    assert cache.obtener(peticion("a")) is None
+    assert cache.obtener(peticion("b")) == "b" * 10
+    assert cache.obtener(peticion("c")) == "c" * 10
+    assert cache.estadisticas()["bytes"] <= 25
+
+
+def test_expira_por_edad(tmp_path, reloj):
+    cache = CacheCompletions(ruta=str(tmp_path / "cache.sqlite3"), max_edad_s=60)
+    cache.guardar(peticion("hola"), "respuesta")
+    reloj[0] += 61
+    assert cache.obtener(peticion("hola")) is None
+
+
+def test_persiste_entre_instancias(tmp_path):
+    ruta = str(tmp_path / "cache.sqlite3")
+    CacheCompletions(ruta=ruta).guardar(peticion("hola"), "respuesta")
+    assert CacheCompletions(ruta=ruta).obtener(peticion("hola")) == "respuesta"
@@ -0,0 +1,57 @@
+# tests/test_embeddings.py
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from utils.embeddings import Embedder
+
+
+class EmbedderContador(Embedder):
+    """Backend de prueba: vector [longitud, 1] por texto; registra cada texto calculado"""
+
+    modelo = "contador"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calculados = []
+
+    async def _calcular_async(self, textos):
+        self.calculados.extend(textos)
+        return np.array([[len(t), 1.0] for t in textos], dtype=np.float32)
+
+
+def test_backend_sin_calculo_falla_al_crearse():
+    class Incompleto(Embedder):
+        pass
+
+    with pytest.raises(TypeError):
+        Incompleto()
+
+
+def test_cache_y_deduplicacion():
+    embedder = EmbedderContador()
+    vectores = asyncio.run(embedder.embeber_lotes_async(["a", "bb", "a"]))
+    assert vectores.shape == (3, 2)
+    assert vectores[0].tolist() == vectores[2].tolist() == [1.0, 1.0]
+    assert embedder.calculados == ["a", "bb"]
+    asyncio.run(embedder.embeber_async("bb"))
+    assert embedder.calculados == ["a", "bb"]
+
+
+def test_lru_desaloja_el_menos_usado():
+    embedder = EmbedderContador(cache_max_entradas=2)
+    asyncio.run(embedder.embeber_lotes_async(["a", "b"]))
+    asyncio.run(embedder.embeber_async("a"))
+    asyncio.run(embedder.embeber_async("c"))
+    asyncio.run(embedder.embeber_lotes_async(["a", "b"]))
+    assert embedder.calculados == ["a", "b", "c", "b"]
+
+
+def test_sin_cache_no_desplaza_las_consultas():
+    embedder = EmbedderContador(cache_max_entradas=2)
+    asyncio.run(embedder.embeber_async("consulta"))
+    asyncio.run(embedder.embeber_lotes_async(["x", "y", "z"], usar_cache=False))
+    asyncio.run(embedder.embeber_async("consulta"))
+    assert embedder.calculados == ["consulta", "x", "y", "z"]
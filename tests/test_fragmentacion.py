@@ -0,0 +1,90 @@
+# tests/test_fragmentacion.py
+
+from utils.fragmentacion import es_titulo, fragmentar_documento, fragmentar_texto
+from utils.planificador import estimar_tokens_texto
+
+
+def parrafos(n: int, palabras: int = 30) -> str:
+    return "\n".join(f"Párrafo {i}: " + " ".join(f"palabra{i}x{j}" for j in range(palabras)) + "." for i in range(n))
+
+
+def test_fragmentos_acotados_y_cortados_en_parrafos():
+    texto = parrafos(40)
+    cortes = fragmentar_texto(texto, max_tokens=200, solapamiento=0)
+    assert len(cortes) > 1
+    for inicio, fin in cortes:
+        assert estimar_tokens_texto(texto[inicio:fin]) <= 200
+        assert inicio == 0 or texto[inicio - 1] == "\n"
+        assert fin == len(texto) or texto[fin] == "\n"
+
+
+def test_sin_solapamiento_cubre_el_texto_sin_huecos():
+    texto = parrafos(40)
+    cortes = fragmentar_texto(texto, max_tokens=200, solapamiento=0)
+    assert cortes[0][0] == 0 and cortes[-1][1] == len(texto)
+    for (_, fin), (inicio, _) in zip(cortes, cortes[1:]):
+        assert texto[fin:inicio].strip() == ""
+
+
+def test_solapamiento_repite_el_final_del_fragmento_anterior():
+    # Párrafos de ~25 tokens: el solapamiento se mide en párrafos enteros
+    texto = parrafos(60, palabras=8)
+    cortes = fragmentar_texto(texto, max_tokens=200, solapamiento=60)
+    for (inicio_a, fin_a), (inicio_b, fin_b) in zip(cortes, cortes[1:]):
+        assert inicio_a < inicio_b < fin_a < fin_b
+        assert estimar_tokens_texto(texto[inicio_b:fin_a]) <= 60 + 1
+        assert inicio_b == 0 or texto[inicio_b - 1] == "\n"
+
+
+def test_parrafo_mayor_que_el_solapamiento_no_se_repite():
+    texto = parrafos(40)
+    cortes = fragmentar_texto(texto, max_tokens=200, solapamiento=10)
+    for (_, fin), (inicio, _) in zip(cortes, cortes[1:]):
+        assert inicio > fin
+
+
+def test_solapamiento_mayor_que_el_fragmento_siempre_avanza():
+    texto = parrafos(10)
+    cortes = fragmentar_texto(texto, max_tokens=100, solapamiento=1000)
+    assert [a for a, _ in cortes] == sorted(set(a for a, _ in cortes))
+    assert cortes[-1][1] == len(texto)
+
+
+def test_parrafo_gigante_se_divide_por_oraciones_y_caracteres():
+    oraciones = " ".join(f"Oración número {i} del considerando." for i in range(200))
+    sin_puntos = "x" * 5000
+    texto = oraciones + "\n" + sin_puntos
+    cortes = fragmentar_texto(texto, max_tokens=100, solapamiento=0)
+    assert all(estimar_tokens_texto(texto[a:b]) <= 101 for a, b in cortes)
+    assert "".join(texto[a:b] for a, b in cortes).replace("\n", "").replace(" ", "") == texto.replace("\n", "").replace(" ", "")
+
+
+def test_encabezado_abre_fragmento_nuevo():
+    texto = parrafos(6, palabras=20) + "\nCONSIDERACIONES DE LA SALA\n" + parrafos(6, palabras=20)
+    cortes = fragmentar_texto(texto, max_tokens=400, solapamiento=50)
+    inicios = [texto[a:b].splitlines()[0] for a, b in cortes]
+    assert "CONSIDERACIONES DE LA SALA" in inicios
+
+
+def test_es_titulo():
+    assert es_titulo("ARTÍCULO 23. Elementos esenciales")
+    assert es_titulo("II. ANTECEDENTES")
+    assert es_titulo("PRIMERO: Declarar")
+    assert not es_titulo("el trabajador cumplía horario")
+    assert not es_titulo("123 456")
+
+
+def test_fragmentar_documento_corto_conserva_el_id():
+    (fragmento,) = fragmentar_documento({"id": "c-614", "content": "Texto breve", "metadata": {"tipo": "sentencia"}})
+    assert fragmento["id"] == fragmento["fuente_id"] == "c-614"
+    assert (fragmento["inicio"], fragmento["fin"], fragmento["fragmentos_fuente"]) == (0, 11, 1)
+    assert fragmento["metadata"] == {"tipo": "sentencia"}
+
+
+def test_fragmentar_documento_largo_numera_y_apunta_al_original():
+    documento = {"id": "sl-1", "content": parrafos(40)}
+    fragmentos = fragmentar_documento(documento, max_tokens=200, solapamiento=30)
+    assert [f["id"] for f in fragmentos] == [f"sl-1#{n}" for n in range(len(fragmentos))]
+    for fragmento in fragmentos:
+        assert documento["content"][fragmento["inicio"]:fragmento["fin"]] == fragmento["content"]
+        assert fragmento["fragmentos_fuente"] == len(fragmentos)
@@ -0,0 +1,35 @@
+# tests/test_fusion.py
+
+import pytest
+
+from utils.fusion import fusion_rrf
+
+
+def test_suma_el_reciproco_de_la_posicion_en_cada_ranking():
+    fusion = dict(fusion_rrf([["a", "b"], ["b", "c"]], k=60))
+    assert fusion["a"] == pytest.approx(1 / 61)
+    assert fusion["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fusion["c"] == pytest.approx(1 / 62)
+
+
+def test_premia_lo_que_aparece_en_varios_rankings():
+    orden = [elemento for elemento, _ in fusion_rrf([["a", "b", "c"], ["c", "d", "b"], ["b", "e"]])]
+    assert orden[0] == "b"
+    assert orden.index("c") < orden.index("a")
+
+
+def test_empates_conservan_el_orden_de_aparicion():
+    # a y x ocupan el primer puesto de un ranking cada uno: mismo puntaje
+    assert [e for e, _ in fusion_rrf([["a", "b"], ["x", "y"]])] == ["a", "x", "b", "y"]
+
+
+def test_k_menor_da_mas_peso_a_los_primeros_puestos():
+    # b es tercero en dos rankings; a y c, primeros en uno cada uno
+    rankings = [["a", "x", "b"], ["c", "y", "b"]]
+    assert fusion_rrf(rankings, k=60)[0][0] == "b"
+    assert fusion_rrf(rankings, k=0)[0][0] == "a"
+
+
+def test_rankings_vacios():
+    assert fusion_rrf([]) == []
+    assert fusion_rrf([[], ["a"]]) == [("a", pytest.approx(1 / 61))]
@@ -0,0 +1,53 @@
+# tests/test_indice_lexico.py
+
+from utils.indice_lexico import IndiceBM25, plegar_acentos, terminos
+
+
+def test_analisis_pliega_acentos_y_descarta_stopwords():
+    assert plegar_acentos("Artículo SUBORDINACIÓN") == "articulo subordinacion"
+    assert terminos("el artículo") == terminos("Articulo")
+    assert "c-614" in terminos("Sentencia C-614 de 2009")
+
+
+def test_ordena_por_relevancia():
+    indice = IndiceBM25(
+        ["a", "b", "c"],
+        ["subordinación y horario fijo", "subordinación subordinación subordinación", "prestación de servicios"],
+    )
+    resultados = indice.buscar("subordinacion", 10)
+    assert [doc_id for doc_id, _ in resultados] == ["b", "a"]
+    assert resultados[0][1] > resultados[1][1] > 0
+    assert indice.buscar("inexistente", 10) == []
+
+
+def test_paginas_recorren_el_ranking_sin_repetir_ni_saltar():
+    # Muchos empates: todos los documentos tienen el mismo texto salvo algunos
+    textos = ["contrato realidad"] * 40 + ["contrato realidad contrato"] * 7 + ["otro tema"] * 5
+    indice = IndiceBM25([f"d{i}" for i in range(len(textos))], textos)
+    total, completo = indice.buscar_pagina("contrato", 0, 100)
+    assert total == 47
+
+    paginado = []
+    for desde in range(0, total, 10):
+        total_pagina, pagina = indice.buscar_pagina("contrato", desde, 10)
+        assert total_pagina == total
+        paginado += pagina
+    assert paginado == completo
+    assert len({doc_id for doc_id, _ in paginado}) == 47
+
+
+def test_pagina_fuera_de_rango_y_solo_conteo():
+    indice = IndiceBM25(["a", "b"], ["despido sin justa causa", "indemnización por despido"])
+    assert indice.buscar_pagina("despido", 0, 0) == (2, [])
+    assert indice.buscar_pagina("despido", 5, 10) == (2, [])
+
+
+def test_agregar_incremental_equivale_a_construir_de_cero():
+    textos = ["primacía de la realidad", "horario fijo y subordinación", "subordinación continuada", "pago mensual"]
+    ids = [f"d{i}" for i in range(len(textos))]
+    incremental = IndiceBM25(ids[:2], textos[:2])
+    incremental.buscar("subordinacion", 5)  # pesos guardados con las estadísticas anteriores
+    incremental.agregar(ids[2:], textos[2:])
+    desde_cero = IndiceBM25(ids, textos)
+    assert len(incremental) == 4
+    assert incremental.buscar("subordinacion realidad", 5) == desde_cero.buscar("subordinacion realidad", 5)
@@ -0,0 +1,346 @@
+# tests/test_indice_vectorial.py
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from utils import vector_rag
+from utils.almacen_conocimiento import AlmacenConocimiento
+from utils.indice_ivf import IndiceIVF
+from utils.indice_vectorial import IndiceVectorial, hash_contenido, normalizar, top_k
+from utils.vector_rag import VectorLegalRAG
+
+
+def vectores_agrupados(n: int, dimension: int = 32, grupos: int = 20, semilla: int = 0) -> np.ndarray:
+    """Corpus sintético con estructura de grupos, como los embeddings reales"""
+    rng = np.random.default_rng(semilla)
+    centros = rng.normal(size=(grupos, dimension))
+    return normalizar(centros[rng.integers(grupos, size=n)] + 0.3 * rng.normal(size=(n, dimension)))
+
+
+def top_k_bucle(matriz: np.ndarray, consulta: np.ndarray, k: int):
+    """Referencia: el bucle por documento que reemplazó top_k"""
+    puntajes = [(i, float(np.dot(fila, consulta))) for i, fila in enumerate(matriz)]
+    return sorted(puntajes, key=lambda x: -x[1])[:k]
+
+
+def test_top_k_coincide_con_el_bucle_por_documento():
+    matriz = vectores_agrupados(500)
+    consultas = vectores_agrupados(8, semilla=1)
+    indices, puntajes = top_k(matriz, consultas, 10)
+    assert indices.shape == puntajes.shape == (8, 10)
+    for fila, consulta in enumerate(consultas):
+        esperado = top_k_bucle(matriz, consulta, 10)
+        assert list(indices[fila]) == [i for i, _ in esperado]
+        assert puntajes[fila] == pytest.approx([p for _, p in esperado], abs=1e-5)
+
+
+def test_top_k_ordena_de_mayor_a_menor():
+    _, puntajes = top_k(vectores_agrupados(300), vectores_agrupados(4, semilla=2), 25)
+    assert (np.diff(puntajes, axis=1) <= 0).all()
+
+
+def test_top_k_con_k_mayor_que_el_corpus_o_nulo():
+    matriz = vectores_agrupados(5)
+    indices, _ = top_k(matriz, matriz[:2], 50)
+    assert indices.shape == (2, 5)
+    assert list(indices[:, 0]) == [0, 1]
+    indices, puntajes = top_k(matriz, matriz[:2], 0)
+    assert indices.shape == puntajes.shape == (2, 0)
+
+
+def recall(aproximados: np.ndarray, exactos: np.ndarray) -> float:
+    return np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(aproximados, exactos)])
+
+
+def test_ivf_con_todas_las_listas_es_exacto():
+    matriz = vectores_agrupados(2000)
+    consultas = vectores_agrupados(20, semilla=3)
+    ivf = IndiceIVF.entrenar(matriz, n_listas=16)
+    exactos, _ = top_k(matriz, consultas, 10)
+    aproximados, _ = ivf.buscar(matriz, consultas, 10, nprobe=16)
+    assert recall(aproximados, exactos) == 1.0
+
+
+def test_ivf_recall_con_pocas_listas():
+    matriz = vectores_agrupados(5000)
+    consultas = vectores_agrupados(50, semilla=4)
+    ivf = IndiceIVF.entrenar(matriz, n_listas=32)
+    exactos, _ = top_k(matriz, consultas, 10)
+    aproximados, _ = ivf.buscar(matriz, consultas, 10, nprobe=8)
+    assert recall(aproximados, exactos) >= 0.9
+
+
+def test_ivf_reasignar_conserva_listas_y_ubica_los_nuevos():
+    matriz = vectores_agrupados(1000)
+    ivf = IndiceIVF.entrenar(matriz, n_listas=8)
+    nueva = np.concatenate([matriz[::-1], vectores_agrupados(10, semilla=5)])
+    origen = np.concatenate([np.arange(999, -1, -1), np.full(10, -1)])
+    reasignado = ivf.reasignar(nueva, origen)
+    assert list(reasignado.asignacion[:1000]) == list(ivf.asignacion[::-1])
+    # Los nuevos se encuentran a sí mismos revisando todas las listas
+    indices, _ = reasignado.buscar(nueva, nueva[1000:], 1, nprobe=8)
+    assert list(indices[:, 0]) == list(range(1000, 1010))
+
+
+class EmbedderFalso:
+    """Corrutina de embeddings determinista que registra los textos que se le piden"""
+
+    def __init__(self, dimension: int = 16):
+        self.dimension = dimension
+        self.textos = []
+
+    async def __call__(self, textos):
+        self.textos.extend(textos)
+        return [np.random.default_rng(int(hash_contenido(t)[:8], 16)).normal(size=self.dimension) for t in textos]
+
+
+def corpus(*contenidos):
+    return [{"id": f"doc{i}", "content": c} for i, c in enumerate(contenidos)]
+
+
+def preparar(indice, documentos, embeber, version=None, modelo="falso"):
+    return asyncio.run(indice.preparar_async(documentos, modelo, embeber, version))
+
+
+def test_preparar_solo_embebe_documentos_nuevos_o_modificados(tmp_path):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    preparar(indice, corpus("a", "b", "c"), embeber)
+    assert embeber.textos == ["a", "b", "c"]
+
+    instantanea = preparar(indice, corpus("a", "B", "c", "d"), embeber)
+    assert embeber.textos[3:] == ["B", "d"]
+    assert instantanea.construccion["reutilizados"] == 2
+    assert instantanea.ids == ["doc0", "doc1", "doc2", "doc3"]
+
+
+def test_corpus_sin_cambios_no_reconstruye(tmp_path):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    documentos = corpus("a", "b")
+    primera = preparar(indice, documentos, embeber)
+    assert preparar(indice, documentos, embeber) is primera
+    # Otro proceso (índice nuevo) carga la construcción del disco sin embeber
+    otro = EmbedderFalso()
+    cargada = preparar(IndiceVectorial("corpus", directorio=str(tmp_path)), corpus("a", "b"), otro)
+    assert otro.textos == []
+    assert cargada.ids == primera.ids
+
+
+def test_cambio_de_modelo_reembebe_todo(tmp_path):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    preparar(indice, corpus("a", "b"), embeber)
+    preparar(indice, corpus("a", "b"), embeber, modelo="otro")
+    assert embeber.textos == ["a", "b", "a", "b"]
+
+
+def test_instantanea_anterior_sigue_resolviendo_sus_documentos(tmp_path):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    vieja = preparar(indice, corpus("a", "b", "c"), embeber, version=1)
+    nueva = preparar(indice, corpus("x"), embeber, version=2)
+
+    consulta = np.asarray(asyncio.run(embeber(["c"]))[0])
+    (resultado,) = vieja.buscar(consulta, 1)
+    assert resultado[0][0] == "doc2"
+    assert vieja.documento("doc2")["content"] == "c"
+    assert nueva.documento("doc2") is None
+    assert [i for i, _ in indice.buscar(consulta, 3)[0]] == ["doc0"]
+
+
+def test_version_anterior_no_retrocede_el_indice(tmp_path):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    nueva = preparar(indice, corpus("a", "b"), embeber, version=5)
+    assert preparar(indice, corpus("a"), embeber, version=4) is nueva
+    assert embeber.textos == ["a", "b"]
+
+
+def test_corpus_que_crece_al_final_anexa_filas(tmp_path):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    preparar(indice, corpus("a", "b"), embeber)
+    with open(indice.ruta_vectores, "rb") as f:
+        previo = f.read()
+    inodo = os.stat(indice.ruta_vectores).st_ino
+
+    preparar(indice, corpus("a", "b", "c"), embeber)
+    assert os.stat(indice.ruta_vectores).st_ino == inodo
+    with open(indice.ruta_vectores, "rb") as f:
+        actual = f.read()
+    assert actual[:len(previo)] == previo and len(actual) == len(previo) * 3 // 2
+
+    cargada = IndiceVectorial("corpus", directorio=str(tmp_path)).cargar()
+    assert cargada.ids == ["doc0", "doc1", "doc2"]
+    assert np.allclose(cargada.vectores, indice.actual.vectores)
+
+
+def test_corpus_modificado_reescribe_la_matriz(tmp_path):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    preparar(indice, corpus("a", "b", "c"), embeber)
+    # Filas de una escritura interrumpida: se ignoran al cargar
+    with open(indice.ruta_vectores, "ab") as f:
+        f.write(b"\0" * 64)
+    assert IndiceVectorial("corpus", directorio=str(tmp_path)).cargar().vectores.shape == (3, 16)
+
+    preparar(indice, corpus("a", "X", "c"), embeber)
+    assert os.path.getsize(indice.ruta_vectores) == 3 * 16 * 4
+    cargada = IndiceVectorial("corpus", directorio=str(tmp_path)).cargar()
+    assert cargada.hashes[1] == hash_contenido("X")
+    assert np.allclose(cargada.vectores, indice.actual.vectores)
+
+
+def test_lee_el_formato_npy_anterior(tmp_path):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    vectores = normalizar(np.eye(2, 16))
+    os.makedirs(indice.directorio)
+    np.save(os.path.join(indice.directorio, "vectores.npy"), vectores)
+    with open(indice.ruta_manifiesto, "w", encoding="utf-8") as f:
+        json.dump({"modelo": "falso", "normalizado": True, "documentos": [
+            {"id": doc["id"], "hash": hash_contenido(doc["content"])} for doc in corpus("a", "b")
+        ]}, f)
+    embeber = EmbedderFalso()
+    preparar(indice, corpus("a", "b", "c"), embeber)
+    assert embeber.textos == ["c"]
+    assert not os.path.exists(os.path.join(indice.directorio, "vectores.npy"))
+    assert np.allclose(indice.cargar().vectores[:2], vectores)
+
+
+def test_cada_construccion_escribe_archivos_propios_y_borra_los_anteriores(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.indice_vectorial.MODO_ANN", "ivf")
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    vieja = preparar(indice, corpus("a", "b", "c"), embeber)
+    archivos_viejos = set(os.listdir(indice.directorio))
+    nueva = preparar(indice, corpus("x", "y"), embeber)
+
+    with open(indice.ruta_manifiesto, encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    nombrados = set(manifiesto["archivos"].values())
+    assert {nombre for nombre in os.listdir(indice.directorio) if not nombre.startswith(".")} == nombrados | {"manifiesto.json"}
+    assert not nombrados & archivos_viejos
+    # La instantánea anterior sigue leyendo su matriz (memory-map del archivo ya borrado)
+    assert np.allclose(vieja.vectores[2], normalizar(asyncio.run(embeber(["c"]))[0]))
+    assert IndiceVectorial("corpus", directorio=str(tmp_path)).cargar().ids == nueva.ids
+
+
+def test_cargar_relee_el_manifiesto_si_sus_archivos_ya_no_estan(tmp_path, monkeypatch):
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    preparar(indice, corpus("a"), embeber)
+    viejo = indice._leer_manifiesto()
+    preparar(indice, corpus("x", "y"), embeber)
+
+    lector = IndiceVectorial("corpus", directorio=str(tmp_path))
+    leer = lector._leer_manifiesto
+    manifiestos = iter([viejo])
+    monkeypatch.setattr(lector, "_leer_manifiesto", lambda: next(manifiestos, None) or leer())
+    assert lector.cargar().ids == ["doc0", "doc1"]
+
+
+def test_con_la_construccion_reservada_por_otro_proceso_no_embebe(tmp_path):
+    servidor = IndiceVectorial("corpus", directorio=str(tmp_path))
+    embeber = EmbedderFalso()
+    previa = preparar(servidor, corpus("a", "b"), embeber)
+    # Otra instancia del índice hace de otro proceso (los candados de archivo no se comparten)
+    ingesta = IndiceVectorial("corpus", directorio=str(tmp_path))
+    with ingesta.reservar():
+        assert preparar(servidor, corpus("a", "b", "c"), embeber) is previa
+        # Un proceso recién iniciado sirve la construcción del disco con el corpus actual
+        nuevo = preparar(IndiceVectorial("corpus", directorio=str(tmp_path)), corpus("a", "b", "c"), embeber)
+        assert nuevo.ids == ["doc0", "doc1"] and nuevo.documento("doc1")["content"] == "b"
+        assert embeber.textos == ["a", "b"]
+        # El proceso que reservó sí construye
+        preparar(ingesta, corpus("a", "b", "c"), embeber)
+        assert embeber.textos == ["a", "b", "c"]
+    # Terminada la reserva, el servidor adopta lo construido sin embeber
+    assert preparar(servidor, corpus("a", "b", "c"), embeber).ids == ["doc0", "doc1", "doc2"]
+    assert embeber.textos == ["a", "b", "c"]
+
+
+def test_dos_procesos_no_embeben_el_mismo_corpus(tmp_path):
+    class EmbedderLento(EmbedderFalso):
+        async def __call__(self, textos):
+            await asyncio.sleep(0.2)
+            return await super().__call__(textos)
+
+    embeber = EmbedderLento()
+    resultados = []
+
+    def construir():
+        resultados.append(preparar(IndiceVectorial("corpus", directorio=str(tmp_path)), corpus("a", "b", "c"), embeber))
+
+    hilos = [threading.Thread(target=construir) for _ in range(2)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(embeber.textos) == ["a", "b", "c"]
+    assert [r.ids for r in resultados] == [["doc0", "doc1", "doc2"]] * 2
+    assert time.perf_counter() - inicio < 2
+
+
+@pytest.fixture
+def conocimiento(tmp_path):
+    ruta = tmp_path / "conocimiento.json"
+    ruta.write_text(json.dumps({"contrato_realidad": {"concepto": "Primacía de la realidad", "elementos": ["Subordinación"]}}))
+    return str(ruta)
+
+
+def test_corpus_legal_indexa_solo_las_entradas_agregadas(conocimiento, monkeypatch):
+    construcciones = []
+    construir = vector_rag._construir_corpus
+    monkeypatch.setattr(vector_rag, "_construir_corpus", lambda datos: construcciones.append(1) or construir(datos))
+    _version, corpus_legal = vector_rag._corpus_legal(conocimiento)
+    documentos = corpus_legal["documentos"]
+
+    vector_rag.obtener_almacen(conocimiento).agregar(
+        "jurisprudencia", "sentencias", {"content": "Sentencia SL-4479 de 2021 sobre contrato realidad", "source": "CSJ"}
+    )
+    # Escritura de otro proceso: llega por la sincronización incremental del almacén
+    AlmacenConocimiento(conocimiento).agregar("contrato_realidad", "elementos", "Continuidad")
+    version, actualizado = vector_rag._corpus_legal(conocimiento)
+    assert version == vector_rag.obtener_almacen(conocimiento).version
+    assert construcciones == [1]
+    assert actualizado["documentos"] is not documentos
+    assert [doc["id"] for doc in actualizado["documentos"][len(documentos):]] == [
+        "jurisprudencia/sentencias/0", "contrato_realidad/elementos/1"
+    ]
+    assert actualizado["por_id"]["jurisprudencia/sentencias/0"]["metadata"]["fuente"] == "CSJ"
+    assert actualizado["lexico"].buscar("SL-4479", 1)[0][0] == "jurisprudencia/sentencias/0"
+    # Mismos fragmentos que una reconstrucción completa (las entradas nuevas van al final)
+    assert sorted(doc["hash"] for doc in actualizado["documentos"]) == sorted(
+        doc["hash"] for doc in vector_rag._fragmentos(vector_rag.DOCUMENTOS_BASE + vector_rag.documentos_de_conocimiento(
+            vector_rag.obtener_almacen(conocimiento).datos
+        ))
+    )
+
+
+def test_corpus_legal_se_reconstruye_si_un_valor_suelto_pasa_a_lista(conocimiento):
+    vector_rag._corpus_legal(conocimiento)
+    vector_rag.obtener_almacen(conocimiento).agregar("contrato_realidad", "concepto", "Otra definición")
+    _version, corpus_legal = vector_rag._corpus_legal(conocimiento)
+    ids = set(corpus_legal["por_id"])
+    assert {"contrato_realidad/concepto/0", "contrato_realidad/concepto/1"} <= ids
+    assert "contrato_realidad/concepto" not in ids
+
+
+def test_agrupar_por_fuente_descarta_ids_desconocidos():
+    fragmentos = {
+        "f1#0": {"id": "f1#0", "fuente_id": "f1"},
+        "f1#1": {"id": "f1#1", "fuente_id": "f1"},
+        "f2#0": {"id": "f2#0", "fuente_id": "f2"},
+    }
+    resultados = [("f1#1", 0.9), ("borrado#0", 0.8), ("f1#0", 0.7), ("f2#0", 0.6)]
+    agrupados = VectorLegalRAG._agrupar_por_fuente(resultados, 5, fragmentos.get)
+    assert [(f["id"], p) for f, p in agrupados] == [("f1#1", 0.9), ("f2#0", 0.6)]
+    assert len(VectorLegalRAG._agrupar_por_fuente(resultados, 1, fragmentos.get)) == 1
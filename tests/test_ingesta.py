@@ -0,0 +1,109 @@
+# tests/test_ingesta.py
+
+import json
+import os
+
+import pytest
+
+from utils import ingesta
+from utils.almacen_conocimiento import obtener_almacen
+from utils.ingesta import directorio_permitido, huella_texto, ingerir_directorio
+
+
+@pytest.fixture
+def conocimiento(tmp_path):
+    ruta = tmp_path / "conocimiento.json"
+    ruta.write_text(json.dumps({"jurisprudencia": {"sentencias": [{"content": "Sentencia ya cargada", "source": "manual"}]}}))
+    return str(ruta)
+
+
+@pytest.fixture
+def sentencias(tmp_path):
+    directorio = tmp_path / "sentencias"
+    (directorio / "2020").mkdir(parents=True)
+    (directorio / "a.txt").write_text("Sentencia SL-1 de 2020:\nprimacía de la realidad")
+    # Mismo texto salvo espacios y saltos de línea
+    (directorio / "2020" / "b.txt").write_text("Sentencia SL-1   de 2020: primacía de la realidad\n")
+    (directorio / "c.jsonl").write_text("\n".join(json.dumps(linea) for linea in [
+        {"texto": "Sentencia ya cargada"},
+        {"content": "Sentencia T-2 de 2021", "fuente": "Corte Constitucional", "tipo": "tutelas"},
+    ]))
+    (directorio / "notas.md").write_text("no se ingiere")
+    return str(directorio)
+
+
+def ingerir(directorio, conocimiento, **opciones):
+    return ingerir_directorio(directorio, knowledge_file=conocimiento, trabajadores=1, actualizar_indice=False, **opciones)
+
+
+def test_descarta_duplicados_dentro_del_lote_y_de_la_base(sentencias, conocimiento):
+    estado = ingerir(sentencias, conocimiento)
+    assert estado.fase == "completada"
+    assert (estado.archivos_total, estado.documentos_agregados, estado.duplicados) == (3, 2, 2)
+    datos = obtener_almacen(conocimiento).datos["jurisprudencia"]
+    # De los dos archivos con el mismo texto se conserva el primero que termina de extraerse
+    assert [huella_texto(e["content"]) for e in datos["sentencias"]] == [
+        huella_texto("Sentencia ya cargada"), huella_texto("Sentencia SL-1 de 2020: primacía de la realidad")
+    ]
+    assert datos["tutelas"][0]["source"] == "Corte Constitucional"
+
+
+def test_reanudar_salta_los_archivos_confirmados(sentencias, conocimiento):
+    ingerir(sentencias, conocimiento)
+    version = obtener_almacen(conocimiento).version
+
+    estado = ingerir(sentencias, conocimiento)
+    assert (estado.archivos_omitidos, estado.archivos_procesados, estado.documentos_agregados) == (3, 0, 0)
+    assert obtener_almacen(conocimiento).version == version
+
+    # Un archivo modificado se procesa de nuevo
+    with open(os.path.join(sentencias, "a.txt"), "a", encoding="utf-8") as f:
+        f.write("\nSalvamento de voto")
+    estado = ingerir(sentencias, conocimiento)
+    assert (estado.archivos_omitidos, estado.archivos_procesados, estado.documentos_agregados) == (2, 1, 1)
+
+
+def test_sin_reanudar_reprocesa_pero_no_duplica(sentencias, conocimiento):
+    ingerir(sentencias, conocimiento)
+    estado = ingerir(sentencias, conocimiento, reanudar=False)
+    assert (estado.archivos_procesados, estado.documentos_agregados, estado.duplicados) == (3, 0, 4)
+
+
+def test_reserva_el_indice_semantico_mientras_corre(sentencias, conocimiento, tmp_path, monkeypatch):
+    from utils import vector_rag
+    from utils.indice_vectorial import IndiceVectorial
+
+    indice = IndiceVectorial("corpus", directorio=str(tmp_path / "indices"))
+    otro_proceso = IndiceVectorial("corpus", directorio=str(tmp_path / "indices"))
+    reservado = []
+    monkeypatch.setattr(vector_rag, "reservar_indice_legal", indice.reservar)
+    monkeypatch.setattr(vector_rag, "actualizar_indice_legal", lambda: reservado.append(otro_proceso._reservado_por_otro()))
+
+    estado = ingerir_directorio(sentencias, knowledge_file=conocimiento, trabajadores=1)
+    assert estado.fase == "completada"
+    assert reservado == [True]
+    assert not otro_proceso._reservado_por_otro()
+
+
+def test_archivo_sin_texto_se_reporta(tmp_path, conocimiento):
+    directorio = tmp_path / "vacios"
+    directorio.mkdir()
+    (directorio / "vacio.txt").write_text("   \n")
+    estado = ingerir(str(directorio), conocimiento)
+    assert estado.documentos_agregados == 0
+    assert [ruta for ruta, _ in estado.errores] == [str(directorio / "vacio.txt")]
+
+
+def test_directorio_permitido_solo_dentro_de_la_raiz(tmp_path, monkeypatch):
+    raiz = tmp_path / "raiz"
+    (raiz / "corte").mkdir(parents=True)
+    (tmp_path / "fuera").mkdir()
+    os.symlink(tmp_path / "fuera", raiz / "enlace")
+    monkeypatch.setattr(ingesta, "RAIZ_INGESTA", str(raiz))
+
+    assert directorio_permitido("corte") == os.path.realpath(raiz / "corte")
+    assert directorio_permitido(str(raiz / "corte")) == os.path.realpath(raiz / "corte")
+    assert directorio_permitido("../fuera") is None
+    assert directorio_permitido(str(tmp_path / "fuera")) is None
+    assert directorio_permitido("enlace") is None
+    assert directorio_permitido("no_existe") is None
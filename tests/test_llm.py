@@ -0,0 +1,130 @@
+# tests/test_llm.py
+
+import asyncio
+import threading
+
+import pytest
+
+from utils import llm
+from utils.planificador import estimar_tokens, estimar_tokens_texto
+
+MENSAJES = [{"role": "user", "content": "Redacta los hechos"}]
+
+
+async def completar_varias(gateway, n: int, mensajes=MENSAJES):
+    return await asyncio.gather(
+        *(gateway.completar_async("resumen", mensajes) for _ in range(n)), return_exceptions=True
+    )
+
+
+def test_llamadas_identicas_simultaneas_comparten_una_sola_peticion(gateway, cliente_falso):
+    cliente_falso.retraso = 0.2
+    assert asyncio.run(completar_varias(gateway, 8)) == ["Hola mundo"] * 8
+    assert len(cliente_falso.llamadas) == 1
+    assert gateway._vuelos == {}
+
+
+def test_llamadas_distintas_no_se_unen(gateway, cliente_falso):
+    cliente_falso.retraso = 0.1
+
+    async def distintas():
+        return await asyncio.gather(
+            gateway.completar_async("resumen", MENSAJES),
+            gateway.completar_async("resumen", [{"role": "user", "content": "Otra consulta"}]),
+            gateway.completar_async("resumen", MENSAJES, temperature=0.9),
+        )
+
+    asyncio.run(distintas())
+    assert len(cliente_falso.llamadas) == 3
+
+
+def test_streams_simultaneos_reciben_el_texto_completo(gateway, cliente_falso):
+    cliente_falso.retraso = 0.05
+    resultados = []
+
+    def consumir():
+        resultados.append("".join(gateway.completar_stream("resumen", MENSAJES)))
+
+    hilos = [threading.Thread(target=consumir) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert resultados == ["Hola mundo"] * 4
+    assert len(cliente_falso.llamadas) == 1
+
+
+def test_un_error_llega_a_todos_los_que_esperan(gateway, cliente_falso):
+    cliente_falso.retraso = 0.1
+    cliente_falso.error = RuntimeError("servicio caído")
+    resultados = asyncio.run(completar_varias(gateway, 5))
+    assert len(cliente_falso.llamadas) == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "servicio caído" for r in resultados)
+
+    # El vuelo fallido no queda registrado: la siguiente llamada vuelve a la API
+    cliente_falso.error = None
+    assert gateway.completar("resumen", MENSAJES) == "Hola mundo"
+    assert len(cliente_falso.llamadas) == 2
+
+
+def test_stream_abandonado_sigue_durante_la_gracia(gateway, cliente_falso, monkeypatch):
+    monkeypatch.setattr(llm, "GRACIA_VUELO_S", 5)
+    cliente_falso.texto = "uno dos tres cuatro"
+    cliente_falso.retraso = 0.05
+
+    stream = gateway.completar_stream("resumen", MENSAJES)
+    assert next(stream) == "uno"
+    stream.close()
+    # Quien vuelve dentro de la gracia se une al mismo vuelo y lo recibe desde el principio
+    assert "".join(gateway.completar_stream("resumen", MENSAJES)) == "uno dos tres cuatro"
+    assert len(cliente_falso.llamadas) == 1
+
+
+def test_stream_abandonado_se_cancela_tras_la_gracia(gateway, cliente_falso, monkeypatch):
+    monkeypatch.setattr(llm, "GRACIA_VUELO_S", 0.05)
+    cliente_falso.texto = " ".join(["palabra"] * 50)
+    cliente_falso.retraso = 0.02
+
+    stream = gateway.completar_stream("resumen", MENSAJES)
+    next(stream)
+    stream.close()
+    llm._bucle.ejecutar(asyncio.sleep(0.3))
+    assert gateway._vuelos == {}
+    # Cancelado antes de terminar: la nueva llamada empieza otra petición
+    assert "".join(gateway.completar_stream("resumen", MENSAJES)) == cliente_falso.texto
+    assert len(cliente_falso.llamadas) == 2
+
+
+class EjecutorRegistro:
+    """Ejecutor que solo registra lo que el gateway le informa al terminar cada stream"""
+
+    def __init__(self):
+        self.reconciliados = []
+
+    async def __call__(self, fn, params):
+        return await fn()
+
+    def reconciliar(self, params, tokens_usados):
+        self.reconciliados.append(tokens_usados)
+
+
+def test_reconcilia_el_uso_real_del_stream(gateway):
+    gateway.ejecutor = EjecutorRegistro()
+    "".join(gateway.completar_stream("resumen", MENSAJES))
+    assert gateway.ejecutor.reconciliados == [120]
+
+
+def test_sin_fragmento_de_uso_reconcilia_una_estimacion(gateway, cliente_falso):
+    gateway.ejecutor = EjecutorRegistro()
+    cliente_falso.con_uso = False
+    "".join(gateway.completar_stream("resumen", MENSAJES))
+    esperado = estimar_tokens({"messages": MENSAJES}) + estimar_tokens_texto("Hola mundo")
+    assert gateway.ejecutor.reconciliados == [esperado]
+
+
+def test_stream_fallido_tambien_reconcilia(gateway, cliente_falso):
+    gateway.ejecutor = EjecutorRegistro()
+    cliente_falso.error = RuntimeError("corte")
+    with pytest.raises(RuntimeError):
+        "".join(gateway.completar_stream("resumen", MENSAJES))
+    assert gateway.ejecutor.reconciliados == [estimar_tokens({"messages": MENSAJES}) + estimar_tokens_texto("")]
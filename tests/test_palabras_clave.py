@@ -0,0 +1,130 @@
+# tests/test_palabras_clave.py
+
+import itertools
+import os
+import re
+from pathlib import Path
+
+import pytest
+
+from utils.palabras_clave import ReglasPalabrasClave, cargar_reglas, patron_trie
+from utils.rag import LegalRAG
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+BASE = {
+    "contrato_realidad": {
+        "concepto": "Concepto del contrato realidad",
+        "elementos": ["Subordinación", "Prestación personal", "Continuidad", "Remuneración", "Sin contrato formal"],
+        "jurisprudencia": ["C-614 de 2009", "T-1234 de 2018", "C-789 de 2020"],
+        "normativa": ["Artículo 23 CST", "Artículo 24 CST", "Artículo 25 CST"],
+    },
+    "derecho_laboral_colombiano": {"principios": ["Protección al trabajador", "Primacía de la realidad"]},
+    "demanda_laboral": {"requisitos": ["Competencia", "Partes", "Hechos", "Pretensiones"]},
+}
+
+
+def recuperar_original(base, query):
+    """retrieve_relevant_info antes de las reglas en reglas_rag.json (subcadenas sobre la consulta)"""
+    docs = []
+    query_lower = query.lower()
+    if any(k in query_lower for k in ["contrato realidad", "relación laboral", "subordinación"]):
+        docs.append({"tipo": "concepto", "contenido": base["contrato_realidad"]["concepto"], "fuente": "Doctrina legal"})
+        for elemento in base["contrato_realidad"]["elementos"]:
+            docs.append({"tipo": "elemento", "contenido": f"Elemento: {elemento}", "fuente": "Código Sustantivo del Trabajo"})
+    if any(k in query_lower for k in ["jurisprudencia", "sentencia", "corte"]):
+        for sentencia in base["contrato_realidad"]["jurisprudencia"]:
+            docs.append({"tipo": "jurisprudencia", "contenido": f"Jurisprudencia: {sentencia}", "fuente": "Corte Constitucional"})
+    if any(k in query_lower for k in ["norma", "artículo", "código", "ley"]):
+        for norma in base["contrato_realidad"]["normativa"]:
+            docs.append({"tipo": "normativa", "contenido": f"Normativa: {norma}", "fuente": "Código Sustantivo del Trabajo"})
+    if any(k in query_lower for k in ["principio", "derecho", "protección"]):
+        for principio in base["derecho_laboral_colombiano"]["principios"]:
+            docs.append({"tipo": "principio", "contenido": f"Principio: {principio}", "fuente": "Derecho Laboral Colombiano"})
+    if any(k in query_lower for k in ["demanda", "requisito", "proceso"]):
+        for requisito in base["demanda_laboral"]["requisitos"]:
+            docs.append({"tipo": "requisito", "contenido": f"Requisito: {requisito}", "fuente": "Código de Procedimiento Laboral"})
+    return docs[:5]
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    """LegalRAG con una base de conocimiento fija y las reglas del repositorio"""
+    monkeypatch.chdir(RAIZ)
+    rag = LegalRAG.__new__(LegalRAG)
+    rag.knowledge_base = BASE
+    return rag
+
+
+def reglas(*palabras_por_regla, **pesos_campo):
+    return ReglasPalabrasClave(
+        [{"id": str(n), "palabras_clave": list(palabras)} for n, palabras in enumerate(palabras_por_regla)],
+        pesos_campo or None,
+    )
+
+
+def test_patron_trie_equivale_a_la_alternancia():
+    palabras = ["contrato realidad", "contratista", "contrato", "corte", "código", "c++"]
+    trie = re.compile(r"\b(" + patron_trie(palabras) + ")")
+    alternancia = re.compile(r"\b(" + "|".join(map(re.escape, sorted(palabras, key=len, reverse=True))) + ")")
+    texto = "El contratista firmó un contrato realidad; la corte citó el código y c++ contrato."
+    assert trie.findall(texto) == alternancia.findall(texto)
+    assert patron_trie(["contrato realidad", "contratista"]) == "contrat(?:ista|o\\ realidad)"
+
+
+def test_coincide_al_inicio_de_palabra_como_prefijo():
+    assert reglas(["norma"]).contar("La normativa aplicable") == {0: 1}
+
+
+def test_no_coincide_dentro_de_otra_palabra_a_diferencia_de_la_busqueda_original():
+    # La búsqueda original usaba subcadenas: "corte" se activaba dentro de "recorte"
+    assert "corte" in "un recorte de personal"
+    assert reglas(["corte"]).contar("un recorte de personal") == {}
+    assert reglas(["ley"]).contar("flexibilidad y fleyes") == {}
+
+
+def test_ignora_acentos_y_mayusculas():
+    # La búsqueda original solo encontraba "artículo" con tilde
+    assert reglas(["artículo"]).contar("ARTICULO 23 y Artículo 24") == {0: 2}
+
+
+def test_cuenta_cada_aparicion_y_todas_las_reglas_de_una_palabra():
+    assert reglas(["ley", "norma"], ["ley"]).contar("la ley, otra ley y la norma") == {0: 3, 1: 2}
+
+
+def test_puntuar_pondera_por_campo():
+    puntajes = reglas(["ley"], ["corte"], consulta=1.0, contexto=0.5).puntuar("ley ley", "corte ley")
+    assert puntajes == {0: 2.5, 1: 0.5}
+
+
+def test_contexto_no_cuenta_por_defecto():
+    assert reglas(["corte"]).puntuar("consulta", "la corte") == {}
+
+
+def test_cargar_reglas_recompila_si_cambia_el_archivo(tmp_path):
+    ruta = tmp_path / "reglas.json"
+    ruta.write_text('{"reglas": [{"id": "a", "palabras_clave": ["ley"]}]}', encoding="utf-8")
+    primeras = cargar_reglas(str(ruta))
+    assert cargar_reglas(str(ruta)) is primeras
+
+    ruta.write_text('{"reglas": [{"id": "a", "palabras_clave": ["ley", "norma"]}]}', encoding="utf-8")
+    os.utime(ruta, ns=(0, os.stat(ruta).st_mtime_ns + 10**9))
+    assert cargar_reglas(str(ruta)).contar("norma") == {0: 1}
+
+
+# Una palabra clave de cada regla existente, tal como aparecería en una consulta
+PALABRAS = ["relación laboral", "sentencia", "artículo", "derecho", "demanda"]
+
+
+@pytest.mark.parametrize("n", range(len(PALABRAS) + 1))
+def test_reglas_existentes_conservan_la_recuperacion_original(rag, n):
+    for palabras in itertools.combinations(PALABRAS, n):
+        consulta = "Consulta sobre " + " y ".join(palabras)
+        assert rag.retrieve_relevant_info(consulta, "la corte y la ley en el contexto") == recuperar_original(BASE, consulta)
+
+
+def test_la_regla_con_mas_apariciones_va_primero(rag):
+    # La búsqueda original tomaba siempre las categorías en orden fijo
+    consulta = "demanda por subordinación: requisitos de la demanda y del proceso"
+    assert recuperar_original(BASE, consulta)[0]["tipo"] == "concepto"
+    assert [doc["tipo"] for doc in rag.retrieve_relevant_info(consulta)][:4] == ["requisito"] * 4
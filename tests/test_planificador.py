@@ -0,0 +1,119 @@
+# tests/test_planificador.py
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from utils.planificador import PlanificadorLLM, es_reintentable, estimar_tokens
+
+PARAMS = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 1000}
+
+
+def error_api(clase, status: int, **cabeceras):
+    solicitud = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return clase("error", response=httpx.Response(status, request=solicitud, headers=cabeceras), body=None)
+
+
+def respuesta(total_tokens: int):
+    return SimpleNamespace(usage=SimpleNamespace(total_tokens=total_tokens))
+
+
+def fallar_veces(errores, resultado):
+    """fn del ejecutor: lanza los errores indicados en orden y después devuelve ``resultado``"""
+    llamadas = []
+
+    async def fn():
+        llamadas.append(1)
+        if len(llamadas) <= len(errores):
+            raise errores[len(llamadas) - 1]
+        return resultado
+
+    return fn, llamadas
+
+
+def disponibles(planificador: PlanificadorLLM, modelo: str = "gpt-4o-mini") -> float:
+    return planificador._cubos_modelo(modelo)["tokens"].disponible
+
+
+def test_clasifica_errores_reintentables():
+    assert es_reintentable(error_api(openai.RateLimitError, 429))
+    assert es_reintentable(error_api(openai.InternalServerError, 503))
+    assert not es_reintentable(error_api(openai.BadRequestError, 400))
+    assert not es_reintentable(ValueError("x"))
+
+
+def test_reintenta_429_y_5xx_hasta_responder():
+    planificador = PlanificadorLLM(backoff_base_s=0)
+    fn, llamadas = fallar_veces(
+        [error_api(openai.RateLimitError, 429), error_api(openai.InternalServerError, 503)], respuesta(10)
+    )
+    assert asyncio.run(planificador(fn, PARAMS)).usage.total_tokens == 10
+    assert len(llamadas) == 3
+    assert planificador.estadisticas() == {"reintentos": 2, "limitadas": 1}
+
+
+def test_no_reintenta_errores_del_cliente():
+    planificador = PlanificadorLLM(backoff_base_s=0)
+    fn, llamadas = fallar_veces([error_api(openai.BadRequestError, 400)], respuesta(10))
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(planificador(fn, PARAMS))
+    assert len(llamadas) == 1
+
+
+def test_se_rinde_tras_max_reintentos():
+    planificador = PlanificadorLLM(backoff_base_s=0, max_reintentos=2)
+    fn, llamadas = fallar_veces([error_api(openai.InternalServerError, 500)] * 5, respuesta(10))
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(planificador(fn, PARAMS))
+    assert len(llamadas) == 3
+
+
+def test_respeta_retry_after():
+    planificador = PlanificadorLLM(backoff_base_s=0)
+    assert planificador._espera_backoff(0, error_api(openai.RateLimitError, 429, **{"retry-after-ms": "1500"})) == 1.5
+    assert planificador._espera_backoff(0, error_api(openai.RateLimitError, 429, **{"retry-after": "2"})) == 2.0
+
+
+def test_devuelve_los_tokens_reservados_que_no_se_usaron():
+    planificador = PlanificadorLLM(tpm=10_000)
+    fn, _ = fallar_veces([], respuesta(150))
+    asyncio.run(planificador(fn, PARAMS))
+    # Se reservó la estimación (entrada + max_tokens) y solo se consumieron 150
+    assert estimar_tokens(PARAMS) > 150
+    assert disponibles(planificador) == pytest.approx(10_000 - 150, abs=1)
+
+
+def test_reconciliar_devuelve_el_sobrante_de_un_stream():
+    planificador = PlanificadorLLM(tpm=10_000)
+    asyncio.run(planificador._admitir(PARAMS["model"], estimar_tokens(PARAMS)))
+    planificador.reconciliar(PARAMS, 200)
+    assert disponibles(planificador) == pytest.approx(10_000 - 200, abs=1)
+    # Un uso mayor que lo estimado no devuelve nada
+    planificador.reconciliar(PARAMS, estimar_tokens(PARAMS) + 50)
+    assert disponibles(planificador) == pytest.approx(10_000 - 200, abs=1)
+
+
+def test_gateway_reconcilia_los_streams_al_terminar(gateway):
+    gateway.ejecutor = PlanificadorLLM(tpm=50_000)
+    assert "".join(gateway.completar_stream("resumen", [{"role": "user", "content": "hola"}])) == "Hola mundo"
+    modelo = gateway.parametros("resumen")["model"]
+    assert disponibles(gateway.ejecutor, modelo) == pytest.approx(50_000 - 120, abs=1)
+
+
+def test_reintentos_de_5xx_devuelven_la_reserva_del_intento_fallido():
+    planificador = PlanificadorLLM(tpm=10_000, backoff_base_s=0)
+    fn, llamadas = fallar_veces([error_api(openai.InternalServerError, 503)] * 3, respuesta(150))
+    asyncio.run(planificador(fn, PARAMS))
+    assert len(llamadas) == 4
+    # Solo cuenta el intento que respondió, no cuatro reservas completas
+    assert disponibles(planificador) == pytest.approx(10_000 - 150, abs=1)
+
+
+def test_429_vacia_el_cubo_sin_devolver_de_mas():
+    planificador = PlanificadorLLM(tpm=600_000, backoff_base_s=0)
+    fn, _ = fallar_veces([error_api(openai.RateLimitError, 429)], respuesta(150))
+    asyncio.run(planificador(fn, PARAMS))
+    assert disponibles(planificador) < 600_000 - estimar_tokens(PARAMS)
@@ -0,0 +1,33 @@
+# tests/test_rag.py
+
+from types import SimpleNamespace
+
+from utils.llm import AvisoError
+from utils.rag import LegalRAG
+
+
+def rag_con_stream(fragmentos):
+    """LegalRAG sin gateway real: el stream entrega ``fragmentos`` y lanza las excepciones que haya entre ellos"""
+    def completar_stream(etapa, mensajes):
+        for fragmento in fragmentos:
+            if isinstance(fragmento, Exception):
+                raise fragmento
+            yield fragmento
+
+    rag = LegalRAG.__new__(LegalRAG)
+    rag.gateway = SimpleNamespace(completar_stream=completar_stream)
+    rag.knowledge_base = {}
+    return rag
+
+
+def test_stream_completo_sin_aviso():
+    partes = list(rag_con_stream(["Hola", " mundo"]).generate_rag_response_stream("consulta"))
+    assert partes == ["Hola", " mundo"]
+    assert not any(isinstance(parte, AvisoError) for parte in partes)
+
+
+def test_error_a_mitad_del_stream_termina_con_un_aviso():
+    partes = list(rag_con_stream(["Texto parcial", RuntimeError("se cortó")]).generate_rag_response_stream("consulta"))
+    assert partes[0] == "Texto parcial"
+    assert isinstance(partes[-1], AvisoError)
+    assert len(partes) == 2
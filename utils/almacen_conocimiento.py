@@ -0,0 +1,520 @@
+# utils/almacen_conocimiento.py
+
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+RUTA_CONOCIMIENTO = "legal_knowledge.json"
+
+# Tras escrituras de otros procesos (p. ej. una ingesta masiva en curso), los derivados sin
+# actualización incremental se recalculan como mucho una vez cada tantos segundos
+DERIVADOS_INTERVALO_S = float(os.getenv("ALMACEN_DERIVADOS_INTERVALO_S", "5"))
+
+# Base de conocimiento inicial cuando todavía no existen la base de datos ni el JSON
+CONOCIMIENTO_POR_DEFECTO: Dict[str, Any] = {
+    "contrato_realidad": {
+        "concepto": "El contrato realidad es una figura jurídica que permite reconocer una relación laboral cuando existe una relación de trabajo subordinado pero se ha disfrazado bajo otra figura contractual.",
+        "elementos": [
+            "Subordinación jurídica",
+            "Prestación personal del servicio",
+            "Continuidad en la prestación",
+            "Remuneración periódica",
+            "Ausencia de contrato laboral formal"
+        ],
+        "jurisprudencia": [
+            "Sentencia C-614 de 2009 de la Corte Constitucional",
+            "Sentencia T-1234 de 2018 sobre contrato realidad",
+            "Sentencia C-789 de 2020 sobre protección laboral"
+        ],
+        "normativa": [
+            "Artículo 23 del Código Sustantivo del Trabajo",
+            "Artículo 25 del CST sobre presunción de laboralidad",
+            "Artículo 26 del CST sobre contrato de trabajo"
+        ]
+    },
+    "derecho_laboral_colombiano": {
+        "principios": [
+            "Protección al trabajador",
+            "Realidad sobre las formas",
+            "Primacía de la realidad",
+            "Continuidad de la relación laboral"
+        ],
+        "derechos_trabajador": [
+            "Salario mínimo legal",
+            "Prestaciones sociales",
+            "Seguridad social",
+            "Vacaciones y descansos",
+            "Indemnización por despido"
+        ]
+    },
+    "demanda_laboral": {
+        "requisitos": [
+            "Competencia del juez laboral",
+            "Identificación clara de las partes",
+            "Narración de hechos",
+            "Pretensiones específicas",
+            "Fundamentos jurídicos",
+            "Medios de prueba",
+            "Petición final"
+        ],
+        "plazos": [
+            "Prescripción ordinaria: 3 años",
+            "Prescripción especial: 1 año para algunos casos",
+            "Término de contestación: 10 días"
+        ]
+    }
+}
+
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY,
+    categoria TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    forma TEXT NOT NULL,
+    contenido TEXT NOT NULL,
+    fuente TEXT NOT NULL DEFAULT '',
+    fecha TEXT NOT NULL DEFAULT '',
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documentos_tipo ON documentos(categoria, tipo, id);
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+"""
+
+# Índice de texto completo sincronizado con la tabla por triggers (sin duplicar el contenido)
+TABLA_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS documentos_fts USING fts5(
+    contenido, content='documentos', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+)
+"""
+TRIGGERS_FTS = {
+    "documentos_ai": """
+        CREATE TRIGGER IF NOT EXISTS documentos_ai AFTER INSERT ON documentos BEGIN
+            INSERT INTO documentos_fts(rowid, contenido) VALUES (new.id, new.contenido);
+        END
+    """,
+    "documentos_ad": """
+        CREATE TRIGGER IF NOT EXISTS documentos_ad AFTER DELETE ON documentos BEGIN
+            INSERT INTO documentos_fts(documentos_fts, rowid, contenido) VALUES ('delete', old.id, old.contenido);
+        END
+    """,
+    "documentos_au": """
+        CREATE TRIGGER IF NOT EXISTS documentos_au AFTER UPDATE OF contenido ON documentos BEGIN
+            INSERT INTO documentos_fts(documentos_fts, rowid, contenido) VALUES ('delete', old.id, old.contenido);
+            INSERT INTO documentos_fts(rowid, contenido) VALUES (new.id, new.contenido);
+        END
+    """,
+}
+
+
+def ruta_base_datos(ruta: str) -> str:
+    """Base SQLite asociada a un archivo de conocimiento JSON (legal_knowledge.json -> legal_knowledge.sqlite3)"""
+    return os.path.splitext(ruta)[0] + ".sqlite3"
+
+
+def filas_de_entrada(categoria: str, tipo: str, valor: Any) -> List[Tuple]:
+    """Filas (categoria, tipo, forma, contenido, fuente, fecha, extra) de una entrada categoria/tipo del JSON"""
+    entradas = valor if isinstance(valor, list) else [valor]
+    filas = []
+    for entrada in entradas:
+        if isinstance(entrada, dict):
+            extra = {k: v for k, v in entrada.items() if k not in ("content", "source", "added_date")}
+            filas.append((
+                categoria, tipo, "registro", str(entrada.get("content", "")), str(entrada.get("source", "") or ""),
+                str(entrada.get("added_date", "") or ""), json.dumps(extra, ensure_ascii=False) if extra else None
+            ))
+        else:
+            filas.append((categoria, tipo, "texto" if isinstance(valor, list) else "valor", str(entrada), "", "", None))
+    return filas
+
+
+def entrada_de_fila(forma: str, contenido: str, fuente: str, fecha: str, extra: Optional[str]) -> Any:
+    """Inversa de filas_de_entrada para una fila: texto suelto o registro {"content", "source", "added_date"}"""
+    if forma != "registro":
+        return contenido
+    entrada = {"content": contenido, "source": fuente, "added_date": fecha}
+    if extra:
+        entrada.update(json.loads(extra))
+    return entrada
+
+
+class AlmacenConocimiento:
+    """
+    Base de conocimiento compartida por todo el proceso (todas las sesiones y modos de RAG).
+
+    Los datos se guardan en SQLite (modo WAL: varios lectores y un escritor a
+    la vez, también entre procesos), una fila por documento, con un índice
+    FTS5 para búsqueda de texto completo. Agregar un documento es una
+    inserción en una transacción, sin reescribir la base.
+
+    En memoria se mantiene la vista con la forma del JSON original
+    (categoría -> tipo -> texto o lista), que comparten todas las sesiones.
+    Un contador ``version`` en la base se incrementa en cada escritura; cada
+    acceso lo consulta y, si cambió, lee solo las filas nuevas (propias o de
+    otro proceso); únicamente una importación completa obliga a releer todo.
+    Los derivados (corpus vectorial, índices) se recalculan solo cuando la
+    versión cambia, fuera del candado del almacén, o se actualizan en el
+    lugar si admiten inserciones incrementales.
+
+    La vista entregada es de solo lectura: las escrituras la sustituyen
+    (copia en escritura) en lugar de mutarla.
+
+    Si la base no existe se crea con el contenido del JSON (o los datos por
+    defecto); desde entonces el JSON queda solo como formato de
+    exportación/importación.
+    """
+
+    def __init__(self, ruta: str = RUTA_CONOCIMIENTO):
+        self.ruta = ruta
+        self.ruta_db = ruta_base_datos(ruta)
+        self.version = 0
+        self.error: Optional[str] = None
+        self.fts = True
+        self._datos: Dict[str, Any] = {}
+        # Última fila leída y reemplazos completos vistos: permiten leer solo las filas nuevas
+        self._ultimo_id = 0
+        self._generacion = 0
+        # Versión tras la última escritura de este proceso
+        self._version_propia = 0
+        # nombre -> (versión, valor, instante del cálculo)
+        self._derivados: Dict[str, Tuple[int, Any, float]] = {}
+        self._actualizadores: Dict[str, Callable[[Any, Dict[str, Any], str, str, Any], Optional[bool]]] = {}
+        self._calculos: Dict[str, threading.Lock] = {}
+        self._lock = threading.RLock()
+        self._conn = self._conectar()
+
+    def _conectar(self) -> sqlite3.Connection:
+        directorio = os.path.dirname(self.ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        # Transacciones explícitas (BEGIN IMMEDIATE ... COMMIT)
+        conn = sqlite3.connect(self.ruta_db, check_same_thread=False, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(ESQUEMA)
+        try:
+            existia = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'documentos_fts'").fetchone() is not None
+            conn.execute(TABLA_FTS)
+            for sql in TRIGGERS_FTS.values():
+                conn.execute(sql)
+            if not existia:
+                # Base creada sin índice de texto completo: indexar las filas que ya tenga
+                conn.execute("INSERT INTO documentos_fts(documentos_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            # SQLite compilado sin FTS5: la búsqueda recurre a LIKE
+            self.fts = False
+        with self._transaccion(conn):
+            if conn.execute("SELECT valor FROM meta WHERE clave = 'version'").fetchone() is None:
+                self._insertar(conn, self._datos_iniciales())
+                conn.execute("INSERT INTO meta (clave, valor) VALUES ('version', 1)")
+        return conn
+
+    @contextmanager
+    def _transaccion(self, conn: Optional[sqlite3.Connection] = None):
+        conn = conn or self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _datos_iniciales(self) -> Dict[str, Any]:
+        """Contenido para una base nueva: el JSON existente o los datos por defecto"""
+        if os.path.exists(self.ruta):
+            try:
+                with open(self.ruta, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                self.error = str(e)
+        return copy.deepcopy(CONOCIMIENTO_POR_DEFECTO)
+
+    @staticmethod
+    def _insertar(conn: sqlite3.Connection, datos: Dict[str, Any]):
+        filas = [
+            fila
+            for categoria, tipos in datos.items() if isinstance(tipos, dict)
+            for tipo, valor in tipos.items()
+            for fila in filas_de_entrada(categoria, tipo, valor)
+        ]
+        conn.executemany(
+            "INSERT INTO documentos (categoria, tipo, forma, contenido, fuente, fecha, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            filas,
+        )
+
+    def _estado_db(self) -> Tuple[int, int]:
+        """(versión, generación) de la base; la generación cambia solo con los reemplazos completos"""
+        meta = dict(self._conn.execute("SELECT clave, valor FROM meta WHERE clave IN ('version', 'generacion')"))
+        return meta["version"], meta.get("generacion", 0)
+
+    def _incrementar_version(self):
+        self._conn.execute("UPDATE meta SET valor = valor + 1 WHERE clave = 'version'")
+
+    def _recargar(self, version: int, generacion: int):
+        datos: Dict[str, Any] = {}
+        ultimo_id = 0
+        for id_fila, categoria, tipo, forma, contenido, fuente, fecha, extra in self._conn.execute(
+            "SELECT id, categoria, tipo, forma, contenido, fuente, fecha, extra FROM documentos ORDER BY id"
+        ):
+            entrada = entrada_de_fila(forma, contenido, fuente, fecha, extra)
+            tipos = datos.setdefault(categoria, {})
+            if forma == "valor":
+                tipos[tipo] = entrada
+            else:
+                tipos.setdefault(tipo, []).append(entrada)
+            ultimo_id = id_fila
+        self._datos = datos
+        self._ultimo_id = ultimo_id
+        self._generacion = generacion
+        self.version = version
+
+    def _sincronizar(self):
+        """
+        Poner la vista al día con la base.
+
+        Las escrituras solo insertan filas al final, así que basta leer las
+        posteriores a la última vista y agregarlas a la vista (y a los
+        derivados con actualización incremental). Solo un reemplazo completo
+        obliga a releer todo.
+        """
+        version, generacion = self._estado_db()
+        if version == self.version:
+            return
+        if generacion != self._generacion or not self.version:
+            self._recargar(version, generacion)
+            return
+        filas = self._conn.execute(
+            "SELECT id, categoria, tipo, forma, contenido, fuente, fecha, extra FROM documentos WHERE id > ? ORDER BY id",
+            (self._ultimo_id,),
+        ).fetchall()
+        if any(forma == "valor" for _id, _categoria, _tipo, forma, *_resto in filas):
+            # Solo las cargas completas insertan valores sueltos
+            self._recargar(version, generacion)
+            return
+        entradas = [
+            (categoria, tipo, entrada_de_fila(forma, contenido, fuente, fecha, extra))
+            for _id, categoria, tipo, forma, contenido, fuente, fecha, extra in filas
+        ]
+        previa = self.version
+        self._datos = self._con_entradas(self._datos, entradas)
+        if filas:
+            self._ultimo_id = filas[-1][0]
+        self.version = version
+        self._actualizar_derivados(previa, entradas)
+
+    @staticmethod
+    def _con_entradas(datos: Dict[str, Any], entradas: Sequence[Tuple[str, str, Any]]) -> Dict[str, Any]:
+        """Copia en escritura de la vista con las entradas agregadas: solo se copian los contenedores modificados"""
+        if not entradas:
+            return datos
+        datos = dict(datos)
+        copiados = set()
+        for categoria, tipo, entrada in entradas:
+            if categoria not in copiados:
+                datos[categoria] = dict(datos.get(categoria, {}))
+                copiados.add(categoria)
+            if (categoria, tipo) not in copiados:
+                # Un valor suelto (p. ej. "concepto") pasa a ser el primer elemento de la lista
+                actual = datos[categoria].get(tipo)
+                datos[categoria][tipo] = [] if actual is None else list(actual) if isinstance(actual, list) else [actual]
+                copiados.add((categoria, tipo))
+            datos[categoria][tipo].append(entrada)
+        return datos
+
+    def instantanea(self) -> Tuple[int, Dict[str, Any]]:
+        """(versión, datos) actuales; solo lee de la base lo que otro proceso escribió"""
+        with self._lock:
+            self._sincronizar()
+            return self.version, self._datos
+
+    @property
+    def datos(self) -> Dict[str, Any]:
+        return self.instantanea()[1]
+
+    def agregar(self, categoria: str, tipo: str, entrada: Any):
+        """Agregar una entrada (texto o registro) a la lista categoria/tipo: una inserción en una transacción"""
+        self.agregar_lote([(categoria, tipo, entrada)])
+
+    def agregar_lote(
+        self,
+        entradas: Sequence[Tuple[str, str, Any]],
+        al_confirmar: Optional[Callable[[sqlite3.Connection], None]] = None,
+    ):
+        """
+        Agregar varias entradas (categoria, tipo, entrada) en una sola transacción.
+
+        ``al_confirmar(conn)`` se ejecuta dentro de la misma transacción, de
+        modo que lo que registre (p. ej. el avance de una ingesta) queda
+        confirmado junto con los documentos, o no queda nada.
+        """
+        with self._lock:
+            self._sincronizar()
+            sueltos = set()
+            for categoria, tipo, _entrada in entradas:
+                actual = self._datos.get(categoria, {}).get(tipo)
+                if actual is not None and not isinstance(actual, list):
+                    sueltos.add((categoria, tipo))
+            with self._transaccion():
+                for categoria, tipo in sueltos:
+                    # Un valor suelto (p. ej. "concepto") pasa a ser el primer elemento de la lista
+                    self._conn.execute(
+                        "UPDATE documentos SET forma = 'texto' WHERE categoria = ? AND tipo = ? AND forma = 'valor'",
+                        (categoria, tipo),
+                    )
+                self._conn.executemany(
+                    "INSERT INTO documentos (categoria, tipo, forma, contenido, fuente, fecha, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [fila for categoria, tipo, entrada in entradas for fila in filas_de_entrada(categoria, tipo, [entrada])],
+                )
+                if al_confirmar is not None:
+                    al_confirmar(self._conn)
+                self._incrementar_version()
+            # Las filas propias (y las de otro proceso que escribiera entre medio) se leen como cualquier otra
+            self._sincronizar()
+            self._version_propia = self.version
+
+    def reemplazar(self, datos: Dict[str, Any]):
+        """Sustituir la base de conocimiento completa (en una sola transacción)"""
+        with self._lock:
+            with self._transaccion():
+                if self.fts:
+                    # Carga masiva: reconstruir el índice FTS una vez es ~5x más rápido que fila a fila
+                    for nombre in ("documentos_ai", "documentos_ad"):
+                        self._conn.execute(f"DROP TRIGGER IF EXISTS {nombre}")
+                self._conn.execute("DELETE FROM documentos")
+                self._insertar(self._conn, datos)
+                if self.fts:
+                    self._conn.execute("INSERT INTO documentos_fts(documentos_fts) VALUES ('rebuild')")
+                    for nombre in ("documentos_ai", "documentos_ad"):
+                        self._conn.execute(TRIGGERS_FTS[nombre])
+                self._incrementar_version()
+                self._conn.execute(
+                    "INSERT INTO meta (clave, valor) VALUES ('generacion', 1) "
+                    "ON CONFLICT(clave) DO UPDATE SET valor = valor + 1"
+                )
+            self._recargar(*self._estado_db())
+            self._version_propia = self.version
+
+    def buscar(self, consulta: str, limite: int = -1) -> List[Dict[str, Any]]:
+        """
+        Búsqueda de texto completo (FTS5, sin distinguir acentos ni mayúsculas; términos como prefijo).
+
+        Returns:
+            Hasta ``limite`` filas (-1: todas) {"categoria", "tipo", "contenido", "fuente", "fecha"},
+            de la más a la menos relevante (BM25)
+        """
+        terminos = re.findall(r"\w+", consulta)
+        if not terminos:
+            return []
+        with self._lock:
+            if self.fts:
+                filas = self._conn.execute(
+                    "SELECT d.categoria, d.tipo, d.contenido, d.fuente, d.fecha "
+                    "FROM documentos_fts JOIN documentos d ON d.id = documentos_fts.rowid "
+                    "WHERE documentos_fts MATCH ? ORDER BY bm25(documentos_fts) LIMIT ?",
+                    (" ".join(f'"{termino}"*' for termino in terminos), limite),
+                ).fetchall()
+            else:
+                filas = self._conn.execute(
+                    "SELECT categoria, tipo, contenido, fuente, fecha FROM documentos "
+                    "WHERE contenido LIKE ? ORDER BY id LIMIT ?",
+                    (f"%{consulta.strip()}%", limite),
+                ).fetchall()
+        return [
+            {"categoria": categoria, "tipo": tipo, "contenido": contenido, "fuente": fuente, "fecha": fecha}
+            for categoria, tipo, contenido, fuente, fecha in filas
+        ]
+
+    def derivado(
+        self,
+        nombre: str,
+        calcular: Callable[[Dict[str, Any]], Any],
+        actualizar: Optional[Callable[[Any, Dict[str, Any], str, str, Any], Optional[bool]]] = None,
+        con_version: bool = False,
+    ) -> Any:
+        """
+        Valor calculado a partir de los datos, recalculado solo cuando cambia la versión.
+
+        Útil para estructuras caras de construir (corpus aplanado, índices) que
+        comparten todas las sesiones. Si se indica ``actualizar(valor, datos,
+        categoria, tipo, entrada)``, las entradas agregadas (en este proceso o
+        en otro) se aplican al valor existente en lugar de recalcularlo; si
+        devuelve False, el valor se descarta y se recalcula completo.
+
+        ``calcular`` corre fuera del candado del almacén y una sola vez por
+        derivado a la vez: mientras se recalcula, las demás llamadas reciben el
+        valor anterior en lugar de esperar. Si la base solo cambió por
+        escrituras de otros procesos, el valor se recalcula como mucho una vez
+        cada DERIVADOS_INTERVALO_S. Como puede tardar, desde código asíncrono
+        conviene llamarlo con asyncio.to_thread.
+
+        Returns:
+            El valor, o (versión de los datos con que se calculó, valor) si ``con_version``
+        """
+        with self._lock:
+            version, datos = self.instantanea()
+            if actualizar is not None:
+                self._actualizadores[nombre] = actualizar
+            guardado = self._derivados.get(nombre)
+            if guardado is not None and (guardado[0] == version or self._aplazable(guardado)):
+                return self._resultado(guardado, con_version)
+            calculo = self._calculos.setdefault(nombre, threading.Lock())
+        if not calculo.acquire(blocking=guardado is None):
+            # Otro hilo lo está recalculando: mientras tanto sirve el valor anterior
+            return self._resultado(guardado, con_version)
+        try:
+            with self._lock:
+                version, datos = self.instantanea()
+                guardado = self._derivados.get(nombre)
+                if guardado is not None and guardado[0] == version:
+                    return self._resultado(guardado, con_version)
+            valor = calcular(datos)
+            with self._lock:
+                guardado = self._derivados.get(nombre)
+                # Si mientras tanto se actualizó en el lugar a una versión posterior, se conserva ese
+                if guardado is None or guardado[0] <= version:
+                    guardado = (version, valor, time.monotonic())
+                    self._derivados[nombre] = guardado
+                return self._resultado(guardado, con_version)
+        finally:
+            calculo.release()
+
+    def _aplazable(self, guardado: Tuple[int, Any, float]) -> bool:
+        """True si el derivado puede seguir sirviéndose: desde su cálculo solo escribieron otros procesos, y hace poco"""
+        return self._version_propia <= guardado[0] and time.monotonic() - guardado[2] < DERIVADOS_INTERVALO_S
+
+    @staticmethod
+    def _resultado(guardado: Tuple[int, Any, float], con_version: bool) -> Any:
+        return (guardado[0], guardado[1]) if con_version else guardado[1]
+
+    def _actualizar_derivados(self, previa: int, entradas: Sequence[Tuple[str, str, Any]]):
+        for nombre, actualizar in self._actualizadores.items():
+            guardado = self._derivados.get(nombre)
+            if guardado is not None and guardado[0] == previa:
+                if all(actualizar(guardado[1], self._datos, categoria, tipo, entrada) is not False for categoria, tipo, entrada in entradas):
+                    self._derivados[nombre] = (self.version, guardado[1], guardado[2])
+                else:
+                    # La entrada no se puede aplicar en el lugar: se recalcula en la próxima lectura
+                    del self._derivados[nombre]
+
+
+_almacenes: Dict[str, AlmacenConocimiento] = {}
+_almacenes_lock = threading.Lock()
+
+
+def obtener_almacen(ruta: str = RUTA_CONOCIMIENTO) -> AlmacenConocimiento:
+    """Almacén compartido por todo el proceso para un archivo de conocimiento"""
+    ruta = os.path.abspath(ruta)
+    with _almacenes_lock:
+        if ruta not in _almacenes:
+            _almacenes[ruta] = AlmacenConocimiento(ruta)
+        return _almacenes[ruta]
@@ -0,0 +1,142 @@
+# utils/cache_llm.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Ubicación y límites por defecto de la caché en disco
+RUTA_CACHE = os.getenv("LLM_CACHE_RUTA", os.path.join(".cache", "llm_cache.sqlite3"))
+MAX_ENTRADAS = int(os.getenv("LLM_CACHE_MAX_ENTRADAS", "5000"))
+MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+MAX_EDAD_S = float(os.getenv("LLM_CACHE_MAX_EDAD_S", str(30 * 24 * 3600)))
+
+# Campos de la petición que determinan la respuesta
+CAMPOS_CLAVE = ("model", "messages", "temperature", "max_tokens")
+
+
+def clave_completion(params: Dict[str, Any]) -> str:
+    """Huella SHA-256 de una petición de chat completion (modelo, mensajes, temperatura, max_tokens)"""
+    datos = {campo: params.get(campo) for campo in CAMPOS_CLAVE}
+    serializado = json.dumps(datos, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+class CacheCompletions:
+    """
+    Caché persistente de chat completions direccionada por contenido.
+
+    Guarda cada respuesta en SQLite bajo la huella de la petición. Las entradas
+    expiran por edad y, si se superan los límites de tamaño, se desalojan las
+    menos usadas recientemente (LRU).
+    """
+
+    def __init__(
+        self,
+        ruta: str = RUTA_CACHE,
+        max_entradas: int = MAX_ENTRADAS,
+        max_bytes: int = MAX_BYTES,
+        max_edad_s: float = MAX_EDAD_S,
+    ):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.max_edad_s = max_edad_s
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        self._conn = self._conectar()
+
+    def _conectar(self) -> sqlite3.Connection:
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                clave TEXT PRIMARY KEY,
+                modelo TEXT NOT NULL,
+                respuesta TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                creado REAL NOT NULL,
+                accedido REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accedido ON completions(accedido)")
+        conn.commit()
+        return conn
+
+    def obtener(self, params: Dict[str, Any]) -> Optional[str]:
+        """Devolver la respuesta guardada para la petición, o None si no existe o expiró"""
+        clave = clave_completion(params)
+        ahora = time.time()
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT respuesta, creado FROM completions WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or ahora - fila[1] > self.max_edad_s:
+                self.fallos += 1
+                return None
+            self._conn.execute("UPDATE completions SET accedido = ? WHERE clave = ?", (ahora, clave))
+            self._conn.commit()
+            self.aciertos += 1
+            return fila[0]
+
+    def guardar(self, params: Dict[str, Any], respuesta: str):
+        """Guardar una respuesta y aplicar los límites de edad y tamaño"""
+        if not respuesta:
+            return
+        clave = clave_completion(params)
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (clave, modelo, respuesta, bytes, creado, accedido) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (clave, params.get("model", ""), respuesta, len(respuesta.encode("utf-8")), ahora, ahora),
+            )
+            self._desalojar(ahora)
+            self._conn.commit()
+
+    def _desalojar(self, ahora: float):
+        """Eliminar entradas expiradas y, después, las menos usadas hasta cumplir los límites"""
+        self._conn.execute("DELETE FROM completions WHERE creado < ?", (ahora - self.max_edad_s,))
+        self._conn.execute(
+            "DELETE FROM completions WHERE clave IN ("
+            "  SELECT clave FROM completions ORDER BY accedido DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.max_entradas,),
+        )
+        self._conn.execute(
+            "DELETE FROM completions WHERE clave IN ("
+            "  SELECT clave FROM ("
+            "    SELECT clave, SUM(bytes) OVER (ORDER BY accedido DESC, clave) AS acumulado FROM completions"
+            "  ) WHERE acumulado > ?"
+            ")",
+            (self.max_bytes,),
+        )
+
+    def limpiar(self):
+        """Vaciar la caché por completo"""
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos y ocupación actual"""
+        with self._lock:
+            entradas, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM completions"
+            ).fetchone()
+        consultas = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+            "entradas": entradas,
+            "bytes": total_bytes,
+        }
@@ -0,0 +1,128 @@
+# utils/cuantizacion.py
+
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Filas por bloque al puntuar códigos: acota la memoria temporal de la conversión a float32
+FILAS_POR_BLOQUE = 8192
+
+MODOS = ("int8", "binaria")
+
+
+def cuantizar_int8(vectores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Códigos int8 con escala por fila: vector ≈ codigos * escala"""
+    vectores = np.asarray(vectores, dtype=np.float32)
+    maximos = np.abs(vectores).max(axis=1, keepdims=True) if vectores.size else np.zeros((len(vectores), 1), np.float32)
+    escalas = np.maximum(maximos, np.finfo(np.float32).tiny) / 127
+    return np.round(vectores / escalas).astype(np.int8), escalas[:, 0].astype(np.float32)
+
+
+def cuantizar_binaria(vectores: np.ndarray) -> np.ndarray:
+    """Un bit por dimensión (signo), empaquetado en bytes: (n, ceil(d / 8)) uint8"""
+    return np.packbits(np.asarray(vectores) > 0, axis=1)
+
+
+class VectoresCuantizados:
+    """
+    Copia compacta de la matriz de embeddings para generar candidatos.
+
+    - "int8": un byte por dimensión y una escala por fila (4x menos que float32).
+    - "binaria": un bit por dimensión (32x menos). La consulta no se binariza:
+      se puntúa en float contra los signos ±1, lo que pierde menos recall que
+      la distancia de Hamming.
+
+    La búsqueda puntúa todo el corpus sobre los códigos, que viven en memoria,
+    y reordena una lista corta de candidatos con los vectores float32 exactos,
+    que quedan en disco (memory-map): solo se leen las filas de los candidatos.
+    """
+
+    def __init__(self, modo: str, codigos: np.ndarray, escalas: Optional[np.ndarray] = None):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de cuantización desconocido: {modo} (opciones: {', '.join(MODOS)})")
+        self.modo = modo
+        self.codigos = codigos
+        self.escalas = escalas
+
+    @classmethod
+    def desde_vectores(cls, modo: str, vectores: np.ndarray) -> "VectoresCuantizados":
+        """Cuantizar una matriz de embeddings normalizados (por bloques, admite memory-map)"""
+        partes, escalas = [], []
+        for inicio in range(0, vectores.shape[0], FILAS_POR_BLOQUE):
+            bloque = np.asarray(vectores[inicio:inicio + FILAS_POR_BLOQUE], dtype=np.float32)
+            if modo == "int8":
+                codigos, escala = cuantizar_int8(bloque)
+                escalas.append(escala)
+            else:
+                codigos = cuantizar_binaria(bloque)
+            partes.append(codigos)
+        ancho = vectores.shape[1] if modo == "int8" else -(-vectores.shape[1] // 8)
+        codigos = np.concatenate(partes) if partes else np.zeros((0, ancho), np.int8 if modo == "int8" else np.uint8)
+        return cls(modo, codigos, np.concatenate(escalas) if modo == "int8" and escalas else None)
+
+    @property
+    def bytes_por_vector(self) -> int:
+        return self.codigos.shape[1] + (4 if self.escalas is not None else 0)
+
+    def _puntajes_bloque(self, inicio: int, consultas: np.ndarray) -> np.ndarray:
+        bloque = self.codigos[inicio:inicio + FILAS_POR_BLOQUE]
+        if self.modo == "int8":
+            return (consultas @ bloque.T.astype(np.float32)) * self.escalas[inicio:inicio + len(bloque)]
+        # q · signos = 2 (q · bits) - suma(q); el término constante no cambia el orden
+        bits = np.unpackbits(bloque, axis=1, count=consultas.shape[1]).astype(np.float32)
+        return consultas @ bits.T
+
+    def candidatos(self, consultas: np.ndarray, n: int) -> np.ndarray:
+        """Los n mejores candidatos aproximados de cada consulta, (q, n) índices de fila sin ordenar"""
+        total = self.codigos.shape[0]
+        n = min(n, total)
+        mejores = np.empty((consultas.shape[0], 0), dtype=np.int64)
+        mejores_puntajes = np.empty((consultas.shape[0], 0), dtype=np.float32)
+        for inicio in range(0, total, FILAS_POR_BLOQUE):
+            puntajes = np.concatenate([mejores_puntajes, self._puntajes_bloque(inicio, consultas)], axis=1)
+            indices = np.concatenate([
+                mejores,
+                np.broadcast_to(np.arange(inicio, min(total, inicio + FILAS_POR_BLOQUE)), (consultas.shape[0], puntajes.shape[1] - mejores.shape[1]))
+            ], axis=1)
+            if puntajes.shape[1] > n:
+                seleccion = np.argpartition(-puntajes, n - 1, axis=1)[:, :n]
+                indices = np.take_along_axis(indices, seleccion, axis=1)
+                puntajes = np.take_along_axis(puntajes, seleccion, axis=1)
+            mejores, mejores_puntajes = indices, puntajes
+        return mejores
+
+    def buscar(self, matriz: np.ndarray, consultas: np.ndarray, k: int, factor_reordenar: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k: candidatos sobre los códigos y reordenación exacta con la matriz float32.
+
+        Returns:
+            (indices, puntajes), ambos (q, k), con similitud coseno exacta
+        """
+        k = min(k, self.codigos.shape[0])
+        candidatos = self.candidatos(consultas, k * max(1, factor_reordenar))
+        indices = np.empty((consultas.shape[0], k), dtype=np.int64)
+        puntajes = np.empty((consultas.shape[0], k), dtype=np.float32)
+        for fila, (consulta, filas) in enumerate(zip(consultas, candidatos)):
+            filas = np.sort(filas)  # lectura secuencial del memory-map
+            exactos = np.asarray(matriz[filas], dtype=np.float32) @ consulta
+            orden = np.argsort(-exactos)[:k]
+            indices[fila], puntajes[fila] = filas[orden], exactos[orden]
+        return indices, puntajes
+
+    def guardar(self, ruta: str):
+        tmp = ruta + ".tmp.npz"
+        datos = {"modo": np.array(self.modo), "codigos": self.codigos}
+        if self.escalas is not None:
+            datos["escalas"] = self.escalas
+        np.savez(tmp, **datos)
+        os.replace(tmp, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> Optional["VectoresCuantizados"]:
+        try:
+            with np.load(ruta) as datos:
+                escalas = datos["escalas"] if "escalas" in datos.files else None
+                return cls(str(datos["modo"]), datos["codigos"], escalas)
+        except (OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,159 @@
+# utils/digesto.py
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, List
+
+from utils.fragmentacion import fragmentar_texto
+from utils.llm import completar_async, ejecutar, establecer_regeneracion, esperar
+from utils.planificador import CARACTERES_POR_TOKEN
+
+# Por debajo de este tamaño los hechos se usan tal cual: resumirlos no ahorra nada
+UMBRAL_CARACTERES = int(os.getenv("DIGESTO_UMBRAL_CARACTERES", "8000"))
+# Tamaño de cada fragmento en la fase de extracción (map)
+FRAGMENTO_TOKENS = int(os.getenv("DIGESTO_FRAGMENTO_TOKENS", str(12000 // CARACTERES_POR_TOKEN)))
+# Entrada máxima de una llamada de consolidación (reduce); si se supera se consolida por niveles
+REDUCCION_MAX_CARACTERES = int(os.getenv("DIGESTO_REDUCCION_MAX_CARACTERES", "40000"))
+MAX_CONCURRENCIA_DIGESTO = int(os.getenv("DIGESTO_MAX_CONCURRENCIA", "8"))
+MAX_DIGESTOS_EN_MEMORIA = 64
+
+SISTEMA_DIGESTO = "Actúas como abogado laboralista colombiano que prepara la ficha de un caso de contrato realidad para el equipo de litigio."
+
+APARTADOS_DIGESTO = """- Partes (trabajador, contratante, intermediarios)
+- Fechas y duración de la relación (inicio, fin, interrupciones)
+- Tipo de contrato formal y renovaciones
+- Funciones y cargo real
+- Subordinación (órdenes, horarios, supervisión, reglamentos, sanciones)
+- Remuneración (montos, periodicidad, forma de pago)
+- Prestación personal y continua del servicio
+- Terminación de la relación
+- Pruebas y documentos mencionados
+- Reclamaciones previas y pretensiones del trabajador"""
+
+# Digestos ya calculados (o en curso) por huella del texto; viven en el bucle del gateway
+_digestos: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+
+
+def huella_hechos(hechos: str) -> str:
+    """Huella SHA-256 del texto de los hechos"""
+    return hashlib.sha256(hechos.encode("utf-8")).hexdigest()
+
+
+def fragmentar(texto: str, max_tokens: int = FRAGMENTO_TOKENS) -> List[str]:
+    """
+    Dividir los hechos en fragmentos de hasta ``max_tokens`` tokens.
+
+    Usa el mismo fragmentador que el corpus vectorial (utils/fragmentacion.py):
+    corta en párrafos, oraciones o encabezados. Sin solapamiento: la
+    consolidación ya une lo que quede repartido entre dos fragmentos.
+    """
+    return [texto[inicio:fin] for inicio, fin in fragmentar_texto(texto, max_tokens, 0)]
+
+
+def _mensajes_extraccion(fragmento: str, indice: int, total: int) -> List[Dict[str, str]]:
+    prompt = f"""
+Extrae de este fragmento ({indice} de {total}) de los hechos de un caso laboral únicamente la información relevante para una demanda por contrato realidad, organizada en estos apartados:
+
+{APARTADOS_DIGESTO}
+
+Sé literal con nombres, fechas, cifras y documentos. Omite los apartados sin información. No inventes datos.
+
+FRAGMENTO:
+{fragmento}
+"""
+
+    return [
+        {"role": "system", "content": SISTEMA_DIGESTO},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _mensajes_consolidacion(extractos: List[str]) -> List[Dict[str, str]]:
+    bloques = "\n\n".join(f"--- EXTRACTO {i} ---\n{extracto}" for i, extracto in enumerate(extractos, 1))
+    prompt = f"""
+Consolida los siguientes extractos, tomados en orden de los hechos de un mismo caso, en un único digesto del caso organizado en estos apartados:
+
+{APARTADOS_DIGESTO}
+
+Elimina repeticiones, conserva literalmente nombres, fechas, cifras y documentos, y ordena los hechos cronológicamente. No inventes datos.
+
+{bloques}
+"""
+
+    return [
+        {"role": "system", "content": SISTEMA_DIGESTO},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def _consolidar(extractos: List[str]) -> str:
+    """Reducir los extractos a un digesto, por niveles si no caben en una sola llamada"""
+    while len(extractos) > 1 and sum(len(e) for e in extractos) > REDUCCION_MAX_CARACTERES:
+        grupos: List[List[str]] = [[]]
+        for extracto in extractos:
+            if grupos[-1] and sum(len(e) for e in grupos[-1]) + len(extracto) > REDUCCION_MAX_CARACTERES:
+                grupos.append([])
+            grupos[-1].append(extracto)
+        if len(grupos) == len(extractos):
+            # Cada extracto ya llena un grupo: consolidar de dos en dos para garantizar progreso
+            grupos = [extractos[i:i + 2] for i in range(0, len(extractos), 2)]
+        extractos = await asyncio.gather(*[
+            completar_async("digesto", _mensajes_consolidacion(grupo)) for grupo in grupos
+        ])
+    return await completar_async("digesto", _mensajes_consolidacion(extractos))
+
+
+async def _calcular_digesto(hechos: str) -> str:
+    # "Regenerar" solo afecta a la sección pedida: el digesto usa la caché de completions,
+    # así todas las secciones del caso comparten los mismos hechos (y el mismo prefijo).
+    # La tarea tiene su propia copia del contexto, de modo que esto no alcanza al llamador.
+    establecer_regeneracion(False)
+    fragmentos = fragmentar(hechos)
+    semaforo = asyncio.Semaphore(max(1, MAX_CONCURRENCIA_DIGESTO))
+
+    async def extraer(indice: int, fragmento: str) -> str:
+        async with semaforo:
+            return await completar_async(
+                "digesto_fragmento", _mensajes_extraccion(fragmento, indice, len(fragmentos))
+            )
+
+    extractos = await asyncio.gather(*[extraer(i, f) for i, f in enumerate(fragmentos, 1)])
+    return await _consolidar(list(extractos))
+
+
+async def _obtener_digesto(hechos: str) -> str:
+    """Digesto en caché o en curso para estos hechos; corre siempre en el bucle del gateway"""
+    clave = huella_hechos(hechos)
+    futuro = _digestos.get(clave)
+    if futuro is None or (futuro.done() and (futuro.cancelled() or futuro.exception() is not None)):
+        futuro = asyncio.ensure_future(_calcular_digesto(hechos))
+        _digestos[clave] = futuro
+        while len(_digestos) > MAX_DIGESTOS_EN_MEMORIA:
+            _digestos.popitem(last=False)
+    _digestos.move_to_end(clave)
+    # shield: si un llamador se cancela, el digesto sigue calculándose para los demás
+    return await asyncio.shield(futuro)
+
+
+async def digerir_hechos_async(hechos: str) -> str:
+    """
+    Digesto estructurado y acotado de los hechos del caso.
+
+    Los hechos cortos se devuelven tal cual. Los largos (p. ej. un expediente
+    completo) se fragmentan, se extrae lo relevante de cada fragmento en
+    paralelo y se consolida en un digesto de tamaño fijo (max_tokens de la
+    etapa "digesto"). El resultado se reutiliza por huella del texto, así que
+    las 12 secciones de un caso lo calculan una sola vez.
+    """
+    if len(hechos) <= UMBRAL_CARACTERES:
+        return hechos
+    return await esperar(_obtener_digesto(hechos))
+
+
+def digerir_hechos(hechos: str) -> str:
+    """Versión síncrona de digerir_hechos_async"""
+    if len(hechos) <= UMBRAL_CARACTERES:
+        return hechos
+    return ejecutar(_obtener_digesto(hechos))
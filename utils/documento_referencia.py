@@ -3,13 +3,11 @@
 import streamlit as st
 import os
 import tempfile
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional
 from utils.expediente import extraer_texto_pdf, extraer_texto_pdf_ocr
-from dotenv import load_dotenv
-from openai import OpenAI
-
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from utils.digesto import digerir_hechos, digerir_hechos_async
+from utils.llm import completar_async, completar_stream, ejecutar
+from utils.prompts import contexto_caso, mensajes_con_prefijo
 
 # Estructura de secciones estándar
 SECCIONES_ESTANDAR = {
@@ -63,15 +61,12 @@ SECCIONES_ESTANDAR = {
     }
 }
 
-def extraer_patrones_documento(texto_documento: str) -> Dict[str, str]:
+async def extraer_patrones_documento_async(texto_documento: str) -> Dict[str, str]:
     """
-    Extrae patrones de redacción de cada sección del documento de referencia usando IA.
+    Versión asíncrona de extraer_patrones_documento.
     
-    Args:
-        texto_documento: Texto completo del documento de referencia
-        
-    Returns:
-        Diccionario con patrones de redacción por sección
+    A diferencia de la versión síncrona, propaga los errores de la API o del
+    JSON devuelto para que el llamador decida cómo manejarlos.
     """
     prompt = f"""
 Eres un experto en análisis de documentos legales. Analiza el siguiente documento de referencia de una demanda laboral y extrae para cada una de las siguientes secciones:
@@ -114,33 +109,39 @@ Responde en formato JSON con la siguiente estructura:
 Solo incluye las secciones que encuentres en el documento.
 """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Eres un experto en análisis de documentos legales colombianos. Extraes patrones de redacción de manera precisa y estructurada."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=4000
-        )
-        
-        import json
-        # Intentar parsear el JSON de la respuesta
-        contenido = response.choices[0].message.content.strip()
-        
-        # Limpiar el contenido si tiene markdown
-        if contenido.startswith("```json"):
-            contenido = contenido[7:]
-        if contenido.startswith("```"):
-            contenido = contenido[3:]
-        if contenido.endswith("```"):
-            contenido = contenido[:-3]
-        contenido = contenido.strip()
-        
-        patrones = json.loads(contenido)
-        return patrones
+    contenido = await completar_async(
+        "patrones",
+        [
+            {"role": "system", "content": "Eres un experto en análisis de documentos legales colombianos. Extraes patrones de redacción de manera precisa y estructurada."},
+            {"role": "user", "content": prompt}
+        ]
+    )
+    
+    import json
+    
+    # Limpiar el contenido si tiene markdown
+    if contenido.startswith("```json"):
+        contenido = contenido[7:]
+    if contenido.startswith("```"):
+        contenido = contenido[3:]
+    if contenido.endswith("```"):
+        contenido = contenido[:-3]
+    contenido = contenido.strip()
+    
+    return json.loads(contenido)
+
+def extraer_patrones_documento(texto_documento: str) -> Dict[str, str]:
+    """
+    Extrae patrones de redacción de cada sección del documento de referencia usando IA.
+    
+    Args:
+        texto_documento: Texto completo del documento de referencia
         
+    Returns:
+        Diccionario con patrones de redacción por sección
+    """
+    try:
+        return ejecutar(extraer_patrones_documento_async(texto_documento))
     except Exception as e:
         st.error(f"Error al extraer patrones: {str(e)}")
         return {}
@@ -240,28 +241,15 @@ def cargar_documento_referencia() -> Optional[str]:
     
     return texto_documento
 
-def generar_seccion_con_referencia(
+def _mensajes_seccion_con_referencia(
     seccion: str, 
     hechos: str, 
     resumen: str, 
     concepto: str, 
     patrones_referencia: Dict[str, Dict] = None,
     comentario_usuario: str = ""
-) -> str:
-    """
-    Genera una sección usando patrones extraídos del documento de referencia.
-    
-    Args:
-        seccion: Nombre de la sección a generar
-        hechos: Hechos del caso
-        resumen: Resumen técnico
-        concepto: Concepto de viabilidad
-        patrones_referencia: Patrones extraídos del documento de referencia
-        comentario_usuario: Comentarios adicionales del usuario
-        
-    Returns:
-        Texto generado para la sección
-    """
+) -> List[Dict[str, str]]:
+    """Construye los mensajes del prompt de una sección con patrones de referencia"""
     # Obtener información de la sección estándar
     info_seccion = SECCIONES_ESTANDAR.get(seccion, {})
     
@@ -284,21 +272,21 @@ GUÍA PARA ESTA SECCIÓN:
 - Contenido típico: {info_seccion.get('contenido_tipico', '')}
 """
     
-    prompt = f"""
-Eres un abogado litigante colombiano experto en derecho laboral. Redacta SOLO la sección "{seccion}" de una demanda laboral por contrato realidad.
-
-HECHOS DEL CASO:
-{hechos}
-
-RESUMEN TÉCNICO:
-{resumen}
+    bloque_comentario = f"COMENTARIOS ADICIONALES DEL USUARIO:\n{comentario_usuario}" if comentario_usuario else ""
+    
+    # Contexto del caso primero (idéntico en las 12 secciones); patrón e instrucciones al final
+    contexto = contexto_caso(
+        ("HECHOS DEL CASO", hechos),
+        ("RESUMEN TÉCNICO", resumen),
+        ("CONCEPTO DE VIABILIDAD", concepto),
+    )
 
-CONCEPTO DE VIABILIDAD:
-{concepto}
+    instruccion = f"""
+Eres un abogado litigante colombiano experto en derecho laboral. Redacta SOLO la sección "{seccion}" de una demanda laboral por contrato realidad, con base en el caso anterior.
 
 {contexto_referencia}
 
-{f"COMENTARIOS ADICIONALES DEL USUARIO:\n{comentario_usuario}" if comentario_usuario else ""}
+{bloque_comentario}
 
 INSTRUCCIONES:
 - Sigue la estructura y estilo del patrón de referencia si está disponible
@@ -309,15 +297,70 @@ INSTRUCCIONES:
 - Si no hay patrón de referencia, usa las mejores prácticas legales colombianas
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Actúas como abogado litigante experto en demandas laborales por contrato realidad. Redactas secciones siguiendo patrones de referencia cuando están disponibles."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-        max_tokens=5000
+    return mensajes_con_prefijo(
+        "Actúas como abogado litigante experto en demandas laborales por contrato realidad. Redactas secciones siguiendo patrones de referencia cuando están disponibles.",
+        contexto,
+        instruccion
+    )
+
+async def generar_seccion_con_referencia_async(
+    seccion: str, 
+    hechos: str, 
+    resumen: str, 
+    concepto: str, 
+    patrones_referencia: Dict[str, Dict] = None,
+    comentario_usuario: str = ""
+) -> str:
+    """Versión asíncrona de generar_seccion_con_referencia"""
+    hechos = await digerir_hechos_async(hechos)
+    return await completar_async(
+        "seccion_referencia",
+        _mensajes_seccion_con_referencia(seccion, hechos, resumen, concepto, patrones_referencia, comentario_usuario)
+    )
+
+def generar_seccion_con_referencia(
+    seccion: str, 
+    hechos: str, 
+    resumen: str, 
+    concepto: str, 
+    patrones_referencia: Dict[str, Dict] = None,
+    comentario_usuario: str = ""
+) -> str:
+    """
+    Genera una sección usando patrones extraídos del documento de referencia.
+    
+    Args:
+        seccion: Nombre de la sección a generar
+        hechos: Hechos del caso
+        resumen: Resumen técnico
+        concepto: Concepto de viabilidad
+        patrones_referencia: Patrones extraídos del documento de referencia
+        comentario_usuario: Comentarios adicionales del usuario
+        
+    Returns:
+        Texto generado para la sección
+    """
+    return ejecutar(
+        generar_seccion_con_referencia_async(seccion, hechos, resumen, concepto, patrones_referencia, comentario_usuario)
     )
 
-    return response.choices[0].message.content.strip()
+def generar_seccion_con_referencia_stream(
+    seccion: str, 
+    hechos: str, 
+    resumen: str, 
+    concepto: str, 
+    patrones_referencia: Dict[str, Dict] = None,
+    comentario_usuario: str = ""
+) -> Iterator[str]:
+    """
+    Versión en streaming de generar_seccion_con_referencia.
+    
+    Returns:
+        Iterador de fragmentos de texto a medida que los genera el modelo
+    """
+    hechos = digerir_hechos(hechos)
+    return completar_stream(
+        "seccion_referencia",
+        _mensajes_seccion_con_referencia(seccion, hechos, resumen, concepto, patrones_referencia, comentario_usuario)
+    )
 
@@ -0,0 +1,176 @@
+# utils/embeddings.py
+
+import abc
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils.indice_lexico import plegar_acentos, terminos
+from utils.llm import obtener_gateway
+
+# Backend de embeddings: "openai" (API) o "local" (CPU, sin llamadas de red)
+BACKEND = os.getenv("EMBEDDINGS_BACKEND", "openai").lower()
+# Caché en memoria de embeddings por texto, compartida por todas las sesiones
+CACHE_MAX_ENTRADAS = int(os.getenv("EMBEDDINGS_CACHE_MAX_ENTRADAS", "20000"))
+
+# Backend local: dimensión de salida, textos por lote y hilos de CPU
+LOCAL_DIMENSION = int(os.getenv("EMBEDDINGS_LOCAL_DIMENSION", "384"))
+LOCAL_LOTE = int(os.getenv("EMBEDDINGS_LOCAL_LOTE", "256"))
+LOCAL_HILOS = int(os.getenv("EMBEDDINGS_LOCAL_HILOS", str(min(4, os.cpu_count() or 1))))
+LOCAL_RASGOS = 2 ** 18
+
+
+def _huella(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class Embedder(abc.ABC):
+    """
+    Interfaz de los backends de embeddings del RAG vectorial.
+
+    Las subclases implementan ``_calcular_async``; esta clase añade la caché
+    LRU por texto y la deduplicación. ``modelo`` identifica el espacio
+    vectorial: el índice se reconstruye si cambia.
+    """
+
+    nombre = "base"
+    modelo = ""
+
+    def __init__(self, cache_max_entradas: int = CACHE_MAX_ENTRADAS):
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_max = cache_max_entradas
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    async def _calcular_async(self, textos: List[str]) -> np.ndarray:
+        """Embeddings de textos sin repetir, (n, d) float32 en el mismo orden"""
+
+    async def embeber_lotes_async(self, textos: List[str], usar_cache: bool = True) -> np.ndarray:
+        """
+        Embeddings de una lista de textos, (n, d) float32, en el mismo orden.
+
+        Solo se calculan los textos que no están en la caché (una vez cada uno).
+        Con ``usar_cache=False`` (construcción de índices) la caché no se
+        consulta ni se llena: los vectores del corpus ya quedan en el índice,
+        y guardarlos aquí desplazaría a los de las consultas.
+        """
+        huellas = [_huella(texto) for texto in textos]
+        pendientes: Dict[str, str] = {}
+        resultado: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for huella, texto in zip(huellas, textos):
+                if usar_cache and huella in self._cache:
+                    self._cache.move_to_end(huella)
+                    resultado[huella] = self._cache[huella]
+                elif huella not in resultado:
+                    pendientes[huella] = texto
+        if pendientes:
+            vectores = np.asarray(await self._calcular_async(list(pendientes.values())), dtype=np.float32)
+            with self._lock:
+                for huella, vector in zip(pendientes, vectores):
+                    resultado[huella] = vector
+                    if usar_cache:
+                        self._cache[huella] = vector
+                while len(self._cache) > self._cache_max:
+                    self._cache.popitem(last=False)
+        if not huellas:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([resultado[huella] for huella in huellas])
+
+    async def embeber_async(self, texto: str) -> np.ndarray:
+        """Embedding de un solo texto, (d,) float32"""
+        return (await self.embeber_lotes_async([texto]))[0]
+
+
+class EmbedderOpenAI(Embedder):
+    """Embeddings de la API de OpenAI a través del gateway (lotes, concurrencia y métricas del gateway)"""
+
+    nombre = "openai"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.gateway = obtener_gateway()
+
+    @property
+    def modelo(self) -> str:
+        return self.gateway.parametros("embeddings")["model"]
+
+    async def _calcular_async(self, textos: List[str]) -> np.ndarray:
+        return np.asarray(await self.gateway.embeber_lotes_async(textos), dtype=np.float32)
+
+
+def _rasgos_texto(texto: str) -> List[str]:
+    """Rasgos del vectorizador local: términos con raíz, bigramas de términos y 4-gramas de caracteres"""
+    palabras = terminos(texto)
+    rasgos = palabras + [f"{a} {b}" for a, b in zip(palabras, palabras[1:])]
+    for palabra in plegar_acentos(texto).split():
+        palabra = f"#{palabra}#"
+        rasgos += [palabra[i:i + 4] for i in range(max(1, len(palabra) - 3))]
+    return rasgos
+
+
+class EmbedderLocal(Embedder):
+    """
+    Embeddings locales en CPU con scikit-learn, sin llamadas a la API.
+
+    Vectoriza por hashing (términos, bigramas y n-gramas de caracteres, con
+    tf sublineal) y proyecta a LOCAL_DIMENSION dimensiones con una proyección
+    aleatoria dispersa de semilla fija. No necesita entrenamiento, así que el
+    vector de un texto no depende del resto del corpus y el índice se sigue
+    actualizando de forma incremental. Capta coincidencia léxica y
+    morfológica, no sinónimos: es más rápido y gratuito, pero de menor
+    calidad semántica que la API (ver benchmark_embeddings.py).
+    """
+
+    nombre = "local"
+
+    def __init__(self, dimension: int = LOCAL_DIMENSION, lote: int = LOCAL_LOTE, hilos: int = LOCAL_HILOS, **kwargs):
+        super().__init__(**kwargs)
+        from scipy import sparse
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.random_projection import SparseRandomProjection
+
+        self.dimension = dimension
+        self.lote = lote
+        self.modelo = f"local-hashing-{LOCAL_RASGOS}-{dimension}"
+        self._vectorizador = HashingVectorizer(
+            analyzer=_rasgos_texto, n_features=LOCAL_RASGOS, alternate_sign=False, norm=None
+        )
+        # La proyección solo depende de la forma de la entrada y de la semilla
+        self._proyeccion = SparseRandomProjection(n_components=dimension, dense_output=True, random_state=0)
+        self._proyeccion.fit(sparse.csr_matrix((1, LOCAL_RASGOS), dtype=np.float32))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, hilos), thread_name_prefix="embeddings-local")
+
+    def _calcular(self, textos: List[str]) -> np.ndarray:
+        matriz = self._vectorizador.transform(textos).astype(np.float32)
+        matriz.data = 1 + np.log(matriz.data)
+        return self._proyeccion.transform(matriz).astype(np.float32)
+
+    async def _calcular_async(self, textos: List[str]) -> np.ndarray:
+        bucle = asyncio.get_running_loop()
+        lotes = [textos[i:i + self.lote] for i in range(0, len(textos), self.lote)]
+        partes = await asyncio.gather(*(bucle.run_in_executor(self._executor, self._calcular, lote) for lote in lotes))
+        return np.concatenate(partes) if partes else np.zeros((0, self.dimension), dtype=np.float32)
+
+
+BACKENDS = {"openai": EmbedderOpenAI, "local": EmbedderLocal}
+
+_embedders: Dict[str, Embedder] = {}
+_embedders_lock = threading.Lock()
+
+
+def obtener_embedder(backend: Optional[str] = None) -> Embedder:
+    """Embedder compartido por todo el proceso para el backend indicado (por defecto EMBEDDINGS_BACKEND)"""
+    backend = (backend or BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+    with _embedders_lock:
+        if backend not in _embedders:
+            _embedders[backend] = BACKENDS[backend]()
+        return _embedders[backend]
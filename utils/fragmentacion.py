@@ -0,0 +1,134 @@
+# utils/fragmentacion.py
+
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+from utils.planificador import CARACTERES_POR_TOKEN, estimar_tokens_texto
+
+# Tamaño máximo de cada fragmento del corpus vectorial y solapamiento entre fragmentos consecutivos
+FRAGMENTO_TOKENS = int(os.getenv("VECTOR_FRAGMENTO_TOKENS", "400"))
+SOLAPAMIENTO_TOKENS = int(os.getenv("VECTOR_SOLAPAMIENTO_TOKENS", "60"))
+
+# Separador de id entre el documento fuente y el número de fragmento ("fuente#3")
+SEPARADOR_FRAGMENTO = "#"
+
+# Títulos habituales de sentencias y normas: abren un apartado nuevo
+_TITULO = re.compile(
+    r"^\s*(?:"
+    r"(?:CAP[IÍ]TULO|T[IÍ]TULO|ART[IÍ]CULO|SECCI[OÓ]N|PAR[AÁ]GRAFO)\b"
+    r"|(?:ANTECEDENTES|HECHOS|CONSIDERACIONES|PROBLEMA JUR[IÍ]DICO|DECISI[OÓ]N|RESUELVE|FALLA)\b"
+    r"|(?:PRIMERO|SEGUNDO|TERCERO|CUARTO|QUINTO|SEXTO|S[EÉ]PTIMO|OCTAVO|NOVENO|D[EÉ]CIMO)[.:]"
+    r"|(?:[IVXLC]+|\d+(?:\.\d+)*)[.)-]\s"
+    r"|[^a-záéíóúñ\n]{3,80}$"
+    r")"
+)
+_FIN_ORACION = re.compile(r"(?<=[.;:!?])\s+")
+
+
+def es_titulo(linea: str) -> bool:
+    """True si la línea parece un encabezado (mayúsculas, numeral romano/arábigo o palabra clave)"""
+    linea = linea.strip()
+    return bool(linea) and len(linea) <= 120 and bool(_TITULO.match(linea)) and any(c.isalpha() for c in linea)
+
+
+def _unidades(texto: str, max_tokens: int) -> List[Tuple[int, int, bool]]:
+    """
+    Dividir el texto en unidades (inicio, fin, es_titulo) que no superan ``max_tokens``.
+
+    La unidad natural es el párrafo (línea); un párrafo demasiado largo se
+    divide por oraciones y, si una oración sigue siendo demasiado larga, por
+    caracteres.
+    """
+    max_caracteres = max_tokens * CARACTERES_POR_TOKEN
+    unidades: List[Tuple[int, int, bool]] = []
+    for linea in re.finditer(r"[^\n]+", texto):
+        if not linea.group().strip():
+            continue
+        inicio, fin = linea.span()
+        if estimar_tokens_texto(linea.group()) <= max_tokens:
+            unidades.append((inicio, fin, es_titulo(linea.group())))
+            continue
+        cortes = [inicio] + [inicio + m.end() for m in _FIN_ORACION.finditer(linea.group())] + [fin]
+        for a, b in zip(cortes, cortes[1:]):
+            while b - a > max_caracteres:
+                unidades.append((a, a + max_caracteres, False))
+                a += max_caracteres
+            if b > a:
+                unidades.append((a, b, False))
+    return unidades
+
+
+def fragmentar_texto(
+    texto: str,
+    max_tokens: int = FRAGMENTO_TOKENS,
+    solapamiento: int = SOLAPAMIENTO_TOKENS,
+) -> List[Tuple[int, int]]:
+    """
+    Fragmentos (inicio, fin) de un texto largo, acotados en tokens y con solapamiento.
+
+    Los cortes caen en límites de párrafo (o de oración, dentro de párrafos
+    muy largos), y un encabezado empieza fragmento nuevo si el actual ya va
+    por la mitad. Cada fragmento repite las últimas unidades del anterior hasta
+    ``solapamiento`` tokens, para no partir un razonamiento entre dos fragmentos.
+    Los desplazamientos son sobre el texto original: ``texto[inicio:fin]``.
+    """
+    unidades = _unidades(texto, max_tokens)
+    tokens = [estimar_tokens_texto(texto[a:b]) for a, b, _ in unidades]
+    fragmentos: List[Tuple[int, int]] = []
+    primera = 0
+    while primera < len(unidades):
+        ultima, total = primera, tokens[primera]
+        while ultima + 1 < len(unidades):
+            siguiente = ultima + 1
+            if total + tokens[siguiente] > max_tokens:
+                break
+            if unidades[siguiente][2] and total >= max_tokens // 2:
+                break
+            ultima, total = siguiente, total + tokens[siguiente]
+        fragmentos.append((unidades[primera][0], unidades[ultima][1]))
+        if ultima + 1 >= len(unidades):
+            break
+        # El siguiente fragmento retrocede hasta `solapamiento` tokens, pero siempre avanza
+        inicio_siguiente, repetidos = ultima + 1, 0
+        while (
+            inicio_siguiente - 1 > primera
+            and not unidades[inicio_siguiente][2]
+            and repetidos + tokens[inicio_siguiente - 1] <= solapamiento
+        ):
+            inicio_siguiente -= 1
+            repetidos += tokens[inicio_siguiente]
+        primera = inicio_siguiente
+    return fragmentos
+
+
+def fragmentar_documento(
+    documento: Dict[str, Any],
+    max_tokens: int = FRAGMENTO_TOKENS,
+    solapamiento: int = SOLAPAMIENTO_TOKENS,
+) -> List[Dict[str, Any]]:
+    """
+    Documentos del índice vectorial para un documento fuente.
+
+    Un documento que cabe en un fragmento se conserva con su id; uno largo se
+    divide en fragmentos "id#n". Cada fragmento lleva la metadata de la
+    fuente, el id de la fuente ("fuente_id") y sus desplazamientos en el texto
+    original ("inicio", "fin").
+    """
+    texto = documento["content"]
+    if estimar_tokens_texto(texto) <= max_tokens:
+        cortes = [(0, len(texto))]
+    else:
+        cortes = fragmentar_texto(texto, max_tokens, solapamiento) or [(0, len(texto))]
+    fragmentos = []
+    for n, (inicio, fin) in enumerate(cortes):
+        fragmentos.append({
+            "id": documento["id"] if len(cortes) == 1 else f"{documento['id']}{SEPARADOR_FRAGMENTO}{n}",
+            "content": texto[inicio:fin],
+            "metadata": documento.get("metadata", {}),
+            "fuente_id": documento["id"],
+            "inicio": inicio,
+            "fin": fin,
+            "fragmentos_fuente": len(cortes),
+        })
+    return fragmentos
@@ -0,0 +1,25 @@
+# utils/fusion.py
+
+import os
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+# Constante k de Reciprocal Rank Fusion: amortigua el peso de los primeros puestos de cada ranking
+RRF_K = int(os.getenv("VECTOR_RRF_K", "60"))
+
+
+def fusion_rrf(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """
+    Combinar varios rankings con Reciprocal Rank Fusion.
+
+    Cada elemento suma 1 / (k + posición) por cada ranking en el que aparece
+    (posición desde 1). Solo usa posiciones, así que combina rankings con
+    puntajes no comparables (coseno de distintas consultas, BM25...).
+
+    Returns:
+        (elemento, puntaje RRF) de mayor a menor; los empates conservan el orden de aparición
+    """
+    puntajes: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for posicion, elemento in enumerate(ranking, 1):
+            puntajes[elemento] = puntajes.get(elemento, 0.0) + 1.0 / (k + posicion)
+    return sorted(puntajes.items(), key=lambda par: par[1], reverse=True)
@@ -0,0 +1,137 @@
+# utils/indice_ivf.py
+
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Número de listas (celdas); 0 = automático (≈ √n)
+IVF_LISTAS = int(os.getenv("VECTOR_IVF_LISTAS", "0"))
+# Listas que se revisan por consulta: más listas = más recall y más latencia
+IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+# Si el corpus crece más de este factor desde el entrenamiento, se reentrenan los centroides
+IVF_FACTOR_REENTRENAR = float(os.getenv("VECTOR_IVF_FACTOR_REENTRENAR", "4"))
+
+ITERACIONES_KMEANS = 10
+PUNTOS_POR_LISTA_ENTRENAMIENTO = 64
+FILAS_POR_BLOQUE = 65536
+
+
+def listas_automaticas(n: int) -> int:
+    """Número de listas por defecto para n vectores"""
+    return max(1, int(np.sqrt(n)))
+
+
+def _mas_cercano(vectores: np.ndarray, centroides: np.ndarray) -> np.ndarray:
+    """Centroide más similar (producto punto) de cada vector, por bloques para acotar memoria"""
+    asignacion = np.empty(vectores.shape[0], dtype=np.int32)
+    for inicio in range(0, vectores.shape[0], FILAS_POR_BLOQUE):
+        bloque = np.asarray(vectores[inicio:inicio + FILAS_POR_BLOQUE], dtype=np.float32)
+        asignacion[inicio:inicio + len(bloque)] = np.argmax(bloque @ centroides.T, axis=1)
+    return asignacion
+
+
+class IndiceIVF:
+    """
+    Índice aproximado IVF (inverted file) sobre vectores normalizados.
+
+    Un k-means esférico reparte los vectores en listas; cada consulta puntúa
+    solo las ``nprobe`` listas con centroide más cercano, en vez de todo el
+    corpus. ``nprobe`` regula el equilibrio recall/latencia en tiempo de
+    consulta. Los vectores en sí no se copian: el índice guarda solo
+    centroides y asignaciones, y puntúa sobre la matriz del IndiceVectorial.
+    """
+
+    def __init__(self, centroides: np.ndarray, asignacion: np.ndarray, entrenado_con: int):
+        self.centroides = np.asarray(centroides, dtype=np.float32)
+        self.entrenado_con = entrenado_con
+        self._fijar_asignacion(np.asarray(asignacion, dtype=np.int32))
+
+    def _fijar_asignacion(self, asignacion: np.ndarray):
+        self.asignacion = asignacion
+        # Filas agrupadas por lista: orden[inicios[l]:inicios[l + 1]] son las filas de la lista l
+        self.orden = np.argsort(asignacion, kind="stable")
+        self.inicios = np.searchsorted(asignacion[self.orden], np.arange(len(self.centroides) + 1))
+
+    @property
+    def n_listas(self) -> int:
+        return len(self.centroides)
+
+    @classmethod
+    def entrenar(cls, vectores: np.ndarray, n_listas: int = 0, semilla: int = 0) -> "IndiceIVF":
+        """Entrenar centroides (k-means esférico sobre una muestra) y asignar todos los vectores"""
+        n = vectores.shape[0]
+        n_listas = min(n, n_listas or listas_automaticas(n))
+        rng = np.random.default_rng(semilla)
+        tamano_muestra = min(n, n_listas * PUNTOS_POR_LISTA_ENTRENAMIENTO)
+        muestra = np.asarray(vectores[np.sort(rng.choice(n, tamano_muestra, replace=False))], dtype=np.float32)
+
+        centroides = muestra[rng.choice(tamano_muestra, n_listas, replace=False)].copy()
+        for _ in range(ITERACIONES_KMEANS):
+            asignacion = _mas_cercano(muestra, centroides)
+            sumas = np.zeros_like(centroides)
+            np.add.at(sumas, asignacion, muestra)
+            conteos = np.bincount(asignacion, minlength=n_listas)
+            vacias = conteos == 0
+            # Una lista vacía se reinicia en un punto al azar de la muestra
+            sumas[vacias] = muestra[rng.choice(tamano_muestra, int(vacias.sum()))]
+            normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+            centroides = sumas / np.maximum(normas, np.finfo(np.float32).tiny)
+
+        return cls(centroides, _mas_cercano(vectores, centroides), entrenado_con=n)
+
+    def necesita_reentrenar(self, n: int, dimension: int) -> bool:
+        """True si el corpus cambió tanto (o de dimensión) que conviene reentrenar los centroides"""
+        return dimension != self.centroides.shape[1] or n > self.entrenado_con * IVF_FACTOR_REENTRENAR
+
+    def reasignar(self, vectores: np.ndarray, origen: np.ndarray) -> "IndiceIVF":
+        """
+        Índice para un corpus actualizado sin reentrenar (inserciones incrementales).
+
+        Args:
+            vectores: Matriz completa del corpus actualizado
+            origen: Para cada fila, su fila en el corpus anterior o -1 si es nueva
+        """
+        asignacion = np.empty(len(origen), dtype=np.int32)
+        previas = origen >= 0
+        asignacion[previas] = self.asignacion[origen[previas]]
+        if not previas.all():
+            asignacion[~previas] = _mas_cercano(vectores[~previas], self.centroides)
+        return IndiceIVF(self.centroides, asignacion, self.entrenado_con)
+
+    def buscar(self, matriz: np.ndarray, consultas: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k aproximado para cada consulta (mismo contrato que indice_vectorial.top_k).
+
+        Returns:
+            (indices, puntajes), ambos (q, k); si hay menos de k candidatos se rellena con -1 / -inf
+        """
+        nprobe = min(self.n_listas, nprobe or IVF_NPROBE)
+        listas = np.argpartition(-(consultas @ self.centroides.T), nprobe - 1, axis=1)[:, :nprobe]
+        indices = np.full((consultas.shape[0], k), -1, dtype=np.int64)
+        puntajes = np.full((consultas.shape[0], k), -np.inf, dtype=np.float32)
+        for fila, (consulta, seleccion) in enumerate(zip(consultas, listas)):
+            candidatos = np.concatenate([self.orden[self.inicios[l]:self.inicios[l + 1]] for l in seleccion])
+            if not len(candidatos):
+                continue
+            candidatos.sort()  # lectura secuencial de la matriz (memory-map)
+            valores = matriz[candidatos] @ consulta
+            kk = min(k, len(candidatos))
+            mejores = np.argpartition(-valores, kk - 1)[:kk] if kk < len(candidatos) else np.arange(len(candidatos))
+            mejores = mejores[np.argsort(-valores[mejores])]
+            indices[fila, :kk] = candidatos[mejores]
+            puntajes[fila, :kk] = valores[mejores]
+        return indices, puntajes
+
+    def guardar(self, ruta: str):
+        tmp = ruta + ".tmp.npz"
+        np.savez(tmp, centroides=self.centroides, asignacion=self.asignacion, entrenado_con=self.entrenado_con)
+        os.replace(tmp, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> Optional["IndiceIVF"]:
+        try:
+            with np.load(ruta) as datos:
+                return cls(datos["centroides"], datos["asignacion"], int(datos["entrenado_con"]))
+        except (OSError, ValueError, KeyError):
+            return None
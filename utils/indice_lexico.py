@@ -0,0 +1,192 @@
+# utils/indice_lexico.py
+
+import os
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Parámetros de BM25: saturación de la frecuencia del término y normalización por longitud
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Palabras o identificadores: "c-614", "sl-1234", "2009", "articulo"
+_PALABRA = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a al algo ante antes como con contra cual cuando de del desde donde durante e el ella ellas ellos en entre era
+es esa esas ese eso esos esta estas este esto estos fue ha han hasta la las le les lo los mas me mi mientras muy
+ni no nos o os otra otro para pero por porque que se sea sean segun ser si sin sobre son su sus tambien te tiene
+tienen todo todos tras tu un una uno unos unas y ya
+""".split())
+
+# Sufijos flexivos y derivativos del español, de más largo a más corto (stemming ligero)
+_SUFIJOS = (
+    "amientos", "imientos", "aciones", "uciones", "amiento", "imiento", "idades", "mente",
+    "acion", "ucion", "ancia", "encia", "adora", "adores", "ador", "ante", "antes",
+    "ables", "ibles", "able", "ible", "istas", "ista", "ivas", "ivos", "iva", "ivo",
+    "idad", "osas", "osos", "osa", "oso", "ando", "iendo", "adas", "idas", "ados", "idos",
+    "ada", "ida", "ado", "ido", "ar", "er", "ir",
+)
+
+
+class _TablaPlegado(dict):
+    """Tabla para str.translate: cada carácter se descompone (NFKD) una sola vez y sin sus diacríticos"""
+
+    def __missing__(self, codigo: int) -> str:
+        plegado = "".join(c for c in unicodedata.normalize("NFKD", chr(codigo)) if not unicodedata.combining(c))
+        self[codigo] = plegado
+        return plegado
+
+
+_PLEGADO = _TablaPlegado()
+
+
+def plegar_acentos(texto: str) -> str:
+    """Minúsculas y sin diacríticos ("Artículo" -> "articulo", "ñ" -> "n")"""
+    return texto.lower().translate(_PLEGADO)
+
+
+@lru_cache(maxsize=65536)
+def raiz(palabra: str) -> str:
+    """Stemming ligero del español: quita plural y un sufijo frecuente conservando al menos 4 letras"""
+    if any(c.isdigit() for c in palabra) or len(palabra) <= 4:
+        return palabra
+    if palabra.endswith("es") and len(palabra) > 5:
+        palabra = palabra[:-2]
+    elif palabra.endswith("s"):
+        palabra = palabra[:-1]
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 4:
+            palabra = palabra[:-len(sufijo)]
+            break
+    if palabra[-1] in "aeo" and len(palabra) > 4:
+        palabra = palabra[:-1]
+    return palabra
+
+
+def terminos(texto: str) -> List[str]:
+    """
+    Términos indexables de un texto: plegado de acentos, sin palabras vacías y con raíz.
+
+    Los identificadores compuestos ("C-614", "SL-1234") se indexan completos y
+    también por partes, de modo que "C-614" y "614" los encuentran.
+    """
+    salida: List[str] = []
+    for palabra in _PALABRA.findall(plegar_acentos(texto)):
+        if "-" in palabra:
+            salida.append(palabra)
+            salida.extend(parte for parte in palabra.split("-") if parte not in STOPWORDS)
+        elif palabra not in STOPWORDS:
+            salida.append(raiz(palabra))
+    return salida
+
+
+class IndiceBM25:
+    """
+    Índice invertido en memoria con puntuación BM25.
+
+    Cada término guarda su lista de documentos y frecuencias. El peso BM25 de
+    cada aparición (idf y normalización por longitud incluidos) se calcula la
+    primera vez que se consulta el término y queda guardado, así que una
+    consulta solo suma los arreglos de sus términos y hace una selección
+    parcial top-k.
+
+    Admite inserciones incrementales (``agregar``): las apariciones nuevas se
+    acumulan aparte y se compactan al consultar el término; como cambian el
+    número de documentos y la longitud media, los pesos guardados se
+    descartan y se recalculan bajo demanda.
+    """
+
+    def __init__(self, ids: Sequence[str], textos: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self._longitudes = np.zeros(max(16, len(ids)), dtype=np.float32)
+        self._suma_longitudes = 0.0
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._pendientes: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._pesos: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.agregar(ids, textos)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def agregar(self, ids: Sequence[str], textos: Sequence[str]):
+        """Indexar documentos nuevos (el costo es proporcional a su texto, no al tamaño del índice)"""
+        with self._lock:
+            for doc_id, texto in zip(ids, textos):
+                fila = len(self.ids)
+                self.ids.append(doc_id)
+                if fila >= len(self._longitudes):
+                    self._longitudes = np.concatenate([self._longitudes, np.zeros_like(self._longitudes)])
+                terminos_doc = terminos(texto)
+                self._longitudes[fila] = len(terminos_doc)
+                self._suma_longitudes += len(terminos_doc)
+                frecuencias: Dict[str, int] = {}
+                for termino in terminos_doc:
+                    frecuencias[termino] = frecuencias.get(termino, 0) + 1
+                for termino, tf in frecuencias.items():
+                    filas, tfs = self._pendientes.setdefault(termino, ([], []))
+                    filas.append(fila)
+                    tfs.append(tf)
+            self._pesos.clear()
+
+    def _pesos_termino(self, termino: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(filas, pesos BM25) de un término con las estadísticas actuales del índice"""
+        guardado = self._pesos.get(termino)
+        if guardado is not None:
+            return guardado
+        pendientes = self._pendientes.pop(termino, None)
+        if pendientes is not None:
+            filas = np.asarray(pendientes[0], dtype=np.int32)
+            tfs = np.asarray(pendientes[1], dtype=np.float32)
+            if termino in self._postings:
+                filas = np.concatenate([self._postings[termino][0], filas])
+                tfs = np.concatenate([self._postings[termino][1], tfs])
+            self._postings[termino] = (filas, tfs)
+        if termino not in self._postings:
+            return None
+        filas, tf = self._postings[termino]
+        n = len(self.ids)
+        longitud_media = self._suma_longitudes / n if n and self._suma_longitudes > 0 else 1.0
+        idf = np.log(1 + (n - len(filas) + 0.5) / (len(filas) + 0.5))
+        pesos = idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self._longitudes[filas] / longitud_media))
+        self._pesos[termino] = guardado = (filas, pesos.astype(np.float32))
+        return guardado
+
+    def buscar_pagina(self, consulta: str, desde: int, k: int) -> Tuple[int, List[Tuple[str, float]]]:
+        """
+        Una página del ranking BM25 de la consulta.
+
+        Returns:
+            (total de documentos que contienen algún término, resultados [desde, desde + k) del ranking);
+            con k = 0 solo cuenta las coincidencias
+        """
+        with self._lock:
+            listas = [pesos for pesos in map(self._pesos_termino, set(terminos(consulta))) if pesos is not None]
+            n = len(self.ids)
+        if not listas:
+            return 0, []
+        puntajes = np.zeros(n, dtype=np.float32)
+        for filas, pesos in listas:
+            puntajes[filas] += pesos
+        candidatos = np.flatnonzero(puntajes)
+        total, hasta = len(candidatos), desde + k
+        if k <= 0 or desde >= total:
+            return total, []
+        if total > hasta:
+            # Se conservan todos los empatados con el último de la página: los empates se
+            # ordenan por fila, así que páginas consecutivas no repiten ni saltan documentos
+            umbral = -np.partition(-puntajes[candidatos], hasta - 1)[hasta - 1]
+            candidatos = candidatos[puntajes[candidatos] >= umbral]
+        candidatos = candidatos[np.argsort(-puntajes[candidatos], kind="stable")][desde:hasta]
+        return total, [(self.ids[i], float(puntajes[i])) for i in candidatos]
+
+    def buscar(self, consulta: str, k: int) -> List[Tuple[str, float]]:
+        """Los k documentos con mayor puntaje BM25 para la consulta (solo los que contienen algún término)"""
+        return self.buscar_pagina(consulta, 0, k)[1]
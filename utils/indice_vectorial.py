@@ -0,0 +1,599 @@
+# utils/indice_vectorial.py
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import IO, Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from utils.cuantizacion import VectoresCuantizados
+from utils.indice_ivf import IVF_LISTAS, IndiceIVF
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candados entre procesos
+    fcntl = None
+
+# Directorio de los índices en disco (uno por corpus)
+DIRECTORIO_INDICES = os.getenv("VECTOR_INDICE_DIR", os.path.join(".cache", "indice_vectorial"))
+
+ARCHIVO_MANIFIESTO = "manifiesto.json"
+# Nombres fijos de los manifiestos anteriores; ahora cada construcción escribe
+# archivos con nombre único ("vectores-*.f32", matriz float32 sin cabecera cuyas
+# filas y dimensión van en el manifiesto, "ivf-*.npz", "cuantizados-*.npz")
+ARCHIVO_VECTORES = "vectores.f32"
+ARCHIVO_VECTORES_NPY = "vectores.npy"
+ARCHIVO_IVF = "ivf.npz"
+ARCHIVO_CUANTIZADOS = "cuantizados.npz"
+# Candado de la construcción (exclusivo) y reserva de la ingesta masiva (compartida)
+ARCHIVO_CANDADO = ".construccion.lock"
+ARCHIVO_RESERVA = ".reserva.lock"
+
+# Búsqueda aproximada (ANN): "auto" la activa a partir de ANN_MIN_DOCUMENTOS, "exacto" la desactiva, "ivf" la fuerza
+MODO_ANN = os.getenv("VECTOR_ANN", "auto").lower()
+ANN_MIN_DOCUMENTOS = int(os.getenv("VECTOR_ANN_MIN_DOCUMENTOS", "20000"))
+
+# Almacenamiento cuantizado para la búsqueda exhaustiva: "" (float32), "int8" o "binaria"
+MODO_CUANTIZACION = os.getenv("VECTOR_CUANTIZACION", "").lower()
+# Candidatos por resultado que se reordenan con los vectores float32
+FACTOR_REORDENAR = int(os.getenv("VECTOR_FACTOR_REORDENAR", "10"))
+
+
+def bloquear_archivo(ruta: str, exclusivo: bool = True, esperar: bool = True) -> Optional[IO]:
+    """
+    Abrir ``ruta`` con un candado entre procesos (flock); cerrar el archivo lo suelta.
+
+    Returns:
+        El archivo abierto, o None si el candado está tomado y no se espera
+    """
+    archivo = open(ruta, "a+b")
+    if fcntl is None:
+        return archivo
+    try:
+        fcntl.flock(archivo, (fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH) | (0 if esperar else fcntl.LOCK_NB))
+    except BlockingIOError:
+        archivo.close()
+        return None
+    return archivo
+
+
+def hash_contenido(texto: str) -> str:
+    """Huella SHA-256 del texto de un documento"""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def _hash_documento(documento: Dict[str, Any]) -> str:
+    """Huella ya calculada del documento ("hash") o la de su contenido"""
+    return documento.get("hash") or hash_contenido(documento["content"])
+
+
+def normalizar(vectores: np.ndarray) -> np.ndarray:
+    """Normalizar filas a norma 1 (float32), de modo que el producto punto sea la similitud coseno"""
+    vectores = np.asarray(vectores, dtype=np.float32)
+    normas = np.linalg.norm(vectores, axis=-1, keepdims=True)
+    return vectores / np.maximum(normas, np.finfo(np.float32).tiny)
+
+
+def top_k(matriz: np.ndarray, consultas: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Los k documentos más similares a cada consulta.
+
+    Args:
+        matriz: Embeddings normalizados del corpus, (n, d) float32
+        consultas: Embeddings normalizados de las consultas, (q, d) float32
+        k: Resultados por consulta
+
+    Returns:
+        (indices, puntajes), ambos (q, k), ordenados de mayor a menor similitud
+    """
+    n = matriz.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        vacio = np.zeros((consultas.shape[0], 0))
+        return vacio.astype(np.int64), vacio.astype(np.float32)
+    # Un solo producto matriz-matriz puntúa todas las consultas contra todo el corpus
+    puntajes = consultas @ matriz.T
+    if k < n:
+        candidatos = np.argpartition(-puntajes, k - 1, axis=1)[:, :k]
+    else:
+        candidatos = np.broadcast_to(np.arange(n), (puntajes.shape[0], n))
+    puntajes_candidatos = np.take_along_axis(puntajes, candidatos, axis=1)
+    orden = np.argsort(-puntajes_candidatos, axis=1)
+    return np.take_along_axis(candidatos, orden, axis=1), np.take_along_axis(puntajes_candidatos, orden, axis=1)
+
+
+class InstantaneaIndice:
+    """
+    Estado inmutable de una construcción del índice.
+
+    Reúne la matriz, los ids y huellas, las estructuras de búsqueda (IVF,
+    códigos cuantizados) y los documentos con los que se construyó. Las
+    búsquedas se hacen sobre una instantánea: los ids que devuelve siempre
+    corresponden a sus propios documentos, aunque entretanto otra sesión
+    reconstruya el índice para un corpus distinto.
+    """
+
+    def __init__(
+        self,
+        modelo: Optional[str],
+        ids: List[str],
+        hashes: List[str],
+        vectores: np.ndarray,
+        ivf: Optional[IndiceIVF] = None,
+        cuantizados: Optional[VectoresCuantizados] = None,
+        construccion: Optional[Dict[str, Any]] = None,
+        documentos: Optional[List[Dict[str, Any]]] = None,
+        version: Optional[int] = None,
+    ):
+        self.modelo = modelo
+        self.ids = ids
+        self.hashes = hashes
+        self.vectores = vectores
+        self.ivf = ivf
+        self.cuantizados = cuantizados
+        # Datos de la construcción: textos embebidos, segundos y textos por segundo
+        self.construccion = construccion or {}
+        # Corpus de la construcción y versión de ese corpus (p. ej. la de la base de conocimiento)
+        self.documentos = documentos
+        self.version = version
+        self._por_id = {doc["id"]: doc for doc in documentos} if documentos is not None else {}
+
+    def con_documentos(self, documentos: List[Dict[str, Any]], version: Optional[int]) -> "InstantaneaIndice":
+        """La misma construcción asociada a su corpus (p. ej. tras cargarla del disco)"""
+        return InstantaneaIndice(
+            self.modelo, self.ids, self.hashes, self.vectores, self.ivf, self.cuantizados,
+            self.construccion, documentos, version
+        )
+
+    def vigente(self, documentos: List[Dict[str, Any]], modelo: str) -> bool:
+        """True si la instantánea corresponde exactamente a estos documentos y modelo"""
+        if self.modelo != modelo:
+            return False
+        if documentos is self.documentos:
+            return True
+        return (
+            self.ids == [doc["id"] for doc in documentos]
+            and self.hashes == [_hash_documento(doc) for doc in documentos]
+        )
+
+    def documento(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Documento de la construcción con ese id (None si no pertenece a ella)"""
+        return self._por_id.get(doc_id)
+
+    def buscar(self, consultas: np.ndarray, k: int, nprobe: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Buscar los k documentos más similares para una o varias consultas.
+
+        Args:
+            consultas: Un embedding (d,) o varios (q, d); no hace falta normalizarlos
+            k: Resultados por consulta
+            nprobe: Listas IVF a revisar (solo con índice aproximado; por defecto VECTOR_IVF_NPROBE)
+
+        Returns:
+            Por cada consulta, lista de (id de documento, similitud coseno) de mayor a menor
+        """
+        consultas = normalizar(np.atleast_2d(consultas))
+        if not len(self.ids):
+            return [[] for _ in range(consultas.shape[0])]
+        if self.ivf is not None:
+            indices, puntajes = self.ivf.buscar(self.vectores, consultas, k, nprobe)
+        elif self.cuantizados is not None:
+            indices, puntajes = self.cuantizados.buscar(self.vectores, consultas, k, FACTOR_REORDENAR)
+        else:
+            indices, puntajes = top_k(self.vectores, consultas, k)
+        return [
+            [(self.ids[i], float(p)) for i, p in zip(fila_indices, fila_puntajes) if i >= 0]
+            for fila_indices, fila_puntajes in zip(indices, puntajes)
+        ]
+
+
+class IndiceVectorial:
+    """
+    Índice persistente de embeddings de un corpus.
+
+    En disco guarda una matriz float32 (una fila por documento) y un
+    manifiesto con el modelo de embeddings y el id y la huella del contenido
+    de cada documento. Se carga con memory-map y solo se reconstruye si el
+    corpus o el modelo cambiaron, así que consultar cuesta un único embedding
+    (el de la consulta). Si el corpus solo creció al final, las filas nuevas
+    se anexan al archivo en lugar de reescribir la matriz.
+
+    Los vectores se guardan ya normalizados en una matriz contigua, y la
+    búsqueda es un único producto matricial más una selección parcial top-k.
+    En corpus grandes (ver VECTOR_ANN) se añade un índice IVF que limita la
+    búsqueda a las listas más cercanas a la consulta. Con VECTOR_CUANTIZACION
+    la búsqueda exhaustiva recorre códigos int8 o binarios en memoria y solo
+    lee del disco los vectores float32 de los candidatos finales.
+
+    Cada construcción es una InstantaneaIndice inmutable; preparar_async()
+    devuelve la vigente y las reconstrucciones la sustituyen sin modificarla.
+    Varios procesos (el servidor y la ingesta masiva) pueden compartir el
+    directorio: se lee sin candados y se reconstruye bajo un candado de archivo.
+    """
+
+    def __init__(self, nombre: str, directorio: str = DIRECTORIO_INDICES):
+        self.nombre = nombre
+        self.directorio = os.path.join(directorio, nombre)
+        # Última construcción (None hasta la primera carga o construcción)
+        self.actual: Optional[InstantaneaIndice] = None
+        self._lock: Optional[asyncio.Lock] = None
+        # Reservas de la construcción hechas por este proceso (ver reservar)
+        self._reservas = 0
+        self._reservas_lock = threading.Lock()
+
+    @property
+    def ruta_manifiesto(self) -> str:
+        return os.path.join(self.directorio, ARCHIVO_MANIFIESTO)
+
+    @property
+    def ruta_vectores(self) -> str:
+        """Archivo de vectores de la construcción en disco (según su manifiesto)"""
+        return os.path.join(self.directorio, self._archivos(self._leer_manifiesto() or {})["vectores"])
+
+    @property
+    def ruta_candado(self) -> str:
+        return os.path.join(self.directorio, ARCHIVO_CANDADO)
+
+    @property
+    def ruta_reserva(self) -> str:
+        return os.path.join(self.directorio, ARCHIVO_RESERVA)
+
+    @property
+    def construccion(self) -> Dict[str, Any]:
+        return self.actual.construccion if self.actual is not None else {}
+
+    @staticmethod
+    def usar_ann(n: int) -> bool:
+        """True si un corpus de n documentos debe llevar índice aproximado"""
+        if MODO_ANN == "ivf":
+            return n > 0
+        return MODO_ANN == "auto" and n >= ANN_MIN_DOCUMENTOS
+
+    @staticmethod
+    def _archivos(manifiesto: Dict[str, Any]) -> Dict[str, str]:
+        """Archivos de una construcción; los manifiestos anteriores usan los nombres fijos"""
+        vectores = ARCHIVO_VECTORES if manifiesto.get("formato") == "f32" else ARCHIVO_VECTORES_NPY
+        return {"vectores": vectores, "ivf": ARCHIVO_IVF, "cuantizados": ARCHIVO_CUANTIZADOS, **manifiesto.get("archivos", {})}
+
+    def _leer_manifiesto(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.ruta_manifiesto, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _mapear_vectores(self, archivo: str, filas: int, dimension: int) -> np.ndarray:
+        """Las primeras ``filas`` del archivo de vectores, con memory-map (las posteriores se ignoran)"""
+        if not filas or not dimension:
+            return np.zeros((filas, dimension), dtype=np.float32)
+        return np.memmap(os.path.join(self.directorio, archivo), dtype=np.float32, mode="r", shape=(filas, dimension))
+
+    def cargar(self) -> Optional[InstantaneaIndice]:
+        """
+        Leer el índice del disco (vectores con memory-map). None si no existe o está incompleto.
+
+        No toma el candado de construcción: el manifiesto se reemplaza de forma
+        atómica después de escribir los archivos que referencia, así que
+        siempre describe una construcción completa. Si entre leerlo y abrir sus
+        archivos otra construcción los reemplazó, se lee el manifiesto nuevo.
+        """
+        for _intento in range(2):
+            manifiesto = self._leer_manifiesto()
+            if manifiesto is None:
+                return None
+            try:
+                return self._cargar_manifiesto(manifiesto)
+            except (OSError, ValueError):
+                continue
+        return None
+
+    def _cargar_manifiesto(self, manifiesto: Dict[str, Any]) -> Optional[InstantaneaIndice]:
+        archivos = self._archivos(manifiesto)
+        documentos = manifiesto.get("documentos", [])
+        if manifiesto.get("formato") == "f32":
+            vectores = self._mapear_vectores(archivos["vectores"], len(documentos), int(manifiesto.get("dimension", 0)))
+        else:
+            vectores = np.load(os.path.join(self.directorio, archivos["vectores"]), mmap_mode="r")
+        if vectores.ndim != 2 or vectores.shape[0] != len(documentos) or not manifiesto.get("normalizado"):
+            return None
+        ivf = IndiceIVF.cargar(os.path.join(self.directorio, archivos["ivf"])) if manifiesto.get("ann") else None
+        cuantizados = None
+        if MODO_CUANTIZACION:
+            if manifiesto.get("cuantizacion") == MODO_CUANTIZACION:
+                cuantizados = VectoresCuantizados.cargar(os.path.join(self.directorio, archivos["cuantizados"]))
+            if cuantizados is None or cuantizados.codigos.shape[0] != vectores.shape[0]:
+                cuantizados = VectoresCuantizados.desde_vectores(MODO_CUANTIZACION, vectores)
+        return InstantaneaIndice(
+            manifiesto.get("modelo"),
+            [d["id"] for d in documentos],
+            [d["hash"] for d in documentos],
+            vectores,
+            ivf=ivf if ivf is not None and len(ivf.asignacion) == len(documentos) else None,
+            cuantizados=cuantizados,
+            construccion=manifiesto.get("construccion", {}),
+        )
+
+    @staticmethod
+    def _filas_conservables(manifiesto: Optional[Dict[str, Any]], instantanea: InstantaneaIndice, dimension: int) -> int:
+        """
+        Filas del archivo de vectores en disco que la nueva construcción puede conservar.
+
+        Son todas las del manifiesto si sus documentos (id y huella) son un
+        prefijo de los nuevos, con el mismo modelo y dimensión; si no, 0.
+        """
+        if (
+            manifiesto is None or manifiesto.get("formato") != "f32"
+            or manifiesto.get("modelo") != instantanea.modelo or manifiesto.get("dimension") != dimension
+        ):
+            return 0
+        documentos = manifiesto.get("documentos", [])
+        if len(documentos) > len(instantanea.ids) or any(
+            d["id"] != i or d["hash"] != h for d, i, h in zip(documentos, instantanea.ids, instantanea.hashes)
+        ):
+            return 0
+        return len(documentos)
+
+    def _archivo_unico(self, prefijo: str, sufijo: str) -> Tuple[int, str]:
+        """(descriptor, nombre) de un archivo nuevo del directorio, con nombre único entre procesos"""
+        fd, ruta = tempfile.mkstemp(prefix=prefijo, suffix=sufijo, dir=self.directorio)
+        return fd, os.path.basename(ruta)
+
+    def guardar(self, instantanea: InstantaneaIndice) -> InstantaneaIndice:
+        """
+        Escribir la construcción en disco, con el manifiesto al final.
+
+        Los archivos de cada construcción llevan nombres únicos y el
+        manifiesto, que los nombra, se reemplaza de forma atómica cuando ya
+        están completos; luego se borran los que ya no nombra. Si los
+        documentos del índice en disco son un prefijo de los nuevos, las filas
+        nuevas se anexan a su archivo de vectores: las filas que nombra el
+        manifiesto anterior no cambian, y las que haya más allá (p. ej. de una
+        escritura interrumpida) se descartan.
+
+        Se llama con el candado de construcción tomado (ver preparar_async).
+        Devuelve la instantánea con la matriz releída con memory-map, para
+        compartir las páginas entre sesiones.
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        previo = self._leer_manifiesto()
+        vectores = np.ascontiguousarray(instantanea.vectores, dtype=np.float32)
+        filas, dimension = (vectores.shape[0], vectores.shape[1]) if vectores.ndim == 2 else (0, 0)
+        conservadas = self._filas_conservables(previo, instantanea, dimension) if filas and dimension else 0
+        archivos: Dict[str, str] = {}
+        if conservadas:
+            archivos["vectores"] = self._archivos(previo)["vectores"]
+            with open(os.path.join(self.directorio, archivos["vectores"]), "r+b") as f:
+                f.truncate(conservadas * dimension * 4)
+                f.seek(0, os.SEEK_END)
+                f.write(vectores[conservadas:].tobytes())
+        else:
+            fd, archivos["vectores"] = self._archivo_unico("vectores-", ".f32")
+            with os.fdopen(fd, "wb") as f:
+                f.write(vectores.tobytes())
+        if instantanea.ivf is not None:
+            fd, archivos["ivf"] = self._archivo_unico("ivf-", ".npz")
+            os.close(fd)
+            instantanea.ivf.guardar(os.path.join(self.directorio, archivos["ivf"]))
+        if instantanea.cuantizados is not None:
+            fd, archivos["cuantizados"] = self._archivo_unico("cuantizados-", ".npz")
+            os.close(fd)
+            instantanea.cuantizados.guardar(os.path.join(self.directorio, archivos["cuantizados"]))
+        fd, tmp_manifiesto = self._archivo_unico("manifiesto-", ".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({
+                "modelo": instantanea.modelo,
+                "formato": "f32",
+                "dimension": dimension,
+                "filas": filas,
+                "normalizado": True,
+                "archivos": archivos,
+                "construccion": instantanea.construccion,
+                "ann": {"tipo": "ivf", "listas": instantanea.ivf.n_listas} if instantanea.ivf is not None else None,
+                "cuantizacion": instantanea.cuantizados.modo if instantanea.cuantizados is not None else None,
+                "documentos": [{"id": i, "hash": h} for i, h in zip(instantanea.ids, instantanea.hashes)],
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(os.path.join(self.directorio, tmp_manifiesto), self.ruta_manifiesto)
+        self._borrar_archivos_previos(set(archivos.values()))
+        return InstantaneaIndice(
+            instantanea.modelo, instantanea.ids, instantanea.hashes, self._mapear_vectores(archivos["vectores"], filas, dimension),
+            instantanea.ivf, instantanea.cuantizados, instantanea.construccion, instantanea.documentos, instantanea.version
+        )
+
+    def _borrar_archivos_previos(self, vigentes: set):
+        """Borrar los archivos de construcciones anteriores (o interrumpidas) que el manifiesto ya no nombra"""
+        for nombre in os.listdir(self.directorio):
+            if nombre.startswith(("vectores", "ivf", "cuantizados", "manifiesto-")) and nombre not in vigentes:
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except OSError:
+                    # Windows no borra archivos abiertos (p. ej. con memory-map): se reintenta en la próxima construcción
+                    pass
+
+    @contextlib.contextmanager
+    def reservar(self) -> Iterator[None]:
+        """
+        Reservar para este proceso la construcción del índice mientras dure el bloque.
+
+        Lo usa la ingesta masiva, que pone al día el índice al terminar:
+        mientras tanto los demás procesos (el servidor) no lo reconstruyen a
+        cada lote confirmado y siguen sirviendo su última construcción.
+        Varios procesos pueden reservarlo a la vez.
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        reserva = bloquear_archivo(self.ruta_reserva, exclusivo=False)
+        with self._reservas_lock:
+            self._reservas += 1
+        try:
+            yield
+        finally:
+            with self._reservas_lock:
+                self._reservas -= 1
+            reserva.close()
+
+    def _reservado_por_otro(self) -> bool:
+        """True si otro proceso tiene reservada la construcción (ver reservar)"""
+        if self._reservas or not os.path.exists(self.ruta_reserva):
+            return False
+        reserva = bloquear_archivo(self.ruta_reserva, esperar=False)
+        if reserva is None:
+            return True
+        reserva.close()
+        return False
+
+    async def _candado_construccion_async(self) -> IO:
+        """Tomar el candado de construcción sin bloquear el bucle; si la espera se cancela, se suelta al obtenerlo"""
+        os.makedirs(self.directorio, exist_ok=True)
+        tarea = asyncio.ensure_future(asyncio.to_thread(bloquear_archivo, self.ruta_candado))
+        try:
+            return await asyncio.shield(tarea)
+        except asyncio.CancelledError:
+            tarea.add_done_callback(lambda t: t.cancelled() or t.exception() is not None or t.result().close())
+            raise
+
+    def vigente(self, documentos: List[Dict[str, Any]], modelo: str) -> bool:
+        """True si la última construcción corresponde exactamente a estos documentos y modelo"""
+        return self.actual is not None and self.actual.vigente(documentos, modelo)
+
+    async def preparar_async(
+        self,
+        documentos: List[Dict[str, Any]],
+        modelo: str,
+        embeber: Callable[[List[str]], Awaitable[List[List[float]]]],
+        version: Optional[int] = None,
+    ) -> InstantaneaIndice:
+        """
+        Asegurar que el índice está al día con el corpus, actualizándolo si hace falta.
+
+        La actualización es incremental: los documentos cuya huella ya está en
+        el índice reutilizan su vector y solo se embeben los nuevos o
+        modificados; los eliminados desaparecen de la matriz.
+
+        Entre procesos, la reconstrucción y la escritura van bajo un candado de
+        archivo, así que dos procesos no embeben lo mismo ni escriben a la vez
+        el directorio. Si otro proceso reservó la construcción (ver reservar),
+        no se reconstruye: se devuelve la última construcción disponible.
+
+        Args:
+            documentos: Corpus; cada documento con "id" y "content"
+            modelo: Modelo de embeddings con el que se construye
+            embeber: Corrutina textos -> vectores (p. ej. LLMGateway.embeber_lotes_async)
+            version: Versión del corpus; si ya hay una construcción de una versión
+                posterior se devuelve esa, en lugar de retroceder el índice
+
+        Returns:
+            La instantánea vigente, que lleva consigo los documentos con los que
+            se construyó (ver InstantaneaIndice.documento)
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            actual = self.actual
+            if actual is not None and actual.vigente(documentos, modelo):
+                if actual.documentos is not documentos:
+                    self.actual = actual.con_documentos(documentos, version)
+                return self.actual
+            if (
+                actual is not None and actual.modelo == modelo and actual.documentos is not None
+                and version is not None and actual.version is not None and actual.version > version
+            ):
+                # Corpus anterior al de la última construcción: sirve la más reciente
+                return actual
+            if await asyncio.to_thread(self._reservado_por_otro):
+                # Una ingesta masiva en curso pondrá al día el índice al terminar: mientras
+                # tanto se sirve la última construcción, sin embeber en cada consulta
+                servible = actual or await asyncio.to_thread(self.cargar)
+                if servible is not None and servible.modelo == modelo:
+                    if servible.documentos is None:
+                        # Sus ids se resuelven con el corpus actual; los que ya no existen se descartan
+                        self.actual = servible = servible.con_documentos(list(documentos), None)
+                    return servible
+            # Un solo proceso construye a la vez; los demás esperan y luego cargan su resultado
+            candado = await self._candado_construccion_async()
+            try:
+                cargada = await asyncio.to_thread(self.cargar)
+                if cargada is not None and cargada.vigente(documentos, modelo):
+                    self.actual = cargada.con_documentos(documentos, version)
+                    return self.actual
+                previa = actual or cargada
+
+                inicio = time.perf_counter()
+                hashes = [_hash_documento(doc) for doc in documentos]
+                # Vectores reutilizables del índice anterior (mismo modelo), por huella de contenido
+                previas = dict(zip(previa.hashes, range(len(previa.hashes)))) if previa is not None and previa.modelo == modelo else {}
+                origen = np.array([previas.get(h, -1) for h in hashes], dtype=np.int64)
+                es_nuevo = origen < 0
+                pendientes = np.flatnonzero(es_nuevo)
+
+                vectores = np.zeros((0, 0), dtype=np.float32)
+                if documentos:
+                    nuevos = None
+                    if len(pendientes):
+                        embeddings = await embeber([documentos[i]["content"] for i in pendientes])
+                        nuevos = normalizar(np.asarray(embeddings, dtype=np.float32).reshape(len(pendientes), -1))
+                    dimension = nuevos.shape[1] if nuevos is not None else previa.vectores.shape[1]
+                    vectores = np.empty((len(documentos), dimension), dtype=np.float32)
+                    if nuevos is not None:
+                        vectores[es_nuevo] = nuevos
+                    if not es_nuevo.all():
+                        vectores[~es_nuevo] = previa.vectores[origen[~es_nuevo]]
+                ivf = await asyncio.to_thread(self._actualizar_ivf, previa, vectores, origen)
+                cuantizados = None
+                if MODO_CUANTIZACION and len(vectores):
+                    cuantizados = await asyncio.to_thread(VectoresCuantizados.desde_vectores, MODO_CUANTIZACION, vectores)
+                segundos = time.perf_counter() - inicio
+                construccion = {
+                    "textos": len(pendientes),
+                    "reutilizados": len(documentos) - len(pendientes),
+                    "segundos": round(segundos, 3),
+                    "textos_por_s": round(len(pendientes) / segundos, 1) if len(pendientes) and segundos > 0 else None,
+                }
+                nueva = InstantaneaIndice(
+                    modelo, [doc["id"] for doc in documentos], hashes, vectores, ivf, cuantizados,
+                    construccion, documentos, version
+                )
+                self.actual = await asyncio.to_thread(self.guardar, nueva)
+                return self.actual
+            finally:
+                candado.close()
+
+    def _actualizar_ivf(self, previa: Optional[InstantaneaIndice], vectores: np.ndarray, origen: np.ndarray) -> Optional[IndiceIVF]:
+        """
+        Índice IVF para la nueva matriz, o None si el corpus no lo necesita.
+
+        Las inserciones se asignan a los centroides existentes; solo se
+        reentrena si no hay índice previo, no se reutilizó ningún vector (p. ej.
+        cambió el modelo), cambió la dimensión o el corpus creció demasiado desde
+        el último entrenamiento.
+        """
+        if not self.usar_ann(vectores.shape[0]):
+            return None
+        ivf = previa.ivf if previa is not None else None
+        reutilizados = bool((origen >= 0).any())
+        if ivf is None or not reutilizados or ivf.necesita_reentrenar(vectores.shape[0], vectores.shape[1]):
+            return IndiceIVF.entrenar(vectores, IVF_LISTAS)
+        return ivf.reasignar(vectores, origen)
+
+    def buscar(self, consultas: np.ndarray, k: int, nprobe: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+        """Buscar en la última construcción (ver InstantaneaIndice.buscar)"""
+        actual = self.actual
+        if actual is None:
+            return [[] for _ in range(np.atleast_2d(consultas).shape[0])]
+        return actual.buscar(consultas, k, nprobe)
+
+
+_indices: Dict[str, IndiceVectorial] = {}
+_indices_lock = threading.Lock()
+
+
+def obtener_indice(nombre: str) -> IndiceVectorial:
+    """Índice compartido por todo el proceso (todas las sesiones) para un corpus"""
+    with _indices_lock:
+        if nombre not in _indices:
+            _indices[nombre] = IndiceVectorial(nombre)
+        return _indices[nombre]
@@ -0,0 +1,437 @@
+# utils/ingesta.py
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.almacen_conocimiento import RUTA_CONOCIMIENTO, obtener_almacen
+from utils.indice_vectorial import hash_contenido
+
+# Procesos que extraen texto en paralelo y documentos por transacción
+TRABAJADORES = int(os.getenv("INGESTA_TRABAJADORES", str(min(4, os.cpu_count() or 1))))
+DOCUMENTOS_POR_LOTE = int(os.getenv("INGESTA_DOCUMENTOS_POR_LOTE", "200"))
+
+# Avance de las ingestas lanzadas desde la interfaz (un JSON por directorio)
+DIRECTORIO_ESTADOS = os.getenv("INGESTA_ESTADOS_DIR", os.path.join(".cache", "ingesta"))
+# Única raíz bajo la que la interfaz puede lanzar ingestas (la consola no tiene esta restricción)
+RAIZ_INGESTA = os.getenv("INGESTA_RAIZ", os.path.join("datos", "sentencias"))
+MAX_ERRORES_ESTADO = 100
+SCRIPT_INGESTA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ingestar_corpus.py")
+
+EXTENSIONES = (".pdf", ".txt", ".jsonl")
+CATEGORIA_DEFECTO = "jurisprudencia"
+TIPO_DEFECTO = "sentencias"
+
+# Archivos ya ingeridos (ruta + tamaño + fecha de modificación), en la misma base que los documentos
+ESQUEMA_INGESTA = """
+CREATE TABLE IF NOT EXISTS ingesta_archivos (
+    ruta TEXT PRIMARY KEY,
+    firma TEXT NOT NULL,
+    documentos INTEGER NOT NULL,
+    duplicados INTEGER NOT NULL,
+    procesado TEXT NOT NULL
+)
+"""
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def huella_texto(texto: str) -> str:
+    """Huella del contenido para deduplicar: insensible a espacios y saltos de línea"""
+    return hash_contenido(_ESPACIOS.sub(" ", texto).strip())
+
+
+def firma_archivo(ruta: str) -> str:
+    estado = os.stat(ruta)
+    return f"{estado.st_size}:{estado.st_mtime_ns}"
+
+
+def listar_archivos(directorio: str) -> Iterator[str]:
+    """Archivos PDF/TXT/JSONL bajo el directorio (recursivo, en orden estable)"""
+    with os.scandir(directorio) as entradas:
+        for entrada in sorted(entradas, key=lambda e: e.name):
+            if entrada.is_dir(follow_symlinks=False):
+                yield from listar_archivos(entrada.path)
+            elif entrada.is_file() and os.path.splitext(entrada.name)[1].lower() in EXTENSIONES:
+                yield entrada.path
+
+
+def _leer_texto(ruta: str) -> str:
+    with open(ruta, "rb") as f:
+        datos = f.read()
+    try:
+        return datos.decode("utf-8")
+    except UnicodeDecodeError:
+        return datos.decode("latin-1")
+
+
+def extraer_registros(ruta: str) -> List[Dict[str, str]]:
+    """
+    Registros {"content", "source", y opcionalmente "category"/"type"} de un archivo.
+
+    - PDF: el texto de todas las páginas (utils/expediente.extraer_texto_pdf).
+    - TXT: el archivo completo.
+    - JSONL: un registro por línea con "content" (o "texto"/"text") y, si
+      están, "source"/"fuente", "category"/"categoria" y "type"/"tipo".
+
+    Se ejecuta en los procesos de trabajo, por eso solo recibe y devuelve datos simples.
+    """
+    nombre = os.path.basename(ruta)
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == ".pdf":
+        from utils.expediente import extraer_texto_pdf
+        with open(ruta, "rb") as f:
+            texto = extraer_texto_pdf(io.BytesIO(f.read()))
+        return [{"content": texto or "", "source": nombre}]
+    if extension == ".txt":
+        return [{"content": _leer_texto(ruta), "source": nombre}]
+
+    registros = []
+    for numero, linea in enumerate(_leer_texto(ruta).splitlines(), 1):
+        if not linea.strip():
+            continue
+        dato = json.loads(linea)
+        registros.append({
+            "content": str(dato.get("content") or dato.get("texto") or dato.get("text") or ""),
+            "source": str(dato.get("source") or dato.get("fuente") or f"{nombre}:{numero}"),
+            "category": str(dato.get("category") or dato.get("categoria") or ""),
+            "type": str(dato.get("type") or dato.get("tipo") or ""),
+        })
+    return registros
+
+
+class EstadoIngesta:
+    """Avance de una ingesta; lo actualiza quien ingiere y lo leen la CLI o la interfaz (vía ``guardar``)"""
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self.archivos_total = 0
+        self.archivos_procesados = 0
+        self.archivos_omitidos = 0
+        self.archivos_fallidos = 0
+        self.documentos_agregados = 0
+        self.duplicados = 0
+        self.errores: List[Tuple[str, str]] = []
+        self.fase = "pendiente"
+        self.inicio = time.time()
+        self.fin: Optional[float] = None
+        self.cancelar = threading.Event()
+
+    @property
+    def terminado(self) -> bool:
+        return self.fin is not None
+
+    @property
+    def fraccion(self) -> float:
+        if not self.archivos_total:
+            return 1.0 if self.terminado else 0.0
+        return (self.archivos_procesados + self.archivos_omitidos + self.archivos_fallidos) / self.archivos_total
+
+    def resumen(self) -> Dict[str, Any]:
+        return {
+            "directorio": self.directorio,
+            "fase": self.fase,
+            "fraccion": round(self.fraccion, 4),
+            "terminado": self.terminado,
+            "archivos_total": self.archivos_total,
+            "archivos_procesados": self.archivos_procesados,
+            "archivos_omitidos": self.archivos_omitidos,
+            "documentos_agregados": self.documentos_agregados,
+            "duplicados": self.duplicados,
+            "errores": [list(error) for error in self.errores[:MAX_ERRORES_ESTADO]],
+            "total_errores": len(self.errores),
+            "inicio": self.inicio,
+            "segundos": round((self.fin or time.time()) - self.inicio, 1),
+            "pid": os.getpid(),
+        }
+
+    def guardar(self, ruta: str):
+        """Escribir el resumen como JSON (atómico) para que otro proceso siga el avance"""
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        tmp = ruta + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.resumen(), f, ensure_ascii=False)
+        os.replace(tmp, ruta)
+
+
+def _archivos_procesados(ruta_db: str) -> Dict[str, str]:
+    conn = sqlite3.connect(ruta_db, timeout=30)
+    try:
+        conn.execute(ESQUEMA_INGESTA)
+        conn.commit()
+        return dict(conn.execute("SELECT ruta, firma FROM ingesta_archivos"))
+    finally:
+        conn.close()
+
+
+def ingerir_directorio(
+    directorio: str,
+    knowledge_file: str = RUTA_CONOCIMIENTO,
+    categoria: str = CATEGORIA_DEFECTO,
+    tipo: str = TIPO_DEFECTO,
+    trabajadores: int = TRABAJADORES,
+    documentos_por_lote: int = DOCUMENTOS_POR_LOTE,
+    reanudar: bool = True,
+    actualizar_indice: bool = True,
+    estado: Optional[EstadoIngesta] = None,
+    progreso: Optional[Callable[[EstadoIngesta], None]] = None,
+) -> EstadoIngesta:
+    """
+    Ingerir un directorio de sentencias (PDF, TXT o JSONL) en la base de conocimiento.
+
+    El texto se extrae en ``trabajadores`` procesos, con a lo sumo dos
+    archivos por proceso en vuelo, así la memoria no depende del tamaño del
+    directorio. Los documentos cuyo contenido ya está en la base (misma
+    huella, sin contar espacios) se descartan. Los documentos se confirman en
+    transacciones de ~``documentos_por_lote`` junto con la lista de archivos
+    ya procesados: si la ingesta se interrumpe, al repetirla (``reanudar``)
+    se saltan los archivos confirmados que no cambiaron.
+
+    Los documentos se guardan completos; el RAG vectorial los fragmenta al
+    armar su corpus y, con ``actualizar_indice``, al final se embeben solo
+    los fragmentos nuevos. En ese caso la ingesta reserva la construcción
+    del índice mientras corre: el servidor no lo reconstruye a cada lote
+    confirmado y sigue sirviendo su última construcción.
+    """
+    estado = estado or EstadoIngesta(directorio)
+    almacen = obtener_almacen(knowledge_file)
+    reserva = contextlib.ExitStack()
+
+    def avisar(fase: Optional[str] = None):
+        if fase:
+            estado.fase = fase
+        if progreso is not None:
+            progreso(estado)
+
+    try:
+        if actualizar_indice:
+            from utils.vector_rag import reservar_indice_legal
+            reserva.enter_context(reservar_indice_legal())
+        avisar("listando archivos")
+        archivos = list(listar_archivos(directorio))
+        estado.archivos_total = len(archivos)
+        procesados = _archivos_procesados(almacen.ruta_db)
+        pendientes = []
+        for ruta in archivos:
+            if reanudar and procesados.get(os.path.abspath(ruta)) == firma_archivo(ruta):
+                estado.archivos_omitidos += 1
+            else:
+                pendientes.append(ruta)
+
+        # Huellas de lo que ya está en la base (ingestas anteriores o documentos agregados a mano)
+        huellas = set()
+        for tipos in almacen.datos.values():
+            for valor in tipos.values():
+                for entrada in valor if isinstance(valor, list) else [valor]:
+                    texto = entrada.get("content", "") if isinstance(entrada, dict) else str(entrada)
+                    huellas.add(huella_texto(texto))
+
+        lote: List[Tuple[str, str, Any]] = []
+        archivos_lote: List[Tuple[str, str, int, int]] = []
+
+        def confirmar():
+            if not lote and not archivos_lote:
+                return
+            fecha = datetime.now().isoformat()
+
+            def registrar_archivos(conn: sqlite3.Connection):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO ingesta_archivos (ruta, firma, documentos, duplicados, procesado) VALUES (?, ?, ?, ?, ?)",
+                    [(ruta, firma, documentos, duplicados, fecha) for ruta, firma, documentos, duplicados in archivos_lote],
+                )
+
+            almacen.agregar_lote(lote, registrar_archivos)
+            estado.documentos_agregados += len(lote)
+            estado.archivos_procesados += len(archivos_lote)
+            lote.clear()
+            archivos_lote.clear()
+            avisar()
+
+        def incorporar(ruta: str, firma: str, registros: List[Dict[str, str]]):
+            agregados = duplicados = 0
+            for registro in registros:
+                texto = registro["content"].strip()
+                if not texto:
+                    continue
+                huella = huella_texto(texto)
+                if huella in huellas:
+                    duplicados += 1
+                    continue
+                huellas.add(huella)
+                lote.append((
+                    registro.get("category") or categoria,
+                    registro.get("type") or tipo,
+                    {"content": texto, "source": registro["source"], "added_date": datetime.now().isoformat()},
+                ))
+                agregados += 1
+            estado.duplicados += duplicados
+            if not agregados and not duplicados:
+                estado.errores.append((ruta, "sin texto extraíble (¿PDF escaneado?)"))
+            archivos_lote.append((os.path.abspath(ruta), firma, agregados, duplicados))
+            if len(lote) >= documentos_por_lote:
+                confirmar()
+
+        avisar("extrayendo texto")
+        # "spawn": los procesos no heredan los hilos del servidor de Streamlit
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(1, trabajadores), mp_context=contexto) as ejecutor:
+            cola = iter(pendientes)
+            en_vuelo: Dict[Any, Tuple[str, str]] = {}
+
+            def enviar():
+                while len(en_vuelo) < 2 * max(1, trabajadores) and not estado.cancelar.is_set():
+                    ruta = next(cola, None)
+                    if ruta is None:
+                        return
+                    en_vuelo[ejecutor.submit(extraer_registros, ruta)] = (ruta, firma_archivo(ruta))
+
+            enviar()
+            while en_vuelo:
+                listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    ruta, firma = en_vuelo.pop(futuro)
+                    try:
+                        incorporar(ruta, firma, futuro.result())
+                    except Exception as e:
+                        estado.archivos_fallidos += 1
+                        estado.errores.append((ruta, str(e)))
+                enviar()
+                avisar()
+        confirmar()
+
+        if estado.cancelar.is_set():
+            avisar("cancelada")
+        elif actualizar_indice and estado.documentos_agregados:
+            avisar("actualizando índice semántico")
+            from utils.vector_rag import actualizar_indice_legal
+            actualizar_indice_legal()
+            avisar("completada")
+        else:
+            avisar("completada")
+    except Exception as e:
+        estado.errores.append((directorio, str(e)))
+        avisar("fallida")
+    finally:
+        reserva.close()
+        estado.fin = time.time()
+        avisar()
+    return estado
+
+
+def ruta_estado(directorio: str) -> str:
+    """Archivo de avance de la ingesta de un directorio"""
+    return os.path.join(DIRECTORIO_ESTADOS, hash_contenido(os.path.abspath(directorio))[:16] + ".json")
+
+
+# Procesos lanzados por este servidor (para recogerlos al terminar)
+_procesos: Dict[str, subprocess.Popen] = {}
+
+
+def _proceso_vivo(ruta: str, pid: Optional[int]) -> bool:
+    proceso = _procesos.get(ruta)
+    if proceso is not None:
+        return proceso.poll() is None
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def leer_estado(ruta: str) -> Optional[Dict[str, Any]]:
+    """Resumen guardado de una ingesta; "interrumpida" si su proceso terminó sin completarla"""
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            estado = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not estado.get("terminado") and not _proceso_vivo(ruta, estado.get("pid")):
+        estado["fase"] = "interrumpida"
+        estado["terminado"] = True
+    estado["ruta_estado"] = ruta
+    return estado
+
+
+def directorio_permitido(directorio: str) -> Optional[str]:
+    """
+    Ruta real de un directorio de ingesta, o None si no existe o queda fuera de RAIZ_INGESTA.
+
+    Las rutas relativas se resuelven desde la raíz; los enlaces simbólicos y
+    los ".." se resuelven antes de comprobar que la ruta sigue dentro de ella.
+    """
+    raiz = os.path.realpath(RAIZ_INGESTA)
+    ruta = os.path.realpath(os.path.join(raiz, directorio))
+    if os.path.commonpath([raiz, ruta]) != raiz or not os.path.isdir(ruta):
+        return None
+    return ruta
+
+
+def iniciar_ingesta(
+    directorio: str,
+    knowledge_file: str = RUTA_CONOCIMIENTO,
+    categoria: str = CATEGORIA_DEFECTO,
+    tipo: str = TIPO_DEFECTO,
+    actualizar_indice: bool = True,
+) -> str:
+    """
+    Lanzar ``ingestar_corpus.py`` en un proceso aparte y devolver la ruta de su archivo de avance.
+
+    Un proceso separado (y no un hilo del servidor) deja a la extracción
+    usar todos los núcleos sin competir con Streamlit, y la ingesta
+    sobrevive a que se cierre la sesión. Los documentos que confirma los ven
+    las sesiones abiertas en su siguiente acceso a la base de conocimiento.
+    Si ya hay una ingesta en curso para el directorio, no se lanza otra.
+
+    Solo se admiten directorios dentro de RAIZ_INGESTA (ValueError si no).
+    """
+    permitido = directorio_permitido(directorio)
+    if permitido is None:
+        raise ValueError(f"{directorio} no es un directorio dentro de la raíz de ingesta ({os.path.realpath(RAIZ_INGESTA)})")
+    directorio = permitido
+    estado = ruta_estado(directorio)
+    actual = leer_estado(estado)
+    if actual is not None and not actual["terminado"]:
+        return estado
+    if os.path.exists(estado + ".cancelar"):
+        os.remove(estado + ".cancelar")
+    comando = [
+        sys.executable, SCRIPT_INGESTA, directorio,
+        "--conocimiento", knowledge_file, "--categoria", categoria, "--tipo", tipo, "--estado", estado,
+    ]
+    if not actualizar_indice:
+        comando.append("--sin-indice")
+    # Estado inicial para que la interfaz muestre la ingesta de inmediato; el proceso lo sobrescribe
+    EstadoIngesta(directorio).guardar(estado)
+    with open(estado + ".log", "w", encoding="utf-8") as log:
+        _procesos[estado] = subprocess.Popen(comando, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+    return estado
+
+
+def cancelar_ingesta(ruta: str):
+    """Pedir a una ingesta en curso que se detenga tras el lote actual (lo confirmado se conserva)"""
+    with open(ruta + ".cancelar", "w", encoding="utf-8"):
+        pass
+
+
+def trabajos_ingesta() -> List[Dict[str, Any]]:
+    """Ingestas lanzadas (en curso o terminadas), la más reciente primero"""
+    if not os.path.isdir(DIRECTORIO_ESTADOS):
+        return []
+    estados = [
+        leer_estado(os.path.join(DIRECTORIO_ESTADOS, nombre))
+        for nombre in os.listdir(DIRECTORIO_ESTADOS) if nombre.endswith(".json")
+    ]
+    return sorted((e for e in estados if e is not None), key=lambda e: e.get("inicio", 0), reverse=True)
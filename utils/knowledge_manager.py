@@ -1,89 +1,52 @@
 # utils/knowledge_manager.py
 
+import copy
 import json
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from datetime import datetime
 import streamlit as st
+from utils.indice_lexico import IndiceBM25
+from utils.almacen_conocimiento import CONOCIMIENTO_POR_DEFECTO, RUTA_CONOCIMIENTO, obtener_almacen
+
+# Resultados por página en la pestaña "Buscar"
+RESULTADOS_POR_PAGINA = int(os.getenv("CONOCIMIENTO_RESULTADOS_POR_PAGINA", "20"))
+# Caracteres que la pestaña "Ver Base" muestra de cada entrada (las sentencias completas son muy largas)
+VISTA_MAX_CARACTERES = int(os.getenv("CONOCIMIENTO_VISTA_MAX_CARACTERES", "500"))
 
 class LegalKnowledgeManager:
-    def __init__(self, knowledge_file: str = "legal_knowledge.json"):
+    """
+    Acceso a la base de conocimiento legal.
+
+    Los datos viven en el almacén compartido del proceso (SQLite + FTS5, ver
+    utils/almacen_conocimiento.py): crear un gestor no vuelve a leer la base,
+    y lo que se agrega o importa aquí lo ven de inmediato el RAG Básico y el
+    vectorial.
+    """
+    def __init__(self, knowledge_file: str = RUTA_CONOCIMIENTO):
         self.knowledge_file = knowledge_file
-        self.knowledge_base = self._load_knowledge_base()
+        self.almacen = obtener_almacen(knowledge_file)
+    
+    @property
+    def knowledge_base(self) -> Dict[str, Any]:
+        """Base de conocimiento vigente (compartida, de solo lectura)"""
+        return self._load_knowledge_base()
     
     def _load_knowledge_base(self) -> Dict[str, Any]:
-        """Cargar base de conocimiento desde archivo JSON"""
-        if os.path.exists(self.knowledge_file):
-            try:
-                with open(self.knowledge_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                st.error(f"Error cargando base de conocimiento: {str(e)}")
-                return self._get_default_knowledge()
-        else:
-            return self._get_default_knowledge()
+        """Cargar base de conocimiento desde el almacén (recarga solo si la base cambió)"""
+        datos = self.almacen.datos
+        if self.almacen.error:
+            st.error(f"Error cargando base de conocimiento: {self.almacen.error}")
+        return datos
     
     def _get_default_knowledge(self) -> Dict[str, Any]:
         """Obtener base de conocimiento por defecto"""
-        return {
-            "contrato_realidad": {
-                "concepto": "El contrato realidad es una figura jurídica que permite reconocer una relación laboral cuando existe una relación de trabajo subordinado pero se ha disfrazado bajo otra figura contractual.",
-                "elementos": [
-                    "Subordinación jurídica",
-                    "Prestación personal del servicio", 
-                    "Continuidad en la prestación",
-                    "Remuneración periódica",
-                    "Ausencia de contrato laboral formal"
-                ],
-                "jurisprudencia": [
-                    "Sentencia C-614 de 2009 de la Corte Constitucional",
-                    "Sentencia T-1234 de 2018 sobre contrato realidad",
-                    "Sentencia C-789 de 2020 sobre protección laboral"
-                ],
-                "normativa": [
-                    "Artículo 23 del Código Sustantivo del Trabajo",
-                    "Artículo 25 del CST sobre presunción de laboralidad",
-                    "Artículo 26 del CST sobre contrato de trabajo"
-                ]
-            },
-            "derecho_laboral_colombiano": {
-                "principios": [
-                    "Protección al trabajador",
-                    "Realidad sobre las formas",
-                    "Primacía de la realidad",
-                    "Continuidad de la relación laboral"
-                ],
-                "derechos_trabajador": [
-                    "Salario mínimo legal",
-                    "Prestaciones sociales",
-                    "Seguridad social",
-                    "Vacaciones y descansos",
-                    "Indemnización por despido"
-                ]
-            },
-            "demanda_laboral": {
-                "requisitos": [
-                    "Competencia del juez laboral",
-                    "Identificación clara de las partes",
-                    "Narración de hechos",
-                    "Pretensiones específicas",
-                    "Fundamentos jurídicos",
-                    "Medios de prueba",
-                    "Petición final"
-                ],
-                "plazos": [
-                    "Prescripción ordinaria: 3 años",
-                    "Prescripción especial: 1 año para algunos casos",
-                    "Término de contestación: 10 días"
-                ]
-            }
-        }
+        return copy.deepcopy(CONOCIMIENTO_POR_DEFECTO)
     
-    def save_knowledge_base(self):
-        """Guardar base de conocimiento en archivo JSON"""
+    def save_knowledge_base(self, knowledge_base: Optional[Dict[str, Any]] = None):
+        """Guardar (reemplazar) la base de conocimiento completa en una sola transacción"""
         try:
-            with open(self.knowledge_file, 'w', encoding='utf-8') as f:
-                json.dump(self.knowledge_base, f, ensure_ascii=False, indent=2)
+            self.almacen.reemplazar(self.knowledge_base if knowledge_base is None else knowledge_base)
             return True
         except Exception as e:
             st.error(f"Error guardando base de conocimiento: {str(e)}")
@@ -91,20 +54,18 @@ class LegalKnowledgeManager:
     
     def add_legal_document(self, category: str, doc_type: str, content: str, source: str = ""):
         """Agregar nuevo documento legal a la base de conocimiento"""
-        if category not in self.knowledge_base:
-            self.knowledge_base[category] = {}
-        
-        if doc_type not in self.knowledge_base[category]:
-            self.knowledge_base[category][doc_type] = []
-        
         new_doc = {
             "content": content,
             "source": source,
             "added_date": datetime.now().isoformat()
         }
         
-        self.knowledge_base[category][doc_type].append(new_doc)
-        return self.save_knowledge_base()
+        try:
+            self.almacen.agregar(category, doc_type, new_doc)
+            return True
+        except Exception as e:
+            st.error(f"Error guardando base de conocimiento: {str(e)}")
+            return False
     
     def get_knowledge_categories(self) -> List[str]:
         """Obtener categorías disponibles"""
@@ -117,34 +78,61 @@ class LegalKnowledgeManager:
         return []
     
     def search_knowledge(self, query: str) -> List[Dict[str, Any]]:
-        """Buscar en la base de conocimiento"""
-        results = []
-        query_lower = query.lower()
+        """Buscar en la base de conocimiento (todos los resultados, del más al menos relevante)"""
+        buscador = self._buscador()
+        return buscador.buscar(query, 0, len(buscador.resultados))[1]
+    
+    def buscar_paginado(self, query: str, pagina: int = 1, por_pagina: int = RESULTADOS_POR_PAGINA) -> Tuple[int, List[Dict[str, Any]]]:
+        """Una página (desde 1) de los resultados de búsqueda: (total de resultados, resultados de la página)"""
+        return self._buscador().buscar(query, (max(1, pagina) - 1) * por_pagina, por_pagina)
+    
+    def listar_paginado(self, category: str, pagina: int = 1, por_pagina: int = RESULTADOS_POR_PAGINA) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Una página (desde 1) de las entradas de una categoría, en el orden de la base.
         
-        for category, content in self.knowledge_base.items():
-            for doc_type, documents in content.items():
-                if isinstance(documents, list):
-                    for doc in documents:
-                        if isinstance(doc, dict) and "content" in doc:
-                            if query_lower in doc["content"].lower():
-                                results.append({
-                                    "category": category,
-                                    "type": doc_type,
-                                    "content": doc["content"],
-                                    "source": doc.get("source", ""),
-                                    "date": doc.get("added_date", "")
-                                })
-                elif isinstance(documents, str):
-                    if query_lower in documents.lower():
-                        results.append({
-                            "category": category,
-                            "type": doc_type,
-                            "content": documents,
-                            "source": "",
-                            "date": ""
-                        })
+        Returns:
+            (total de entradas de la categoría, entradas {"type", "index", "content", "source", "date"});
+            "index" es la posición (desde 1) en la lista del tipo, o None si el tipo es un texto suelto
+        """
+        tipos = self.knowledge_base.get(category, {})
+        total = sum(len(valor) if isinstance(valor, list) else 1 for valor in tipos.values())
+        desde = (max(1, pagina) - 1) * por_pagina
+        entradas: List[Dict[str, Any]] = []
+        for doc_type, valor in tipos.items():
+            if len(entradas) >= por_pagina:
+                break
+            lista = valor if isinstance(valor, list) else [valor]
+            if desde >= len(lista):
+                desde -= len(lista)
+                continue
+            for i in range(desde, min(len(lista), desde + por_pagina - len(entradas))):
+                texto, fuente, fecha = _entrada(lista[i])
+                entradas.append({
+                    "type": doc_type,
+                    "index": i + 1 if isinstance(valor, list) else None,
+                    "content": texto,
+                    "source": fuente,
+                    "date": fecha
+                })
+            desde = 0
+        return total, entradas
+    
+    def _buscador(self) -> "BuscadorConocimiento":
+        """Índice de búsqueda compartido; se actualiza en el lugar al agregar documentos"""
+        return self.almacen.derivado(
+            "busqueda_gestor",
+            BuscadorConocimiento,
+            lambda buscador, _datos, category, doc_type, doc: buscador.agregar(category, doc_type, doc)
+        )
+    
+    def documentos_corpus(self) -> List[Dict[str, Any]]:
+        """
+        Aplanar la base de conocimiento en documentos para el RAG vectorial.
         
-        return results
+        Cada entrada (texto suelto o elemento de una lista) se convierte en un
+        documento con id estable "categoria/tipo[/indice]", contenido y metadata.
+        """
+        return documentos_de_conocimiento(self.knowledge_base)
     
     def export_knowledge_base(self) -> str:
         """Exportar base de conocimiento como JSON"""
@@ -154,12 +142,107 @@ class LegalKnowledgeManager:
         """Importar base de conocimiento desde JSON"""
         try:
             new_knowledge = json.loads(json_data)
-            self.knowledge_base = new_knowledge
-            return self.save_knowledge_base()
+            return self.save_knowledge_base(new_knowledge)
         except Exception as e:
             st.error(f"Error importando base de conocimiento: {str(e)}")
             return False
 
+def _entrada(doc: Any) -> Tuple[str, str, str]:
+    """(contenido, fuente, fecha) de una entrada: texto suelto o registro {"content", "source", "added_date"}"""
+    if isinstance(doc, dict):
+        return str(doc.get("content", "")), str(doc.get("source", "") or ""), str(doc.get("added_date", "") or "")
+    return str(doc), "", ""
+
+def documentos_de_conocimiento(knowledge_base: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Documentos {"id", "content", "metadata"} de una instantánea de la base (ver LegalKnowledgeManager.documentos_corpus)"""
+    return [
+        _documento(category, doc_type, doc_id, texto, fuente)
+        for category, doc_type, doc_id, texto, fuente, _fecha in _entradas_conocimiento(knowledge_base)
+    ]
+
+def documento_de_conocimiento(category: str, doc_type: str, indice: int, doc: Any) -> Optional[Dict[str, Any]]:
+    """Documento de la entrada ``indice`` de la lista categoria/tipo (None si no tiene texto), como en documentos_de_conocimiento"""
+    texto, fuente, _fecha = _entrada(doc)
+    if not texto.strip():
+        return None
+    return _documento(category, doc_type, f"{category}/{doc_type}/{indice}", texto, fuente)
+
+def _documento(category: str, doc_type: str, doc_id: str, texto: str, fuente: str) -> Dict[str, Any]:
+    return {
+        "id": doc_id,
+        "content": texto,
+        "metadata": {
+            "tipo": doc_type,
+            "fuente": fuente.strip() or "Base de conocimiento",
+            "categoria": category
+        }
+    }
+
+def _entradas_conocimiento(knowledge_base: Dict[str, Any]) -> Iterator[Tuple[str, str, str, str, str, str]]:
+    """(categoria, tipo, id, contenido, fuente, fecha) de cada entrada no vacía de la base de conocimiento"""
+    for category, content in knowledge_base.items():
+        if not isinstance(content, dict):
+            continue
+        for doc_type, documents in content.items():
+            entradas = documents if isinstance(documents, list) else [documents]
+            for i, doc in enumerate(entradas):
+                texto, fuente, fecha = _entrada(doc)
+                if not texto.strip():
+                    continue
+                doc_id = f"{category}/{doc_type}/{i}" if isinstance(documents, list) else f"{category}/{doc_type}"
+                yield category, doc_type, doc_id, texto, fuente, fecha
+
+class BuscadorConocimiento:
+    """
+    Búsqueda de la pestaña "Buscar": índice invertido BM25 en memoria.
+    
+    Usa el mismo análisis que el RAG híbrido (utils/indice_lexico.py): sin
+    acentos ni mayúsculas y con raíces, así "articulo" encuentra "Artículo" y
+    "subordinado" encuentra "subordinación". Es un derivado del almacén: se
+    construye una vez por versión de la base y los documentos agregados desde
+    el Gestor se indexan en el lugar.
+    """
+    def __init__(self, knowledge_base: Dict[str, Any]):
+        self.resultados: List[Dict[str, Any]] = []
+        self.indice = IndiceBM25([], [])
+        for category, doc_type, _doc_id, texto, fuente, fecha in _entradas_conocimiento(knowledge_base):
+            self._registrar(category, doc_type, texto, fuente, fecha)
+        self.indice.agregar(range(len(self.resultados)), [r["content"] for r in self.resultados])
+    
+    def _registrar(self, category: str, doc_type: str, texto: str, fuente: str, fecha: str):
+        self.resultados.append({
+            "category": category,
+            "type": doc_type,
+            "content": texto,
+            "source": fuente,
+            "date": fecha
+        })
+    
+    def agregar(self, category: str, doc_type: str, doc: Any):
+        """Indexar una entrada nueva (costo proporcional a su texto)"""
+        texto, fuente, fecha = _entrada(doc)
+        if texto.strip():
+            self._registrar(category, doc_type, texto, fuente, fecha)
+            self.indice.agregar([len(self.resultados) - 1], [texto])
+    
+    def buscar(self, query: str, desde: int, cantidad: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """(total de coincidencias, resultados [desde, desde + cantidad) ordenados por BM25)"""
+        total, pagina = self.indice.buscar_pagina(query, desde, cantidad)
+        return total, [{**self.resultados[i], "score": puntaje} for i, puntaje in pagina]
+
+def _recortar(texto: str, limite: int = VISTA_MAX_CARACTERES) -> str:
+    """Texto acortado a ``limite`` caracteres para mostrarlo en listados"""
+    return texto if len(texto) <= limite else texto[:limite].rstrip() + "…"
+
+def _actualizar_indice_semantico():
+    """Re-embeber solo los documentos nuevos o modificados del RAG vectorial"""
+    from utils.vector_rag import actualizar_indice_legal
+    try:
+        with st.spinner("🔄 Actualizando índice semántico..."):
+            actualizar_indice_legal()
+    except Exception as e:
+        st.warning(f"⚠️ El índice semántico se actualizará en la próxima consulta: {str(e)}")
+
 def render_knowledge_manager():
     """Renderizar interfaz para gestionar la base de conocimiento"""
     st.markdown("""
@@ -173,26 +256,31 @@ def render_knowledge_manager():
     km = LegalKnowledgeManager()
     
     # Pestañas para diferentes funcionalidades
-    tab1, tab2, tab3, tab4 = st.tabs(["📖 Ver Base", "➕ Agregar", "🔍 Buscar", "📤 Exportar/Importar"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📖 Ver Base", "➕ Agregar", "🔍 Buscar", "📤 Exportar/Importar", "📥 Ingesta masiva"])
     
     with tab1:
         st.subheader("Base de Conocimiento Actual")
         
-        for category in km.get_knowledge_categories():
-            with st.expander(f"📁 {category}"):
-                category_data = km.knowledge_base[category]
-                for doc_type, content in category_data.items():
-                    st.write(f"**{doc_type}:**")
-                    if isinstance(content, list):
-                        for i, item in enumerate(content):
-                            if isinstance(item, dict):
-                                st.write(f"  {i+1}. {item.get('content', str(item))}")
-                                if item.get('source'):
-                                    st.caption(f"Fuente: {item['source']}")
-                            else:
-                                st.write(f"  {i+1}. {item}")
-                    else:
-                        st.write(f"  {content}")
+        categorias = km.get_knowledge_categories()
+        if categorias:
+            categoria_vista = st.selectbox("📁 Categoría:", categorias, key="categoria_vista")
+            total = km.listar_paginado(categoria_vista, 1, 0)[0]
+            paginas = max(1, -(-total // RESULTADOS_POR_PAGINA))
+            pagina = st.number_input("Página:", min_value=1, max_value=paginas, value=1, step=1, key="pagina_vista") if paginas > 1 else 1
+            _, entradas = km.listar_paginado(categoria_vista, int(pagina))
+            inicio = (int(pagina) - 1) * RESULTADOS_POR_PAGINA
+            st.caption(f"Mostrando {inicio + 1}–{inicio + len(entradas)} de {total} entradas")
+            tipo_actual = None
+            for entrada in entradas:
+                if entrada["type"] != tipo_actual:
+                    tipo_actual = entrada["type"]
+                    st.write(f"**{tipo_actual}:**")
+                prefijo = f"{entrada['index']}. " if entrada["index"] is not None else ""
+                st.write(f"  {prefijo}{_recortar(entrada['content'])}")
+                if entrada["source"]:
+                    st.caption(f"Fuente: {entrada['source']}")
+        else:
+            st.info("La base de conocimiento está vacía")
     
     with tab2:
         st.subheader("Agregar Nuevo Documento Legal")
@@ -206,6 +294,7 @@ def render_knowledge_manager():
             if category and doc_type and content:
                 if km.add_legal_document(category, doc_type, content, source):
                     st.success("✅ Documento agregado exitosamente")
+                    _actualizar_indice_semantico()
                     st.rerun()
                 else:
                     st.error("❌ Error al agregar documento")
@@ -217,10 +306,15 @@ def render_knowledge_manager():
         
         search_query = st.text_input("Término de búsqueda:")
         if search_query:
-            results = km.search_knowledge(search_query)
+            total = km.buscar_paginado(search_query, 1, 0)[0]
             
-            if results:
-                st.write(f"**Resultados encontrados: {len(results)}**")
+            if total:
+                paginas = -(-total // RESULTADOS_POR_PAGINA)
+                st.write(f"**Resultados encontrados: {total}**")
+                pagina = st.number_input("Página:", min_value=1, max_value=paginas, value=1, step=1) if paginas > 1 else 1
+                _, results = km.buscar_paginado(search_query, int(pagina))
+                inicio = (int(pagina) - 1) * RESULTADOS_POR_PAGINA
+                st.caption(f"Mostrando {inicio + 1}–{inicio + len(results)} de {total} (más relevantes primero)")
                 for result in results:
                     with st.expander(f"📄 {result['category']} - {result['type']}"):
                         st.write(f"**Contenido:** {result['content']}")
@@ -256,8 +350,65 @@ def render_knowledge_manager():
                     if st.button("📥 Importar Base de Conocimiento"):
                         if km.import_knowledge_base(json_data):
                             st.success("✅ Base de conocimiento importada exitosamente")
+                            _actualizar_indice_semantico()
                             st.rerun()
                         else:
                             st.error("❌ Error al importar")
                 except Exception as e:
-                    st.error(f"Error leyendo archivo: {str(e)}") 
\ No newline at end of file
+                    st.error(f"Error leyendo archivo: {str(e)}")
+    
+    with tab5:
+        _render_ingesta_masiva()
+
+def _render_ingesta_masiva():
+    """Pestaña de ingesta masiva: lanza ingestas en segundo plano y muestra su avance"""
+    from utils.ingesta import (
+        CATEGORIA_DEFECTO, RAIZ_INGESTA, TIPO_DEFECTO, cancelar_ingesta, directorio_permitido, iniciar_ingesta, trabajos_ingesta
+    )
+    
+    st.subheader("Ingesta Masiva de Sentencias")
+    st.caption(f"Carga todos los PDF, TXT y JSONL de un directorio dentro de `{os.path.realpath(RAIZ_INGESTA)}` "
+               "(INGESTA_RAIZ). Corre en segundo plano: puedes seguir usando la aplicación y volver aquí para ver el avance. "
+               "También disponible por consola: `python ingestar_corpus.py <directorio>`")
+    
+    directorio = st.text_input("Directorio (relativo a la raíz de ingesta):", placeholder="2024/laboral")
+    col1, col2 = st.columns(2)
+    with col1:
+        categoria = st.text_input("Categoría:", value=CATEGORIA_DEFECTO)
+    with col2:
+        tipo = st.text_input("Tipo de documento:", value=TIPO_DEFECTO, key="tipo_ingesta")
+    actualizar_indice = st.checkbox("Actualizar el índice semántico al terminar", value=True)
+    
+    if st.button("🚀 Iniciar ingesta", type="primary", use_container_width=True):
+        if not directorio or directorio_permitido(directorio) is None:
+            st.warning("Indica un directorio existente dentro de la raíz de ingesta")
+        else:
+            try:
+                iniciar_ingesta(directorio, categoria=categoria or CATEGORIA_DEFECTO, tipo=tipo or TIPO_DEFECTO,
+                                actualizar_indice=actualizar_indice)
+                st.success("✅ Ingesta iniciada en segundo plano")
+            except Exception as e:
+                st.error(f"❌ No se pudo iniciar la ingesta: {str(e)}")
+    
+    trabajos = trabajos_ingesta()
+    if not trabajos:
+        return
+    
+    st.write("**Ingestas:**")
+    if st.button("🔄 Actualizar avance"):
+        st.rerun()
+    for estado in trabajos:
+        st.write(f"📂 `{estado['directorio']}` — {estado['fase']}")
+        st.progress(min(1.0, estado["fraccion"]))
+        st.caption(
+            f"{estado['archivos_procesados'] + estado['archivos_omitidos']}/{estado['archivos_total']} archivos · "
+            f"{estado['documentos_agregados']} documentos agregados · {estado['duplicados']} duplicados · "
+            f"{estado['archivos_omitidos']} ya ingeridos · {estado['segundos']} s"
+        )
+        if estado["errores"]:
+            with st.expander(f"⚠️ {estado['total_errores']} errores"):
+                for ruta, error in estado["errores"]:
+                    st.write(f"- `{ruta}`: {error}")
+        if not estado["terminado"] and st.button("⏹️ Cancelar", key=f"cancelar_{estado['ruta_estado']}"):
+            cancelar_ingesta(estado["ruta_estado"])
+            st.info("Cancelando: se conservan los lotes ya guardados")
@@ -0,0 +1,703 @@
+# utils/llm.py
+
+import asyncio
+import concurrent.futures
+import contextvars
+import hashlib
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+from utils.cache_llm import CacheCompletions, clave_completion
+from utils.planificador import PlanificadorLLM, estimar_tokens, estimar_tokens_texto
+from utils.metricas import RegistroMetricas
+
+load_dotenv()
+
+# Configuración por etapa: cada ruta de generación declara su modelo,
+# temperatura y tokens máximos en un solo lugar.
+ETAPAS: Dict[str, Dict[str, Any]] = {
+    "digesto_fragmento": {"model": "gpt-4o-mini", "temperature": 0.1, "max_tokens": 800},
+    "digesto": {"model": "gpt-4o-mini", "temperature": 0.1, "max_tokens": 1500},
+    "resumen": {"model": "gpt-4.1-mini", "temperature": 0.3, "max_tokens": 1000},
+    "viabilidad": {"model": "gpt-4.1-mini", "temperature": 0.4, "max_tokens": 1200},
+    "seccion": {"model": "gpt-4.1-mini", "temperature": 0.3, "max_tokens": 5000},
+    "seccion_referencia": {"model": "gpt-4o-mini", "temperature": 0.3, "max_tokens": 5000},
+    "patrones": {"model": "gpt-4o-mini", "temperature": 0.2, "max_tokens": 4000},
+    "rag": {"model": "gpt-4o-mini", "temperature": 0.3, "max_tokens": 1500},
+    "vector_rag": {"model": "gpt-4o-mini", "temperature": 0.3, "max_tokens": 2000},
+    "embeddings": {"model": "text-embedding-3-small"},
+}
+
+# Parámetros del pool HTTP compartido (keep-alive)
+MAX_CONEXIONES = int(os.getenv("LLM_MAX_CONEXIONES", "50"))
+MAX_CONEXIONES_KEEPALIVE = int(os.getenv("LLM_MAX_CONEXIONES_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY_S = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+TIMEOUT_S = float(os.getenv("LLM_TIMEOUT", "120"))
+MAX_REINTENTOS_CLIENTE = int(os.getenv("LLM_MAX_REINTENTOS", "2"))
+CACHE_ACTIVA = os.getenv("LLM_CACHE_ACTIVA", "1") != "0"
+PLANIFICADOR_ACTIVO = os.getenv("LLM_PLANIFICADOR_ACTIVO", "1") != "0"
+METRICAS_ACTIVAS = os.getenv("LLM_METRICAS_ACTIVAS", "1") != "0"
+# Lotes de embeddings: textos y tokens por petición, y peticiones simultáneas
+EMBEDDINGS_MAX_TEXTOS_LOTE = int(os.getenv("LLM_EMBEDDINGS_MAX_TEXTOS_LOTE", "512"))
+EMBEDDINGS_MAX_TOKENS_LOTE = int(os.getenv("LLM_EMBEDDINGS_MAX_TOKENS_LOTE", "100000"))
+EMBEDDINGS_MAX_CONCURRENCIA = int(os.getenv("LLM_EMBEDDINGS_MAX_CONCURRENCIA", "4"))
+# Segundos que una llamada compartida sigue viva sin suscriptores (p. ej. durante un rerun de Streamlit)
+GRACIA_VUELO_S = float(os.getenv("LLM_GRACIA_VUELO_S", "5"))
+
+# Si está activo, las llamadas ignoran la caché al leer (pero guardan el resultado nuevo)
+_regenerar: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_regenerar", default=False)
+
+# Marca de fin de los puentes entre generadores asíncronos e iteradores
+_FIN = object()
+
+
+def establecer_regeneracion(activo: bool):
+    """Activar o desactivar la omisión de la caché para el contexto actual"""
+    _regenerar.set(activo)
+
+
+def regenerando() -> bool:
+    """True si el contexto actual ignora la caché (opción "Regenerar sin caché" o bloque regenerar())"""
+    return _regenerar.get()
+
+
+@contextmanager
+def regenerar():
+    """Ignorar la caché de completions dentro del bloque (botones de "Regenerar"/"Reescribir")"""
+    token = _regenerar.set(True)
+    try:
+        yield
+    finally:
+        _regenerar.reset(token)
+
+
+class AvisoError(str):
+    """
+    Fragmento final de un stream que falló a mitad de camino.
+
+    Lleva el mensaje para el usuario; quien muestra el stream debe reemplazar
+    con él el texto parcial recibido, en lugar de añadirlo al final.
+    """
+
+
+def _ajustes_desde_entorno(etapa: str) -> Dict[str, Any]:
+    """Leer sobrescrituras de configuración por etapa desde variables de entorno.
+
+    Ejemplo: LLM_SECCION_MODEL=gpt-4o, LLM_RESUMEN_MAX_TOKENS=800
+    """
+    prefijo = f"LLM_{etapa.upper()}_"
+    ajustes: Dict[str, Any] = {}
+    if os.getenv(prefijo + "MODEL"):
+        ajustes["model"] = os.getenv(prefijo + "MODEL")
+    if os.getenv(prefijo + "TEMPERATURE"):
+        ajustes["temperature"] = float(os.getenv(prefijo + "TEMPERATURE"))
+    if os.getenv(prefijo + "MAX_TOKENS"):
+        ajustes["max_tokens"] = int(os.getenv(prefijo + "MAX_TOKENS"))
+    return ajustes
+
+
+class BucleFondo:
+    """
+    Bucle de eventos asyncio en un hilo propio, compartido por todo el proceso.
+
+    Todas las llamadas a la API se ejecutan aquí, de modo que el pool de
+    conexiones del cliente asíncrono vive en un único bucle. Las variables de
+    contexto del llamador (p. ej. regenerar()) se propagan a cada tarea.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    hilo = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+                    hilo.start()
+                    self._loop = loop
+        return self._loop
+
+    def en_bucle(self) -> bool:
+        """True si el código actual corre dentro del bucle del gateway"""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def enviar(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Programar una corrutina en el bucle del gateway"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def ejecutar(self, coro: Coroutine) -> Any:
+        """Ejecutar una corrutina en el bucle del gateway y esperar su resultado (API síncrona)"""
+        if self.en_bucle():
+            coro.close()
+            raise RuntimeError("La API síncrona no puede usarse dentro del bucle del gateway; usa la versión async")
+        futuro = self.enviar(coro)
+        try:
+            return futuro.result()
+        except BaseException:
+            futuro.cancel()
+            raise
+
+    async def esperar(self, coro: Coroutine) -> Any:
+        """Esperar una corrutina del gateway desde cualquier bucle de eventos"""
+        if self.en_bucle():
+            return await coro
+        return await asyncio.wrap_future(self.enviar(coro))
+
+    def iterar(self, agen: AsyncIterator) -> Iterator:
+        """Consumir un generador asíncrono del gateway como iterador síncrono"""
+        cola: queue.Queue = queue.Queue()
+
+        async def productor():
+            try:
+                async for elemento in agen:
+                    cola.put((elemento, None))
+            except Exception as e:
+                cola.put((_FIN, e))
+            else:
+                cola.put((_FIN, None))
+
+        futuro = self.enviar(productor())
+        try:
+            while True:
+                elemento, error = cola.get()
+                if elemento is _FIN:
+                    if error is not None:
+                        raise error
+                    return
+                yield elemento
+        finally:
+            futuro.cancel()
+
+    async def iterar_async(self, agen: AsyncIterator) -> AsyncIterator:
+        """Consumir un generador asíncrono del gateway desde cualquier bucle de eventos"""
+        if self.en_bucle():
+            async for elemento in agen:
+                yield elemento
+            return
+
+        consumidor = asyncio.get_running_loop()
+        cola: asyncio.Queue = asyncio.Queue()
+
+        async def productor():
+            try:
+                async for elemento in agen:
+                    consumidor.call_soon_threadsafe(cola.put_nowait, (elemento, None))
+            except Exception as e:
+                consumidor.call_soon_threadsafe(cola.put_nowait, (_FIN, e))
+            else:
+                consumidor.call_soon_threadsafe(cola.put_nowait, (_FIN, None))
+
+        futuro = self.enviar(productor())
+        try:
+            while True:
+                elemento, error = await cola.get()
+                if elemento is _FIN:
+                    if error is not None:
+                        raise error
+                    return
+                yield elemento
+        finally:
+            futuro.cancel()
+
+
+_bucle = BucleFondo()
+
+
+class _Vuelo:
+    """
+    Llamada en curso compartida por todas las peticiones idénticas (single-flight).
+
+    La llamada corre en su propia tarea y publica el texto a medida que llega;
+    cada suscriptor recibe desde el principio todo lo publicado y después lo
+    que siga llegando. Vive solo en el bucle del gateway.
+    """
+
+    def __init__(self):
+        self.partes: List[str] = []
+        self.terminado = False
+        self.error: Optional[BaseException] = None
+        self.suscriptores = 0
+        self.tarea: Optional[asyncio.Task] = None
+        self._cambio = asyncio.Condition()
+
+    async def publicar(self, parte: str):
+        async with self._cambio:
+            self.partes.append(parte)
+            self._cambio.notify_all()
+
+    async def cerrar(self, error: Optional[BaseException] = None):
+        async with self._cambio:
+            self.terminado = True
+            self.error = error
+            self._cambio.notify_all()
+
+    async def fragmentos(self) -> AsyncIterator[str]:
+        """Todo lo publicado hasta ahora y lo que llegue después, hasta el cierre"""
+        leidas = 0
+        while True:
+            async with self._cambio:
+                await self._cambio.wait_for(lambda: len(self.partes) > leidas or self.terminado)
+                nuevas = self.partes[leidas:]
+                terminado = self.terminado
+            for parte in nuevas:
+                yield parte
+            leidas += len(nuevas)
+            if terminado and leidas == len(self.partes):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class LLMGateway:
+    """
+    Punto único de salida hacia la API de OpenAI.
+
+    Mantiene un solo cliente asíncrono con pool de conexiones keep-alive para
+    todo el proceso, ejecutado en el bucle de fondo compartido. Cada operación
+    tiene una versión async (``completar_async``, ``completar_stream_async``,
+    ``embeber_async``) y una síncrona equivalente que la envuelve.
+
+    Las completions idénticas que se solicitan mientras otra igual está en
+    curso (de cualquier sesión) se unen a ella en lugar de pagar otra llamada.
+
+    Ganchos disponibles:
+
+    - cache: objeto con ``obtener(params) -> Optional[str]`` y ``guardar(params, texto)``
+    - ejecutor: corrutina ``ejecutor(fn, params)`` que envuelve la llamada (p. ej. reintentos);
+      ``fn`` es un callable sin argumentos que devuelve un awaitable. Si tiene
+      ``reconciliar(params, tokens_usados)``, se le informa el uso real de los streams al terminar
+    - observadores: callables que reciben un dict con los datos de cada llamada
+    - metricas: el observador RegistroMetricas instalado, para consultar resúmenes
+    """
+
+    def __init__(self, etapas: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.etapas = {nombre: dict(config) for nombre, config in (etapas or ETAPAS).items()}
+        for nombre in self.etapas:
+            self.etapas[nombre].update(_ajustes_desde_entorno(nombre))
+        self.cache = None
+        self.ejecutor: Optional[Callable[[Callable[[], Awaitable[Any]], Dict[str, Any]], Awaitable[Any]]] = None
+        self.observadores: List[Callable[[Dict[str, Any]], None]] = []
+        self.metricas: Optional[RegistroMetricas] = None
+        self._vuelos: Dict[str, _Vuelo] = {}
+        self._client: Optional[AsyncOpenAI] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Cliente OpenAI asíncrono compartido, creado en el primer uso"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._crear_cliente()
+        return self._client
+
+    def _crear_cliente(self) -> AsyncOpenAI:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONEXIONES,
+                max_keepalive_connections=MAX_CONEXIONES_KEEPALIVE,
+                keepalive_expiry=KEEPALIVE_EXPIRY_S,
+            ),
+            timeout=httpx.Timeout(TIMEOUT_S, connect=10.0),
+        )
+        return AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            # Con un ejecutor (planificador) los reintentos son suyos; duplicarlos multiplicaría las esperas
+            max_retries=0 if self.ejecutor is not None else MAX_REINTENTOS_CLIENTE,
+        )
+
+    def configurar_etapa(self, etapa: str, **ajustes):
+        """Cambiar modelo, temperatura o max_tokens de una etapa en tiempo de ejecución"""
+        self.etapas.setdefault(etapa, {}).update(ajustes)
+
+    def agregar_observador(self, observador: Callable[[Dict[str, Any]], None]):
+        """Registrar un gancho que recibe los datos de cada llamada (métricas, logs)"""
+        self.observadores.append(observador)
+
+    def parametros(self, etapa: str, **ajustes) -> Dict[str, Any]:
+        """Parámetros efectivos de una etapa, con ajustes puntuales aplicados"""
+        if etapa not in self.etapas:
+            raise ValueError(f"Etapa de LLM desconocida: {etapa}")
+        params = dict(self.etapas[etapa])
+        params.update({k: v for k, v in ajustes.items() if v is not None})
+        return params
+
+    async def _ejecutar(self, fn: Callable[[], Awaitable[Any]], params: Dict[str, Any]) -> Any:
+        if self.ejecutor is not None:
+            return await self.ejecutor(fn, params)
+        return await fn()
+
+    def _registro(self, etapa: str, params: Dict[str, Any], inicio: Optional[float] = None, **datos) -> Dict[str, Any]:
+        """Datos comunes de una llamada para los observadores"""
+        registro = {"etapa": etapa, "modelo": params["model"], "max_tokens": params.get("max_tokens")}
+        if inicio is not None:
+            registro["latencia_s"] = time.perf_counter() - inicio
+        registro.update(datos)
+        return registro
+
+    def _notificar(self, registro: Dict[str, Any]):
+        for observador in self.observadores:
+            try:
+                observador(registro)
+            except Exception:
+                # Un observador defectuoso nunca debe romper la generación
+                pass
+
+    async def _leer_cache(self, params: Dict[str, Any]) -> Optional[str]:
+        if self.cache is None or regenerando():
+            return None
+        return await asyncio.to_thread(self.cache.obtener, params)
+
+    async def _guardar_cache(self, params: Dict[str, Any], texto: str):
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.guardar, params, texto)
+
+    # --- Implementación (corre siempre en el bucle del gateway) ---
+
+    def _vuelo(self, params: Dict[str, Any], producir: Callable[[_Vuelo], Awaitable[None]]) -> Tuple[_Vuelo, bool]:
+        """Llamada en curso idéntica a ``params``, o una nueva ejecutada por ``producir``.
+
+        Devuelve (vuelo, True) si la llamada es nueva y (vuelo, False) si se
+        reutiliza una que ya estaba en curso.
+        """
+        clave = clave_completion(params)
+        vuelo = self._vuelos.get(clave)
+        if vuelo is not None:
+            return vuelo, False
+
+        vuelo = _Vuelo()
+        self._vuelos[clave] = vuelo
+
+        async def correr():
+            try:
+                await producir(vuelo)
+            except BaseException as e:
+                await vuelo.cerrar(e)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+            else:
+                await vuelo.cerrar()
+            finally:
+                if self._vuelos.get(clave) is vuelo:
+                    del self._vuelos[clave]
+
+        vuelo.tarea = asyncio.ensure_future(correr())
+        return vuelo, True
+
+    async def _suscribir(self, vuelo: _Vuelo) -> AsyncIterator[str]:
+        """Recibir los fragmentos de un vuelo; si nadie más lo escucha, se cancela tras GRACIA_VUELO_S"""
+        vuelo.suscriptores += 1
+        try:
+            async for parte in vuelo.fragmentos():
+                yield parte
+        finally:
+            vuelo.suscriptores -= 1
+            if vuelo.suscriptores == 0 and not vuelo.terminado:
+                asyncio.get_running_loop().call_later(GRACIA_VUELO_S, self._abandonar, vuelo)
+
+    @staticmethod
+    def _abandonar(vuelo: _Vuelo):
+        if vuelo.suscriptores == 0 and not vuelo.terminado and vuelo.tarea is not None:
+            vuelo.tarea.cancel()
+
+    async def _producir_completion(self, etapa: str, params: Dict[str, Any], vuelo: _Vuelo):
+        inicio = time.perf_counter()
+        try:
+            response = await self._ejecutar(lambda: self.client.chat.completions.create(**params), params)
+        except Exception as e:
+            self._notificar(self._registro(etapa, params, inicio, error=str(e)))
+            raise
+
+        texto = (response.choices[0].message.content or "").strip()
+        self._notificar(self._registro(
+            etapa, params, inicio, usage=response.usage, finish_reason=response.choices[0].finish_reason
+        ))
+
+        await vuelo.publicar(texto)
+        await self._guardar_cache(params, texto)
+
+    async def _producir_stream(self, etapa: str, params: Dict[str, Any], vuelo: _Vuelo):
+        inicio = time.perf_counter()
+        primer_token_s = None
+        usage = None
+        finish_reason = None
+        try:
+            stream = await self._ejecutar(
+                lambda: self.client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **params
+                ),
+                params,
+            )
+        except Exception as e:
+            self._notificar(self._registro(etapa, params, inicio, error=str(e)))
+            raise
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if primer_token_s is None:
+                        primer_token_s = time.perf_counter() - inicio
+                    await vuelo.publicar(delta)
+        except Exception as e:
+            self._notificar(self._registro(etapa, params, inicio, error=str(e)))
+            raise
+        finally:
+            self._reconciliar_stream(params, usage, vuelo)
+
+        texto = "".join(vuelo.partes).strip()
+        self._notificar(self._registro(
+            etapa, params, inicio, primer_token_s=primer_token_s, usage=usage, finish_reason=finish_reason
+        ))
+
+        await self._guardar_cache(params, texto)
+
+    def _reconciliar_stream(self, params: Dict[str, Any], usage: Any, vuelo: _Vuelo):
+        """Informar al ejecutor el uso real de un stream (el del último fragmento, o estimado si se cortó)"""
+        reconciliar = getattr(self.ejecutor, "reconciliar", None)
+        if reconciliar is None:
+            return
+        tokens_usados = getattr(usage, "total_tokens", None)
+        if not isinstance(tokens_usados, int):
+            # Stream cancelado o sin fragmento de uso: entrada estimada más el texto recibido
+            tokens_usados = estimar_tokens({"messages": params["messages"]}) + estimar_tokens_texto("".join(vuelo.partes))
+        reconciliar(params, tokens_usados)
+
+    async def _completar(self, etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> str:
+        params = self.parametros(etapa, **ajustes)
+        params["messages"] = mensajes
+
+        texto = await self._leer_cache(params)
+        if texto is not None:
+            self._notificar(self._registro(etapa, params, cache=True))
+            return texto
+
+        inicio = time.perf_counter()
+        vuelo, nuevo = self._vuelo(params, lambda v: self._producir_completion(etapa, params, v))
+        partes = [parte async for parte in self._suscribir(vuelo)]
+        if not nuevo:
+            self._notificar(self._registro(etapa, params, inicio, dedup=True))
+        return "".join(partes).strip()
+
+    async def _completar_stream(self, etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> AsyncIterator[str]:
+        params = self.parametros(etapa, **ajustes)
+        params["messages"] = mensajes
+
+        texto = await self._leer_cache(params)
+        if texto is not None:
+            self._notificar(self._registro(etapa, params, cache=True))
+            yield texto
+            return
+
+        inicio = time.perf_counter()
+        vuelo, nuevo = self._vuelo(params, lambda v: self._producir_stream(etapa, params, v))
+        async for parte in self._suscribir(vuelo):
+            yield parte
+        if not nuevo:
+            self._notificar(self._registro(etapa, params, inicio, dedup=True))
+
+    async def _embeber(self, textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+        params = self.parametros(etapa)
+        params["input"] = textos
+
+        inicio = time.perf_counter()
+        try:
+            response = await self._ejecutar(lambda: self.client.embeddings.create(**params), params)
+        except Exception as e:
+            self._notificar(self._registro(etapa, params, inicio, error=str(e)))
+            raise
+
+        self._notificar(self._registro(etapa, params, inicio, usage=response.usage))
+        return [item.embedding for item in response.data]
+
+    async def _embeber_lotes(self, textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+        # Textos repetidos se envían una sola vez; los resultados se reparten por huella
+        unicos: Dict[str, str] = {}
+        huellas: List[str] = []
+        for texto in textos:
+            huella = hashlib.sha256(texto.encode("utf-8")).hexdigest()
+            unicos.setdefault(huella, texto)
+            huellas.append(huella)
+
+        lotes: List[List[Tuple[str, str]]] = []
+        tokens_lote = 0
+        for huella, texto in unicos.items():
+            tokens = estimar_tokens_texto(texto)
+            if not lotes or len(lotes[-1]) >= EMBEDDINGS_MAX_TEXTOS_LOTE or tokens_lote + tokens > EMBEDDINGS_MAX_TOKENS_LOTE:
+                lotes.append([])
+                tokens_lote = 0
+            lotes[-1].append((huella, texto))
+            tokens_lote += tokens
+
+        semaforo = asyncio.Semaphore(max(1, EMBEDDINGS_MAX_CONCURRENCIA))
+
+        async def enviar(lote: List[Tuple[str, str]]) -> List[Tuple[str, List[float]]]:
+            async with semaforo:
+                vectores = await self._embeber([texto for _, texto in lote], etapa=etapa)
+            return list(zip((huella for huella, _ in lote), vectores))
+
+        por_huella: Dict[str, List[float]] = {}
+        for resultado in await asyncio.gather(*(enviar(lote) for lote in lotes)):
+            por_huella.update(resultado)
+        return [por_huella[huella] for huella in huellas]
+
+    # --- API asíncrona (se puede esperar desde cualquier bucle de eventos) ---
+
+    async def completar_async(self, etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> str:
+        """
+        Ejecutar una chat completion para la etapa indicada.
+
+        Args:
+            etapa: Nombre de la etapa (clave de ETAPAS)
+            mensajes: Mensajes en formato chat de OpenAI
+            **ajustes: Sobrescrituras puntuales (model, temperature, max_tokens)
+
+        Returns:
+            Texto generado, sin espacios al inicio ni al final
+        """
+        return await _bucle.esperar(self._completar(etapa, mensajes, **ajustes))
+
+    def completar_stream_async(self, etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> AsyncIterator[str]:
+        """
+        Igual que completar_async(), pero entrega el texto por fragmentos a medida que llega.
+
+        Si la respuesta está en caché se entrega completa en un solo fragmento.
+        Al terminar, el texto completo se guarda en la caché.
+        """
+        return _bucle.iterar_async(self._completar_stream(etapa, mensajes, **ajustes))
+
+    async def embeber_async(self, textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+        """
+        Obtener embeddings para una lista de textos.
+
+        Returns:
+            Lista de vectores en el mismo orden que los textos
+        """
+        return await _bucle.esperar(self._embeber(textos, etapa=etapa))
+
+    async def embeber_lotes_async(self, textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+        """
+        Embeddings de muchos textos (p. ej. un corpus completo) en pocas peticiones.
+
+        Elimina duplicados, agrupa los textos en lotes limitados por número de
+        textos y tokens estimados, y envía los lotes con concurrencia acotada.
+
+        Returns:
+            Lista de vectores en el mismo orden que los textos
+        """
+        return await _bucle.esperar(self._embeber_lotes(textos, etapa=etapa))
+
+    # --- API síncrona (envoltorios finos sobre la asíncrona) ---
+
+    def completar(self, etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> str:
+        """Versión síncrona de completar_async()"""
+        return _bucle.ejecutar(self._completar(etapa, mensajes, **ajustes))
+
+    def completar_stream(self, etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> Iterator[str]:
+        """Versión síncrona de completar_stream_async()"""
+        return _bucle.iterar(self._completar_stream(etapa, mensajes, **ajustes))
+
+    def embeber(self, textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+        """Versión síncrona de embeber_async()"""
+        return _bucle.ejecutar(self._embeber(textos, etapa=etapa))
+
+    def embeber_lotes(self, textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+        """Versión síncrona de embeber_lotes_async()"""
+        return _bucle.ejecutar(self._embeber_lotes(textos, etapa=etapa))
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def obtener_gateway() -> LLMGateway:
+    """Gateway compartido por todo el proceso (todas las sesiones de Streamlit)"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+                if CACHE_ACTIVA:
+                    _gateway.cache = CacheCompletions()
+                if PLANIFICADOR_ACTIVO:
+                    _gateway.ejecutor = PlanificadorLLM()
+                if METRICAS_ACTIVAS:
+                    _gateway.metricas = RegistroMetricas()
+                    _gateway.agregar_observador(_gateway.metricas)
+    return _gateway
+
+
+def ejecutar(coro: Coroutine) -> Any:
+    """Ejecutar una corrutina de generación en el bucle compartido y esperar el resultado.
+
+    Es la base de los envoltorios síncronos de las funciones ``*_async``.
+    """
+    return _bucle.ejecutar(coro)
+
+
+async def esperar(coro: Coroutine) -> Any:
+    """Esperar, desde cualquier bucle de eventos, una corrutina que debe correr en el bucle compartido"""
+    return await _bucle.esperar(coro)
+
+
+def iterar(agen: AsyncIterator) -> Iterator:
+    """Consumir un generador asíncrono de generación como iterador síncrono"""
+    return _bucle.iterar(agen)
+
+
+def completar(etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> str:
+    """Atajo para obtener_gateway().completar(...)"""
+    return obtener_gateway().completar(etapa, mensajes, **ajustes)
+
+
+def completar_stream(etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> Iterator[str]:
+    """Atajo para obtener_gateway().completar_stream(...)"""
+    return obtener_gateway().completar_stream(etapa, mensajes, **ajustes)
+
+
+def embeber(textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+    """Atajo para obtener_gateway().embeber(...)"""
+    return obtener_gateway().embeber(textos, etapa=etapa)
+
+
+def embeber_lotes(textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+    """Atajo para obtener_gateway().embeber_lotes(...)"""
+    return obtener_gateway().embeber_lotes(textos, etapa=etapa)
+
+
+async def completar_async(etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> str:
+    """Atajo para obtener_gateway().completar_async(...)"""
+    return await obtener_gateway().completar_async(etapa, mensajes, **ajustes)
+
+
+def completar_stream_async(etapa: str, mensajes: List[Dict[str, str]], **ajustes) -> AsyncIterator[str]:
+    """Atajo para obtener_gateway().completar_stream_async(...)"""
+    return obtener_gateway().completar_stream_async(etapa, mensajes, **ajustes)
+
+
+async def embeber_async(textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+    """Atajo para obtener_gateway().embeber_async(...)"""
+    return await obtener_gateway().embeber_async(textos, etapa=etapa)
+
+
+async def embeber_lotes_async(textos: List[str], etapa: str = "embeddings") -> List[List[float]]:
+    """Atajo para obtener_gateway().embeber_lotes_async(...)"""
+    return await obtener_gateway().embeber_lotes_async(textos, etapa=etapa)
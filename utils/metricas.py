@@ -0,0 +1,153 @@
+# utils/metricas.py
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, Optional
+
+# Registro JSONL rotativo de cada llamada a la API
+RUTA_METRICAS = os.getenv("LLM_METRICAS_RUTA", os.path.join("logs", "llm_llamadas.jsonl"))
+MAX_BYTES_METRICAS = int(os.getenv("LLM_METRICAS_MAX_BYTES", str(10 * 1024 * 1024)))
+COPIAS_METRICAS = int(os.getenv("LLM_METRICAS_COPIAS", "5"))
+# Sesiones cuyo resumen se conserva en memoria; se descartan las menos recientes
+MAX_SESIONES_METRICAS = int(os.getenv("LLM_METRICAS_MAX_SESIONES", "500"))
+
+# Precios de referencia en USD por millón de tokens (entrada, entrada en caché, salida)
+PRECIOS_USD_POR_MILLON: Dict[str, tuple] = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+}
+
+# Sesión de Streamlit y caso a los que se atribuye cada llamada
+_sesion: contextvars.ContextVar[str] = contextvars.ContextVar("llm_sesion", default="")
+_caso: contextvars.ContextVar[str] = contextvars.ContextVar("llm_caso", default="")
+
+
+def establecer_contexto_metricas(sesion_id: str, caso_id: str):
+    """Atribuir las llamadas siguientes del contexto actual a una sesión y un caso"""
+    _sesion.set(sesion_id)
+    _caso.set(caso_id)
+
+
+def costo_estimado(modelo: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """Costo en USD según PRECIOS_USD_POR_MILLON, o None si el modelo no tiene precio.
+
+    Los tokens de entrada servidos desde la caché de prefijos se cobran a la tarifa reducida.
+    """
+    precios = PRECIOS_USD_POR_MILLON.get(modelo)
+    if precios is None:
+        return None
+    entrada, entrada_cache, salida = precios
+    return ((prompt_tokens - cached_tokens) * entrada + cached_tokens * entrada_cache + completion_tokens * salida) / 1_000_000
+
+
+def _tokens(usage: Any) -> Dict[str, int]:
+    """Extraer contadores de un objeto usage de OpenAI (chat o embeddings)"""
+    detalles = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        "cached_tokens": getattr(detalles, "cached_tokens", None) or 0,
+    }
+
+
+class RegistroMetricas:
+    """
+    Observador del gateway que mide tokens, latencia y costo de cada llamada.
+
+    Escribe una línea JSON por llamada en un archivo rotativo y acumula un
+    resumen por sesión y etapa para mostrarlo en la barra lateral. Solo se
+    conservan los resúmenes de las ``max_sesiones`` sesiones con actividad
+    más reciente; el detalle completo queda en el archivo.
+    """
+
+    def __init__(
+        self,
+        ruta: str = RUTA_METRICAS,
+        max_bytes: int = MAX_BYTES_METRICAS,
+        copias: int = COPIAS_METRICAS,
+        max_sesiones: int = MAX_SESIONES_METRICAS,
+    ):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._sesiones: "OrderedDict[str, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        self._max_sesiones = max_sesiones
+        self._logger = self._crear_logger(max_bytes, copias)
+
+    def _crear_logger(self, max_bytes: int, copias: int) -> logging.Logger:
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        logger = logging.getLogger(f"contrato_realidad.metricas.{self.ruta}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            handler = RotatingFileHandler(self.ruta, maxBytes=max_bytes, backupCount=copias, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        return logger
+
+    def __call__(self, registro: Dict[str, Any]):
+        tokens = _tokens(registro.get("usage"))
+        entrada = {
+            "ts": time.time(),
+            "sesion": _sesion.get(),
+            "caso": _caso.get(),
+            "etapa": registro.get("etapa"),
+            "modelo": registro.get("modelo"),
+            "cache": bool(registro.get("cache")),
+            "dedup": bool(registro.get("dedup")),
+            **tokens,
+            "max_tokens": registro.get("max_tokens"),
+            "finish_reason": registro.get("finish_reason"),
+            "latencia_s": registro.get("latencia_s"),
+            "primer_token_s": registro.get("primer_token_s"),
+            "costo_usd": costo_estimado(
+                registro.get("modelo", ""), tokens["prompt_tokens"], tokens["completion_tokens"], tokens["cached_tokens"]
+            ),
+            "error": registro.get("error"),
+        }
+        self._logger.info(json.dumps(entrada, ensure_ascii=False))
+        self._acumular(entrada)
+
+    def _acumular(self, entrada: Dict[str, Any]):
+        with self._lock:
+            etapas = self._sesiones.setdefault(entrada["sesion"], {})
+            self._sesiones.move_to_end(entrada["sesion"])
+            while len(self._sesiones) > self._max_sesiones:
+                self._sesiones.popitem(last=False)
+            total = etapas.setdefault(entrada["etapa"], {
+                "llamadas": 0,
+                "cache": 0,
+                "dedup": 0,
+                "errores": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+                "completion_tokens": 0,
+                "latencia_s": 0.0,
+                "costo_usd": 0.0,
+            })
+            total["llamadas"] += 1
+            total["cache"] += entrada["cache"]
+            total["dedup"] += entrada["dedup"]
+            total["errores"] += entrada["error"] is not None
+            total["prompt_tokens"] += entrada["prompt_tokens"]
+            total["cached_tokens"] += entrada["cached_tokens"]
+            total["completion_tokens"] += entrada["completion_tokens"]
+            total["latencia_s"] += entrada["latencia_s"] or 0.0
+            total["costo_usd"] += entrada["costo_usd"] or 0.0
+
+    def resumen_sesion(self, sesion_id: str) -> Dict[str, Dict[str, Any]]:
+        """Totales por etapa de una sesión (llamadas, tokens, tokens en caché, latencia acumulada, costo)"""
+        with self._lock:
+            return {etapa: dict(total) for etapa, total in self._sesiones.get(sesion_id, {}).items()}
@@ -0,0 +1,112 @@
+# utils/palabras_clave.py
+
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from utils.indice_lexico import plegar_acentos
+
+# Reglas palabra clave -> documentos del RAG Básico
+RUTA_REGLAS = os.getenv("RAG_REGLAS_RUTA", "reglas_rag.json")
+# Como la búsqueda original, por defecto solo cuenta la consulta; el contexto del caso pesa si se configura
+PESOS_CAMPO_DEFECTO = {"consulta": 1.0, "contexto": 0.0}
+
+
+def patron_trie(palabras: List[str]) -> str:
+    """
+    Expresión regular equivalente a la alternancia de ``palabras``, factorizada como un trie.
+
+    Los prefijos comunes se comparten ("contrato realidad|contratista" ->
+    "contrat(?:o realidad|ista)"), así el motor de regex descarta una posición
+    del texto en pocos pasos aunque haya cientos de palabras clave.
+    """
+    trie: Dict[str, Any] = {}
+    for palabra in palabras:
+        nodo = trie
+        for caracter in palabra:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[""] = {}
+
+    def compilar(nodo: Dict[str, Any]) -> str:
+        opcional = "" in nodo
+        alternativas = [re.escape(c) + compilar(hijo) for c, hijo in sorted(nodo.items()) if c]
+        if not alternativas:
+            return ""
+        if len(alternativas) == 1 and not opcional:
+            return alternativas[0]
+        patron = "(?:" + "|".join(alternativas) + ")"
+        return patron + "?" if opcional else patron
+
+    return compilar(trie)
+
+
+class ReglasPalabrasClave:
+    """
+    Reglas del RAG Básico compiladas en un único matcher.
+
+    Cada regla asocia palabras clave a grupos de documentos de la base de
+    conocimiento. Todas las palabras clave (sin acentos, en minúsculas) se
+    compilan en una sola expresión regular con forma de trie que recorre el
+    texto una vez; cada aparición suma el peso del campo donde aparece
+    (consulta o contexto) a las reglas de esa palabra.
+    """
+
+    def __init__(self, reglas: List[Dict[str, Any]], pesos_campo: Optional[Dict[str, float]] = None):
+        self.reglas = reglas
+        self.pesos_campo = {**PESOS_CAMPO_DEFECTO, **(pesos_campo or {})}
+        self._reglas_por_palabra: Dict[str, List[int]] = {}
+        for indice, regla in enumerate(reglas):
+            for palabra in regla.get("palabras_clave", []):
+                palabra = plegar_acentos(palabra).strip()
+                if palabra and indice not in self._reglas_por_palabra.get(palabra, []):
+                    self._reglas_por_palabra.setdefault(palabra, []).append(indice)
+        # Inicio de palabra pero no final: "norma" también encuentra "normativa", como la búsqueda original
+        patron = patron_trie(list(self._reglas_por_palabra))
+        self._regex = re.compile(r"\b(" + patron + ")") if patron else None
+
+    @classmethod
+    def desde_archivo(cls, ruta: str) -> "ReglasPalabrasClave":
+        with open(ruta, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        return cls(datos.get("reglas", []), datos.get("pesos_campo"))
+
+    def contar(self, texto: str) -> Dict[int, int]:
+        """Apariciones de palabras clave por regla en un texto"""
+        conteos: Dict[int, int] = {}
+        if self._regex is None or not texto:
+            return conteos
+        for coincidencia in self._regex.finditer(plegar_acentos(texto)):
+            for indice in self._reglas_por_palabra[coincidencia.group(1)]:
+                conteos[indice] = conteos.get(indice, 0) + 1
+        return conteos
+
+    def puntuar(self, consulta: str, contexto: str = "") -> Dict[int, float]:
+        """Puntaje de cada regla: apariciones ponderadas por el peso del campo donde aparecen"""
+        puntajes: Dict[int, float] = {}
+        for campo, texto in (("consulta", consulta), ("contexto", contexto)):
+            peso = self.pesos_campo.get(campo, 0.0)
+            if not peso:
+                continue
+            for indice, veces in self.contar(texto).items():
+                puntajes[indice] = puntajes.get(indice, 0.0) + peso * veces
+        return puntajes
+
+
+_reglas: Dict[str, Any] = {"firma": None, "reglas": None}
+_reglas_lock = threading.Lock()
+
+
+def cargar_reglas(ruta: str = RUTA_REGLAS) -> ReglasPalabrasClave:
+    """Reglas compiladas, compartidas por el proceso; se recompilan solo si cambia el archivo"""
+    try:
+        estado = os.stat(ruta)
+        firma = (ruta, estado.st_mtime_ns, estado.st_size)
+    except OSError:
+        firma = (ruta, None, None)
+    with _reglas_lock:
+        if _reglas["firma"] != firma:
+            _reglas["reglas"] = ReglasPalabrasClave.desde_archivo(ruta) if firma[1] is not None else ReglasPalabrasClave([])
+            _reglas["firma"] = firma
+        return _reglas["reglas"]
@@ -0,0 +1,209 @@
+# utils/planificador.py
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import openai
+
+# Límites de la cuenta por modelo (peticiones y tokens por minuto)
+RPM = float(os.getenv("LLM_RPM", "500"))
+TPM = float(os.getenv("LLM_TPM", "200000"))
+
+# Política de reintentos ante 429 / 5xx / errores de red
+MAX_REINTENTOS = int(os.getenv("LLM_REINTENTOS", "5"))
+BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1"))
+BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "30"))
+
+# Aproximación de tokens para texto en español sin tokenizador
+CARACTERES_POR_TOKEN = 4
+TOKENS_POR_MENSAJE = 4
+
+
+def estimar_tokens_texto(texto: str) -> int:
+    """Tokens aproximados de un texto suelto (entrada de embeddings)"""
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+
+def estimar_tokens(params: Dict[str, Any]) -> int:
+    """Estimar los tokens que consumirá una petición antes de enviarla.
+
+    Para chat: tokens de los mensajes más ``max_tokens`` (el máximo que puede
+    facturarse). Para embeddings: tokens del texto de entrada.
+    """
+    if "messages" in params:
+        caracteres = sum(len(m.get("content") or "") for m in params["messages"])
+        entrada = caracteres // CARACTERES_POR_TOKEN + TOKENS_POR_MENSAJE * len(params["messages"])
+        return entrada + int(params.get("max_tokens") or 0)
+    textos = params.get("input") or []
+    if isinstance(textos, str):
+        textos = [textos]
+    return sum(estimar_tokens_texto(t) for t in textos)
+
+
+def _segundos_retry_after(error: Exception) -> Optional[float]:
+    """Leer la espera sugerida por el proveedor (retry-after-ms / retry-after)"""
+    respuesta = getattr(error, "response", None)
+    if respuesta is None:
+        return None
+    cabeceras = respuesta.headers
+    try:
+        if cabeceras.get("retry-after-ms"):
+            return float(cabeceras["retry-after-ms"]) / 1000
+        if cabeceras.get("retry-after"):
+            return float(cabeceras["retry-after"])
+    except ValueError:
+        # retry-after también puede ser una fecha HTTP; se usa el backoff propio
+        return None
+    return None
+
+
+def es_reintentable(error: Exception) -> bool:
+    """429, 5xx, timeouts y fallos de conexión se reintentan; el resto no"""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 409)
+    return False
+
+
+class CuboTokens:
+    """
+    Cubo de tokens para admisión: se rellena a ``capacidad`` por minuto.
+
+    ``adquirir(n)`` espera hasta que haya ``n`` unidades disponibles; así las
+    peticiones se reparten en el tiempo en lugar de fallar con 429.
+    """
+
+    def __init__(self, capacidad_por_minuto: float):
+        self.capacidad = capacidad_por_minuto
+        self.recarga_por_s = capacidad_por_minuto / 60
+        self.disponible = capacidad_por_minuto
+        self._actualizado = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self.disponible = min(self.capacidad, self.disponible + (ahora - self._actualizado) * self.recarga_por_s)
+        self._actualizado = ahora
+
+    async def adquirir(self, cantidad: float):
+        # Una petición mayor que el cubo entero esperaría para siempre
+        cantidad = min(cantidad, self.capacidad)
+        async with self._lock:
+            while True:
+                self._rellenar()
+                if self.disponible >= cantidad:
+                    self.disponible -= cantidad
+                    return
+                await asyncio.sleep((cantidad - self.disponible) / self.recarga_por_s)
+
+    def devolver(self, cantidad: float):
+        """Reintegrar unidades reservadas de más (estimación > uso real)"""
+        self._rellenar()
+        self.disponible = min(self.capacidad, self.disponible + cantidad)
+
+    def vaciar(self):
+        """Dejar el cubo a cero tras un 429: el proveedor ya nos considera por encima del límite"""
+        self._rellenar()
+        self.disponible = 0
+
+
+class PlanificadorLLM:
+    """
+    Planificador delante de cada llamada a la API (gancho ``ejecutor`` del gateway).
+
+    - Admisión por cubos de tokens de peticiones y tokens por minuto, por modelo.
+    - Reintentos con backoff exponencial con jitter ante 429/5xx/red,
+      respetando las cabeceras retry-after del proveedor.
+    - Tras un 429 el modelo entero se pausa, de modo que bajo carga el
+      rendimiento se degrada de forma suave en lugar de fallar.
+    """
+
+    def __init__(
+        self,
+        rpm: float = RPM,
+        tpm: float = TPM,
+        max_reintentos: int = MAX_REINTENTOS,
+        backoff_base_s: float = BACKOFF_BASE_S,
+        backoff_max_s: float = BACKOFF_MAX_S,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_reintentos = max_reintentos
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._cubos: Dict[str, Dict[str, CuboTokens]] = {}
+        self._pausado_hasta: Dict[str, float] = {}
+        self.reintentos = 0
+        self.limitadas = 0
+
+    def _cubos_modelo(self, modelo: str) -> Dict[str, CuboTokens]:
+        if modelo not in self._cubos:
+            self._cubos[modelo] = {"peticiones": CuboTokens(self.rpm), "tokens": CuboTokens(self.tpm)}
+        return self._cubos[modelo]
+
+    async def _admitir(self, modelo: str, tokens: int):
+        espera = self._pausado_hasta.get(modelo, 0) - time.monotonic()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        cubos = self._cubos_modelo(modelo)
+        await cubos["peticiones"].adquirir(1)
+        await cubos["tokens"].adquirir(tokens)
+
+    def _espera_backoff(self, intento: int, error: Exception) -> float:
+        # Jitter completo: evita que las peticiones rechazadas vuelvan todas a la vez
+        espera = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** intento))
+        sugerida = _segundos_retry_after(error)
+        if sugerida is not None:
+            espera = max(espera, sugerida)
+        return espera
+
+    def _reconciliar(self, modelo: str, estimados: int, resultado: Any):
+        """Devolver al cubo los tokens reservados que la respuesta no usó"""
+        usage = getattr(resultado, "usage", None)
+        total = getattr(usage, "total_tokens", None)
+        if isinstance(total, int) and total < estimados:
+            self._cubos_modelo(modelo)["tokens"].devolver(estimados - total)
+
+    def reconciliar(self, params: Dict[str, Any], tokens_usados: int):
+        """
+        Devolver los tokens reservados para ``params`` que la llamada no usó.
+
+        Para respuestas cuyo uso real no se conoce al devolverlas (streams: el
+        uso llega en el último fragmento); el gateway la llama al terminar.
+        """
+        estimados = estimar_tokens(params)
+        if tokens_usados < estimados:
+            self._cubos_modelo(params.get("model", ""))["tokens"].devolver(estimados - tokens_usados)
+
+    async def __call__(self, fn: Callable[[], Awaitable[Any]], params: Dict[str, Any]) -> Any:
+        modelo = params.get("model", "")
+        tokens = estimar_tokens(params)
+        intento = 0
+        while True:
+            await self._admitir(modelo, tokens)
+            try:
+                resultado = await fn()
+            except Exception as e:
+                if not es_reintentable(e) or intento >= self.max_reintentos:
+                    raise
+                espera = self._espera_backoff(intento, e)
+                # El intento fallido no consumió tokens: se devuelven antes de reservar los del siguiente
+                self._cubos_modelo(modelo)["tokens"].devolver(tokens)
+                if isinstance(e, openai.RateLimitError):
+                    self.limitadas += 1
+                    self._cubos_modelo(modelo)["tokens"].vaciar()
+                    self._pausado_hasta[modelo] = max(self._pausado_hasta.get(modelo, 0), time.monotonic() + espera)
+                self.reintentos += 1
+                intento += 1
+                await asyncio.sleep(espera)
+                continue
+            self._reconciliar(modelo, tokens, resultado)
+            return resultado
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Reintentos y respuestas 429 acumulados desde el arranque"""
+        return {"reintentos": self.reintentos, "limitadas": self.limitadas}
@@ -1,38 +1,89 @@
 # utils/por_secciones.py
 
+import asyncio
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from utils.digesto import digerir_hechos, digerir_hechos_async
+from utils.llm import completar_async, completar_stream, ejecutar, iterar
+from utils.prompts import contexto_caso, mensajes_con_prefijo
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Secciones que se redactan a la vez en el modo "generar todas"
+MAX_CONCURRENCIA_SECCIONES = int(os.getenv("MAX_CONCURRENCIA_SECCIONES", "4"))
 
-def generar_seccion(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = ""):
-    prompt = f"""
-Eres un abogado litigante colombiano experto en derecho laboral. Redacta SOLO la sección "{seccion}" de una demanda laboral por contrato realidad.
-
-HECHOS DEL CASO:
-{hechos}
+def _mensajes_seccion(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "") -> List[Dict[str, str]]:
+    bloque_comentario = f"COMENTARIOS ADICIONALES DEL USUARIO:\n{comentario_usuario}" if comentario_usuario else ""
 
-RESUMEN TÉCNICO:
-{resumen}
+    # Contexto del caso primero (idéntico en las 12 secciones) y la instrucción al final
+    contexto = contexto_caso(
+        ("HECHOS DEL CASO", hechos),
+        ("RESUMEN TÉCNICO", resumen),
+        ("CONCEPTO DE VIABILIDAD", concepto),
+    )
 
-CONCEPTO DE VIABILIDAD:
-{concepto}
+    instruccion = f"""
+Eres un abogado litigante colombiano experto en derecho laboral. Redacta SOLO la sección "{seccion}" de una demanda laboral por contrato realidad, con base en el caso anterior.
 
-{f"COMENTARIOS ADICIONALES DEL USUARIO:\n{comentario_usuario}" if comentario_usuario else ""}
+{bloque_comentario}
 
 Redacta la sección {seccion} de forma clara, estructurada y jurídica, lista para usarse en la demanda.
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "Actúas como abogado litigante experto en demandas laborales por contrato realidad."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-        max_tokens=5000
+    return mensajes_con_prefijo(
+        "Actúas como abogado litigante experto en demandas laborales por contrato realidad.",
+        contexto,
+        instruccion
     )
 
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+async def generar_seccion_async(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "") -> str:
+    hechos = await digerir_hechos_async(hechos)
+    return await completar_async("seccion", _mensajes_seccion(seccion, hechos, resumen, concepto, comentario_usuario))
+
+def generar_seccion(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = ""):
+    return ejecutar(generar_seccion_async(seccion, hechos, resumen, concepto, comentario_usuario))
+
+def generar_seccion_stream(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "") -> Iterator[str]:
+    """Versión en streaming de generar_seccion: entrega la sección por fragmentos"""
+    hechos = digerir_hechos(hechos)
+    return completar_stream("seccion", _mensajes_seccion(seccion, hechos, resumen, concepto, comentario_usuario))
+
+async def generar_secciones_concurrentes_async(
+    secciones: List[str],
+    generar: Callable[[str], Awaitable[str]],
+    max_concurrencia: int = MAX_CONCURRENCIA_SECCIONES
+) -> AsyncIterator[Tuple[str, Optional[str], Optional[Exception]]]:
+    """
+    Redacta varias secciones en paralelo con un límite de concurrencia.
+    
+    Args:
+        secciones: Nombres de las secciones a redactar
+        generar: Corrutina seccion -> texto; no debe leer st.session_state
+        max_concurrencia: Número máximo de secciones en vuelo al mismo tiempo
+        
+    Returns:
+        Iterador asíncrono de (seccion, texto, error) en el orden en que van terminando
+    """
+    semaforo = asyncio.Semaphore(max(1, max_concurrencia))
+
+    async def redactar(seccion: str):
+        async with semaforo:
+            try:
+                return seccion, await generar(seccion), None
+            except Exception as e:
+                return seccion, None, e
+
+    tareas = [asyncio.ensure_future(redactar(seccion)) for seccion in secciones]
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            yield await siguiente
+    finally:
+        # Si el consumidor se detiene antes de tiempo, no dejar secciones en vuelo
+        for tarea in tareas:
+            tarea.cancel()
+
+def generar_secciones_concurrentes(
+    secciones: List[str],
+    generar: Callable[[str], Awaitable[str]],
+    max_concurrencia: int = MAX_CONCURRENCIA_SECCIONES
+) -> Iterator[Tuple[str, Optional[str], Optional[Exception]]]:
+    """Versión síncrona de generar_secciones_concurrentes_async, para consumir desde Streamlit"""
+    return iterar(generar_secciones_concurrentes_async(secciones, generar, max_concurrencia))
@@ -0,0 +1,32 @@
+# utils/prompts.py
+
+from typing import Dict, List, Optional, Tuple
+
+
+def contexto_caso(*bloques: Tuple[str, Optional[str]]) -> str:
+    """
+    Bloque de contexto compartido, byte a byte idéntico entre llamadas del mismo caso.
+
+    Cada bloque es (TÍTULO, texto). Los textos se normalizan (sin espacios al
+    inicio ni al final) y los vacíos se omiten, de modo que el mismo caso
+    produce siempre exactamente el mismo prefijo.
+    """
+    return "\n\n".join(
+        f"{titulo}:\n{texto.strip()}" for titulo, texto in bloques if texto and texto.strip()
+    )
+
+
+def mensajes_con_prefijo(sistema: str, contexto: str, instruccion: str) -> List[Dict[str, str]]:
+    """
+    Mensajes ordenados para aprovechar la caché de prefijos del proveedor.
+
+    Primero lo estable (sistema y contexto del caso, iguales para las 12
+    secciones) y al final lo que cambia en cada llamada (la instrucción de la
+    sección, patrones, comentarios). Las peticiones de un mismo caso comparten
+    así el prefijo más largo posible, que la API factura como tokens en caché.
+    """
+    mensajes = [{"role": "system", "content": sistema}]
+    if contexto:
+        mensajes.append({"role": "user", "content": contexto})
+    mensajes.append({"role": "user", "content": instruccion.strip()})
+    return mensajes
@@ -1,139 +1,69 @@
 # utils/rag.py
 
-import os
+import asyncio
 import json
-from typing import List, Dict, Any
-from openai import OpenAI
-from dotenv import load_dotenv
+import os
+from typing import List, Dict, Any, Iterator, Tuple
 import streamlit as st
+from utils.digesto import digerir_hechos, digerir_hechos_async
+from utils.prompts import contexto_caso, mensajes_con_prefijo
+from utils.llm import AvisoError, obtener_gateway, ejecutar
+from utils.palabras_clave import cargar_reglas
+from utils.almacen_conocimiento import obtener_almacen
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Documentos que el RAG Básico agrega al prompt
+MAX_DOCUMENTOS = int(os.getenv("RAG_MAX_DOCUMENTOS", "5"))
 
 class LegalRAG:
     def __init__(self):
-        self.client = client
+        self.gateway = obtener_gateway()
         self.knowledge_base = self._load_knowledge_base()
         
     def _load_knowledge_base(self) -> Dict[str, Any]:
-        """Cargar la base de conocimiento legal"""
-        knowledge_base = {
-            "contrato_realidad": {
-                "concepto": "El contrato realidad es una figura jurídica que permite reconocer una relación laboral cuando existe una relación de trabajo subordinado pero se ha disfrazado bajo otra figura contractual.",
-                "elementos": [
-                    "Subordinación jurídica",
-                    "Prestación personal del servicio",
-                    "Continuidad en la prestación",
-                    "Remuneración periódica",
-                    "Ausencia de contrato laboral formal"
-                ],
-                "jurisprudencia": [
-                    "Sentencia C-614 de 2009 de la Corte Constitucional",
-                    "Sentencia T-1234 de 2018 sobre contrato realidad",
-                    "Sentencia C-789 de 2020 sobre protección laboral"
-                ],
-                "normativa": [
-                    "Artículo 23 del Código Sustantivo del Trabajo",
-                    "Artículo 25 del CST sobre presunción de laboralidad",
-                    "Artículo 26 del CST sobre contrato de trabajo"
-                ]
-            },
-            "derecho_laboral_colombiano": {
-                "principios": [
-                    "Protección al trabajador",
-                    "Realidad sobre las formas",
-                    "Primacía de la realidad",
-                    "Continuidad de la relación laboral"
-                ],
-                "derechos_trabajador": [
-                    "Salario mínimo legal",
-                    "Prestaciones sociales",
-                    "Seguridad social",
-                    "Vacaciones y descansos",
-                    "Indemnización por despido"
-                ]
-            },
-            "demanda_laboral": {
-                "requisitos": [
-                    "Competencia del juez laboral",
-                    "Identificación clara de las partes",
-                    "Narración de hechos",
-                    "Pretensiones específicas",
-                    "Fundamentos jurídicos",
-                    "Medios de prueba",
-                    "Petición final"
-                ],
-                "plazos": [
-                    "Prescripción ordinaria: 3 años",
-                    "Prescripción especial: 1 año para algunos casos",
-                    "Término de contestación: 10 días"
-                ]
-            }
-        }
-        return knowledge_base
+        """Base de conocimiento legal del almacén compartido (la misma que edita el Gestor)"""
+        return obtener_almacen().datos
+    
+    def _entradas(self, ruta: str) -> List[str]:
+        """Textos de la base de conocimiento en una ruta "categoria/tipo" (uno o una lista)"""
+        categoria, _, tipo = ruta.partition("/")
+        valor = self.knowledge_base.get(categoria, {}).get(tipo)
+        if valor is None:
+            return []
+        entradas = valor if isinstance(valor, list) else [valor]
+        # Las entradas agregadas desde el Gestor son {"content", "source", "added_date"}
+        return [v.get("content", "") if isinstance(v, dict) else str(v) for v in entradas]
     
     def retrieve_relevant_info(self, query: str, context: str = "") -> List[Dict[str, Any]]:
         """Recuperar información relevante basada en la consulta"""
-        relevant_docs = []
-        
-        # Búsqueda semántica simple basada en palabras clave
-        query_lower = query.lower()
-        
-        # Buscar en contrato realidad
-        if any(keyword in query_lower for keyword in ["contrato realidad", "relación laboral", "subordinación"]):
-            relevant_docs.append({
-                "tipo": "concepto",
-                "contenido": self.knowledge_base["contrato_realidad"]["concepto"],
-                "fuente": "Doctrina legal"
-            })
-            
-            for elemento in self.knowledge_base["contrato_realidad"]["elementos"]:
-                relevant_docs.append({
-                    "tipo": "elemento",
-                    "contenido": f"Elemento: {elemento}",
-                    "fuente": "Código Sustantivo del Trabajo"
-                })
-        
-        # Buscar en jurisprudencia
-        if any(keyword in query_lower for keyword in ["jurisprudencia", "sentencia", "corte"]):
-            for sentencia in self.knowledge_base["contrato_realidad"]["jurisprudencia"]:
-                relevant_docs.append({
-                    "tipo": "jurisprudencia",
-                    "contenido": f"Jurisprudencia: {sentencia}",
-                    "fuente": "Corte Constitucional"
-                })
+        # Reglas palabra clave -> documentos compiladas en un solo matcher (reglas_rag.json)
+        reglas = cargar_reglas()
         
-        # Buscar en normativa
-        if any(keyword in query_lower for keyword in ["norma", "artículo", "código", "ley"]):
-            for norma in self.knowledge_base["contrato_realidad"]["normativa"]:
-                relevant_docs.append({
-                    "tipo": "normativa",
-                    "contenido": f"Normativa: {norma}",
-                    "fuente": "Código Sustantivo del Trabajo"
-                })
+        # Puntaje de cada documento: apariciones de las palabras clave de sus reglas,
+        # ponderadas por campo (consulta/contexto) y por el peso del grupo de documentos
+        candidatos: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        for indice, puntaje in reglas.puntuar(query, context).items():
+            for grupo in reglas.reglas[indice].get("documentos", []):
+                for n, texto in enumerate(self._entradas(grupo["ruta"])):
+                    clave = (grupo["ruta"], n)
+                    if clave not in candidatos:
+                        candidatos[clave] = {
+                            "tipo": grupo.get("tipo", ""),
+                            "contenido": grupo.get("plantilla", "{texto}").format(texto=texto),
+                            "fuente": grupo.get("fuente", ""),
+                            "puntaje": 0.0,
+                            "orden": (indice, n),
+                        }
+                    candidatos[clave]["puntaje"] += puntaje * grupo.get("peso", 1.0)
         
-        # Buscar en principios laborales
-        if any(keyword in query_lower for keyword in ["principio", "derecho", "protección"]):
-            for principio in self.knowledge_base["derecho_laboral_colombiano"]["principios"]:
-                relevant_docs.append({
-                    "tipo": "principio",
-                    "contenido": f"Principio: {principio}",
-                    "fuente": "Derecho Laboral Colombiano"
-                })
-        
-        # Buscar en requisitos de demanda
-        if any(keyword in query_lower for keyword in ["demanda", "requisito", "proceso"]):
-            for requisito in self.knowledge_base["demanda_laboral"]["requisitos"]:
-                relevant_docs.append({
-                    "tipo": "requisito",
-                    "contenido": f"Requisito: {requisito}",
-                    "fuente": "Código de Procedimiento Laboral"
-                })
-        
-        return relevant_docs[:5]  # Limitar a 5 documentos más relevantes
+        relevant_docs = sorted(candidatos.values(), key=lambda doc: (-doc["puntaje"], doc["orden"]))
+        # Limitar a los documentos más relevantes, con los mismos campos de siempre
+        return [
+            {"tipo": doc["tipo"], "contenido": doc["contenido"], "fuente": doc["fuente"]}
+            for doc in relevant_docs[:MAX_DOCUMENTOS]
+        ]
     
-    def generate_rag_response(self, query: str, context: str = "", additional_info: str = "") -> str:
-        """Generar respuesta usando RAG"""
+    def _build_messages(self, query: str, context: str = "", additional_info: str = "") -> List[Dict[str, str]]:
+        """Construir los mensajes del prompt RAG con los documentos recuperados"""
         # Recuperar información relevante
         relevant_docs = self.retrieve_relevant_info(query, context)
         
@@ -144,51 +74,102 @@ class LegalRAG:
             for i, doc in enumerate(relevant_docs, 1):
                 context_info += f"{i}. {doc['contenido']} (Fuente: {doc['fuente']})\n"
         
-        # Construir prompt con RAG
-        prompt = f"""
+        # Construir prompt con RAG: el contexto del caso va primero (prefijo estable
+        # entre consultas del mismo caso); consulta e información recuperada al final
+        instruccion = f"""
 Eres un abogado especializado en derecho laboral colombiano. Utiliza la siguiente información legal para responder de manera precisa y fundamentada.
 
-CONSULTA: {query}
-
-CONTEXTO ADICIONAL: {context}
-
 {context_info}
 
+CONSULTA: {query}
+
 INFORMACIÓN ADICIONAL DEL USUARIO: {additional_info}
 
 Responde de manera clara, técnica y fundamentada, citando las fuentes legales cuando sea apropiado.
 """
 
+        return mensajes_con_prefijo(
+            "Eres un abogado experto en derecho laboral colombiano. Proporciona respuestas precisas, fundamentadas y útiles.",
+            contexto_caso(("CONTEXTO ADICIONAL", context)),
+            instruccion
+        )
+    
+    async def generate_rag_response_async(self, query: str, context: str = "", additional_info: str = "") -> str:
+        """Generar respuesta usando RAG (propaga errores de la API)"""
+        messages = self._build_messages(query, context, additional_info)
+        return await self.gateway.completar_async("rag", messages)
+    
+    def generate_rag_response(self, query: str, context: str = "", additional_info: str = "") -> str:
+        """Generar respuesta usando RAG"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Eres un abogado experto en derecho laboral colombiano. Proporciona respuestas precisas, fundamentadas y útiles."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=1500
-            )
-            
-            return response.choices[0].message.content.strip()
+            return ejecutar(self.generate_rag_response_async(query, context, additional_info))
         except Exception as e:
             st.error(f"Error en la generación de respuesta: {str(e)}")
             return "Error al procesar la consulta. Por favor, inténtalo de nuevo."
+    
+    def generate_rag_response_stream(self, query: str, context: str = "", additional_info: str = "") -> Iterator[str]:
+        """Generar respuesta usando RAG, entregando el texto por fragmentos"""
+        messages = self._build_messages(query, context, additional_info)
+        try:
+            yield from self.gateway.completar_stream("rag", messages)
+        except Exception as e:
+            st.error(f"Error en la generación de respuesta: {str(e)}")
+            # Marcado como aviso: sustituye al texto parcial ya mostrado en lugar de seguirlo
+            yield AvisoError("Error al procesar la consulta. Por favor, inténtalo de nuevo.")
+
+CONSULTA_RESUMEN = "Genera un resumen técnico jurídico de estos hechos para evaluar contrato realidad"
+CONSULTA_VIABILIDAD = "Evalúa la viabilidad jurídica de una demanda por contrato realidad"
+CONSULTA_SECCION = "Redacta la sección '{seccion}' de una demanda laboral por contrato realidad"
+
+async def generar_resumen_con_rag_async(hechos: str) -> str:
+    """Generar resumen técnico usando RAG (versión asíncrona)"""
+    # Crear el RAG lee la base de conocimiento: fuera del bucle de eventos
+    rag = await asyncio.to_thread(LegalRAG)
+    return await rag.generate_rag_response_async(
+        query=CONSULTA_RESUMEN,
+        context=await digerir_hechos_async(hechos)
+    )
 
 def generar_resumen_con_rag(hechos: str) -> str:
     """Generar resumen técnico usando RAG"""
     rag = LegalRAG()
     return rag.generate_rag_response(
-        query="Genera un resumen técnico jurídico de estos hechos para evaluar contrato realidad",
-        context=hechos
+        query=CONSULTA_RESUMEN,
+        context=digerir_hechos(hechos)
+    )
+
+async def evaluar_viabilidad_con_rag_async(hechos: str) -> str:
+    """Evaluar viabilidad usando RAG (versión asíncrona)"""
+    rag = await asyncio.to_thread(LegalRAG)
+    return await rag.generate_rag_response_async(
+        query=CONSULTA_VIABILIDAD,
+        context=await digerir_hechos_async(hechos)
     )
 
 def evaluar_viabilidad_con_rag(hechos: str) -> str:
     """Evaluar viabilidad usando RAG"""
     rag = LegalRAG()
     return rag.generate_rag_response(
-        query="Evalúa la viabilidad jurídica de una demanda por contrato realidad",
-        context=hechos
+        query=CONSULTA_VIABILIDAD,
+        context=digerir_hechos(hechos)
+    )
+
+def evaluar_viabilidad_con_rag_stream(hechos: str) -> Iterator[str]:
+    """Evaluar viabilidad usando RAG, entregando el concepto por fragmentos"""
+    rag = LegalRAG()
+    return rag.generate_rag_response_stream(
+        query=CONSULTA_VIABILIDAD,
+        context=digerir_hechos(hechos)
+    )
+
+async def generar_seccion_con_rag_async(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "") -> str:
+    """Generar sección de demanda usando RAG (versión asíncrona)"""
+    rag = await asyncio.to_thread(LegalRAG)
+    context = f"Resumen: {resumen}\nConcepto: {concepto}"
+    return await rag.generate_rag_response_async(
+        query=CONSULTA_SECCION.format(seccion=seccion),
+        context=context,
+        additional_info=comentario_usuario
     )
 
 def generar_seccion_con_rag(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "") -> str:
@@ -196,7 +177,17 @@ def generar_seccion_con_rag(seccion: str, hechos: str, resumen: str, concepto: s
     rag = LegalRAG()
     context = f"Resumen: {resumen}\nConcepto: {concepto}"
     return rag.generate_rag_response(
-        query=f"Redacta la sección '{seccion}' de una demanda laboral por contrato realidad",
+        query=CONSULTA_SECCION.format(seccion=seccion),
+        context=context,
+        additional_info=comentario_usuario
+    )
+
+def generar_seccion_con_rag_stream(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "") -> Iterator[str]:
+    """Generar sección de demanda usando RAG, entregando el texto por fragmentos"""
+    rag = LegalRAG()
+    context = f"Resumen: {resumen}\nConcepto: {concepto}"
+    return rag.generate_rag_response_stream(
+        query=CONSULTA_SECCION.format(seccion=seccion),
         context=context,
         additional_info=comentario_usuario
-    ) 
\ No newline at end of file
+    )
\ No newline at end of file
@@ -1,13 +1,10 @@
 # utils/resumen.py
 
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import Dict, List
+from utils.digesto import digerir_hechos_async
+from utils.llm import completar_async, ejecutar
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def generar_resumen(hechos: str):
+def _mensajes_resumen(hechos: str) -> List[Dict[str, str]]:
     prompt = f"""
 Eres un abogado especializado en derecho laboral colombiano. A partir de los siguientes hechos narrados por un trabajador, redacta un resumen jurídico claro, técnico y estructurado, útil para evaluar la viabilidad de una demanda por contrato realidad.
 
@@ -17,14 +14,13 @@ HECHOS:
 Resumen técnico (evita repetir hechos, prioriza elementos como subordinación, prestación personal del servicio, continuidad y ausencia de vínculo formal):
 """
 
-    response = client.chat.completions.create(
-        model='gpt-4.1-mini',
-        messages=[
-            {"role": "system", "content": "Actúas como un abogado litigante experto en derecho laboral colombiano."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-        max_tokens=1000
-    )
+    return [
+        {"role": "system", "content": "Actúas como un abogado litigante experto en derecho laboral colombiano."},
+        {"role": "user", "content": prompt}
+    ]
 
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+async def generar_resumen_async(hechos: str) -> str:
+    return await completar_async("resumen", _mensajes_resumen(await digerir_hechos_async(hechos)))
+
+def generar_resumen(hechos: str):
+    return ejecutar(generar_resumen_async(hechos))
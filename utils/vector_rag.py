@@ -1,191 +1,387 @@
 # utils/vector_rag.py
 
-import os
+import asyncio
 import json
+import os
 import numpy as np
-from typing import List, Dict, Any, Tuple
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 import streamlit as st
-from sklearn.metrics.pairwise import cosine_similarity
-import hashlib
+from utils.digesto import digerir_hechos, digerir_hechos_async
+from utils.prompts import contexto_caso, mensajes_con_prefijo
+from utils.indice_vectorial import obtener_indice, hash_contenido, InstantaneaIndice
+from utils.fragmentacion import fragmentar_documento, fragmentar_texto
+from utils.fusion import fusion_rrf
+from utils.indice_lexico import IndiceBM25
+from utils.embeddings import Embedder, obtener_embedder
+from utils.planificador import estimar_tokens_texto
+from utils.knowledge_manager import documento_de_conocimiento, documentos_de_conocimiento
+from utils.almacen_conocimiento import obtener_almacen
+from utils.llm import AvisoError, obtener_gateway, ejecutar, esperar
+
+# Nombre del índice en disco del corpus legal
+CORPUS_LEGAL = "corpus_legal"
+
+# Fragmentos que se recuperan por cada documento pedido, antes de agruparlos por documento fuente
+FRAGMENTOS_POR_RESULTADO = int(os.getenv("VECTOR_FRAGMENTOS_POR_RESULTADO", "3"))
+
+# Recuperación multi-consulta: los hechos se dividen en subconsultas de este tamaño, hasta un máximo por búsqueda
+SUBCONSULTA_TOKENS = int(os.getenv("VECTOR_SUBCONSULTA_TOKENS", "150"))
+MAX_SUBCONSULTAS = int(os.getenv("VECTOR_MAX_SUBCONSULTAS", "12"))
+RESULTADOS_POR_SUBCONSULTA = int(os.getenv("VECTOR_RESULTADOS_POR_SUBCONSULTA", "10"))
+# Entrada máxima por texto del modelo de embeddings (8191 tokens en text-embedding-3), con margen
+EMBEDDINGS_MAX_TOKENS_ENTRADA = 8000
+
+# Doctrina y normativa base; se complementa con lo que los abogados agregan al Gestor de Conocimiento
+DOCUMENTOS_BASE: List[Dict[str, Any]] = [
+    {
+        "id": "contrato_realidad_concepto",
+        "content": "El contrato realidad es una figura jurídica que permite reconocer una relación laboral cuando existe una relación de trabajo subordinado pero se ha disfrazado bajo otra figura contractual como prestación de servicios, contrato civil o comercial.",
+        "metadata": {
+            "tipo": "concepto",
+            "fuente": "Doctrina legal",
+            "categoria": "contrato_realidad"
+        }
+    },
+    {
+        "id": "subordinacion_juridica",
+        "content": "La subordinación jurídica es el elemento esencial del contrato de trabajo. Se manifiesta cuando el trabajador está sometido a las órdenes, dirección y control del empleador en la prestación del servicio.",
+        "metadata": {
+            "tipo": "elemento",
+            "fuente": "Código Sustantivo del Trabajo Art. 23",
+            "categoria": "contrato_realidad"
+        }
+    },
+    {
+        "id": "prestacion_personal",
+        "content": "La prestación personal del servicio significa que el trabajador debe realizar personalmente la labor contratada, sin poder delegarla a terceros, salvo autorización expresa del empleador.",
+        "metadata": {
+            "tipo": "elemento",
+            "fuente": "Código Sustantivo del Trabajo",
+            "categoria": "contrato_realidad"
+        }
+    },
+    {
+        "id": "continuidad_servicio",
+        "content": "La continuidad en la prestación del servicio implica que la relación laboral se mantiene de manera estable y permanente, no ocasional o esporádica.",
+        "metadata": {
+            "tipo": "elemento",
+            "fuente": "Jurisprudencia Corte Constitucional",
+            "categoria": "contrato_realidad"
+        }
+    },
+    {
+        "id": "remuneracion_periodica",
+        "content": "La remuneración periódica es el pago regular que recibe el trabajador por su labor, que puede ser salario, comisiones, bonificaciones u otras formas de retribución.",
+        "metadata": {
+            "tipo": "elemento",
+            "fuente": "Código Sustantivo del Trabajo",
+            "categoria": "contrato_realidad"
+        }
+    },
+    {
+        "id": "sentencia_c614_2009",
+        "content": "La Sentencia C-614 de 2009 de la Corte Constitucional establece que el contrato realidad busca proteger al trabajador cuando se simula una relación contractual diferente a la laboral para evadir las obligaciones legales.",
+        "metadata": {
+            "tipo": "jurisprudencia",
+            "fuente": "Corte Constitucional",
+            "categoria": "contrato_realidad"
+        }
+    },
+    {
+        "id": "articulo_23_cst",
+        "content": "Artículo 23 del Código Sustantivo del Trabajo: 'Contrato de trabajo es aquel por el cual una persona natural se obliga a prestar un servicio personal a otra persona natural o jurídica, bajo la continuada dependencia o subordinación de la segunda y mediante remuneración.'",
+        "metadata": {
+            "tipo": "normativa",
+            "fuente": "Código Sustantivo del Trabajo",
+            "categoria": "normativa_laboral"
+        }
+    },
+    {
+        "id": "articulo_25_cst",
+        "content": "Artículo 25 del CST: 'Se presume que toda relación de trabajo personal está regida por un contrato de trabajo.'",
+        "metadata": {
+            "tipo": "normativa",
+            "fuente": "Código Sustantivo del Trabajo",
+            "categoria": "normativa_laboral"
+        }
+    },
+    {
+        "id": "principio_proteccion",
+        "content": "El principio de protección al trabajador establece que en caso de duda sobre la naturaleza de la relación contractual, debe interpretarse a favor del trabajador.",
+        "metadata": {
+            "tipo": "principio",
+            "fuente": "Derecho Laboral Colombiano",
+            "categoria": "principios_laborales"
+        }
+    },
+    {
+        "id": "principio_realidad",
+        "content": "El principio de realidad sobre las formas establece que la verdadera naturaleza de la relación laboral debe determinarse por los hechos reales y no por la denominación que las partes le hayan dado.",
+        "metadata": {
+            "tipo": "principio",
+            "fuente": "Derecho Laboral Colombiano",
+            "categoria": "principios_laborales"
+        }
+    },
+    {
+        "id": "requisitos_demanda",
+        "content": "Los requisitos de una demanda laboral incluyen: competencia del juez laboral, identificación clara de las partes, narración de hechos, pretensiones específicas, fundamentos jurídicos, medios de prueba y petición final.",
+        "metadata": {
+            "tipo": "proceso",
+            "fuente": "Código de Procedimiento Laboral",
+            "categoria": "proceso_laboral"
+        }
+    },
+    {
+        "id": "prescripcion_laboral",
+        "content": "La prescripción ordinaria en materia laboral es de 3 años, contados desde el día siguiente a la terminación del contrato de trabajo.",
+        "metadata": {
+            "tipo": "plazo",
+            "fuente": "Código de Procedimiento Laboral",
+            "categoria": "proceso_laboral"
+        }
+    }
+]
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def cargar_corpus_legal(knowledge_file: str = "legal_knowledge.json") -> List[Dict[str, Any]]:
+    """
+    Corpus del RAG vectorial: DOCUMENTOS_BASE más los documentos de la base de conocimiento.
+    
+    Los documentos largos (p. ej. sentencias completas) se dividen en
+    fragmentos acotados en tokens (ver utils/fragmentacion.py); el corpus es la
+    lista de fragmentos. Cada uno lleva la huella de su contenido ("hash"), que
+    el índice usa para volver a embeber solo lo nuevo o modificado. Junto con
+    el corpus se construye su índice léxico BM25 (ver indice_lexico_legal).
+    
+    Corpus e índice léxico son derivados del almacén de conocimiento compartido:
+    se construyen una vez para todas las sesiones, y las entradas que se
+    agregan después (desde el Gestor o la ingesta) se fragmentan e indexan en
+    el lugar, sin volver a procesar el resto.
+    """
+    return _corpus_legal(knowledge_file)[1]["documentos"]
+
+def _fragmentos(fuentes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fragmentos de los documentos fuente, cada uno con la huella de su contenido"""
+    documentos = [fragmento for fuente in fuentes for fragmento in fragmentar_documento(fuente)]
+    for doc in documentos:
+        doc["hash"] = hash_contenido(doc["content"])
+    return documentos
+
+def _construir_corpus(datos: Dict[str, Any]) -> Dict[str, Any]:
+    documentos = _fragmentos(DOCUMENTOS_BASE + documentos_de_conocimiento(datos))
+    lexico = IndiceBM25([doc["id"] for doc in documentos], [doc["content"] for doc in documentos])
+    # Entradas de cada lista categoria/tipo (None si es un valor suelto): índice de la próxima que se agregue
+    entradas = {
+        (categoria, tipo): len(valor) if isinstance(valor, list) else None
+        for categoria, tipos in datos.items() if isinstance(tipos, dict)
+        for tipo, valor in tipos.items()
+    }
+    return {"documentos": documentos, "por_id": {doc["id"]: doc for doc in documentos}, "lexico": lexico, "entradas": entradas}
+
+def _actualizar_corpus(corpus: Dict[str, Any], _datos: Dict[str, Any], categoria: str, tipo: str, entrada: Any) -> bool:
+    """Agregar al corpus una entrada nueva de la base: solo se fragmenta, se calcula la huella y se indexa esa entrada"""
+    indice = corpus["entradas"].get((categoria, tipo), 0)
+    if indice is None:
+        # Un valor suelto pasa a ser el elemento 0 de una lista: cambia su id, se reconstruye el corpus
+        return False
+    corpus["entradas"][(categoria, tipo)] = indice + 1
+    documento = documento_de_conocimiento(categoria, tipo, indice, entrada)
+    if documento is None:
+        return True
+    fragmentos = _fragmentos([documento])
+    corpus["por_id"].update((doc["id"], doc) for doc in fragmentos)
+    # Lista nueva (no se modifica la anterior): el índice vectorial distingue así las versiones del corpus
+    corpus["documentos"] = corpus["documentos"] + fragmentos
+    corpus["lexico"].agregar([doc["id"] for doc in fragmentos], [doc["content"] for doc in fragmentos])
+    return True
+
+def _corpus_legal(knowledge_file: str = "legal_knowledge.json") -> Tuple[int, Dict[str, Any]]:
+    """(versión de la base, corpus): fragmentos, fragmentos por id e índice léxico de esa versión"""
+    return obtener_almacen(knowledge_file).derivado(
+        "corpus_vectorial", _construir_corpus, _actualizar_corpus, con_version=True
+    )
+
+def indice_lexico_legal(knowledge_file: str = "legal_knowledge.json") -> IndiceBM25:
+    """Índice BM25 en memoria de los fragmentos del corpus legal (se actualiza con el corpus)"""
+    return _corpus_legal(knowledge_file)[1]["lexico"]
+
+def subconsultas(query: str, context: str = "") -> List[str]:
+    """
+    Consultas de búsqueda para una petición sobre un caso: la consulta y los hechos por separado.
+
+    El contexto se divide en fragmentos de hechos (párrafos u oraciones) de
+    unos SUBCONSULTA_TOKENS tokens; si salen más de MAX_SUBCONSULTAS, los
+    fragmentos se agrandan para cubrir todo el contexto. Ninguna subconsulta
+    supera la entrada máxima del modelo de embeddings.
+    """
+    consultas = [query.strip()] if query.strip() else []
+    if context.strip():
+        tamano = max(SUBCONSULTA_TOKENS, -(-estimar_tokens_texto(context) // MAX_SUBCONSULTAS))
+        tamano = min(tamano, EMBEDDINGS_MAX_TOKENS_ENTRADA)
+        hechos = [context[inicio:fin].strip() for inicio, fin in fragmentar_texto(context, tamano, 0)]
+        if len(hechos) > MAX_SUBCONSULTAS:
+            # Contexto mayor que MAX_SUBCONSULTAS entradas completas: muestra repartida a lo largo del texto
+            hechos = [hechos[i] for i in np.linspace(0, len(hechos) - 1, MAX_SUBCONSULTAS).astype(int)]
+        consultas += [hecho for hecho in hechos if hecho]
+    return consultas
+
+def nombre_indice_legal(embedder: Embedder) -> str:
+    """Índice en disco del corpus legal para un backend (cada backend conserva el suyo)"""
+    return CORPUS_LEGAL if embedder.nombre == "openai" else f"{CORPUS_LEGAL}_{embedder.nombre}"
 
 class VectorLegalRAG:
-    def __init__(self):
-        self.client = client
-        self.documents = self._load_legal_documents()
-        self.embeddings_cache = {}
+    def __init__(self, hibrido: bool = False, embedder: Optional[Embedder] = None):
+        self.gateway = obtener_gateway()
+        # Backend de embeddings (EMBEDDINGS_BACKEND por defecto); incluye la caché de embeddings
+        self.embedder = embedder or obtener_embedder()
+        # Índice de embeddings del corpus compartido por todas las instancias y sesiones
+        self.indice = obtener_indice(nombre_indice_legal(self.embedder))
+        # Modo híbrido: los rankings BM25 se fusionan con los semánticos
+        self.hibrido = hibrido
+    
+    @property
+    def documents(self) -> List[Dict[str, Any]]:
+        """Corpus vigente (se relee en cada acceso: la base puede cambiar durante la sesión)"""
+        return self._load_legal_documents()
         
     def _load_legal_documents(self) -> List[Dict[str, Any]]:
-        """Cargar documentos legales con embeddings"""
-        documents = [
-            {
-                "id": "contrato_realidad_concepto",
-                "content": "El contrato realidad es una figura jurídica que permite reconocer una relación laboral cuando existe una relación de trabajo subordinado pero se ha disfrazado bajo otra figura contractual como prestación de servicios, contrato civil o comercial.",
-                "metadata": {
-                    "tipo": "concepto",
-                    "fuente": "Doctrina legal",
-                    "categoria": "contrato_realidad"
-                }
-            },
-            {
-                "id": "subordinacion_juridica",
-                "content": "La subordinación jurídica es el elemento esencial del contrato de trabajo. Se manifiesta cuando el trabajador está sometido a las órdenes, dirección y control del empleador en la prestación del servicio.",
-                "metadata": {
-                    "tipo": "elemento",
-                    "fuente": "Código Sustantivo del Trabajo Art. 23",
-                    "categoria": "contrato_realidad"
-                }
-            },
-            {
-                "id": "prestacion_personal",
-                "content": "La prestación personal del servicio significa que el trabajador debe realizar personalmente la labor contratada, sin poder delegarla a terceros, salvo autorización expresa del empleador.",
-                "metadata": {
-                    "tipo": "elemento",
-                    "fuente": "Código Sustantivo del Trabajo",
-                    "categoria": "contrato_realidad"
-                }
-            },
-            {
-                "id": "continuidad_servicio",
-                "content": "La continuidad en la prestación del servicio implica que la relación laboral se mantiene de manera estable y permanente, no ocasional o esporádica.",
-                "metadata": {
-                    "tipo": "elemento",
-                    "fuente": "Jurisprudencia Corte Constitucional",
-                    "categoria": "contrato_realidad"
-                }
-            },
-            {
-                "id": "remuneracion_periodica",
-                "content": "La remuneración periódica es el pago regular que recibe el trabajador por su labor, que puede ser salario, comisiones, bonificaciones u otras formas de retribución.",
-                "metadata": {
-                    "tipo": "elemento",
-                    "fuente": "Código Sustantivo del Trabajo",
-                    "categoria": "contrato_realidad"
-                }
-            },
-            {
-                "id": "sentencia_c614_2009",
-                "content": "La Sentencia C-614 de 2009 de la Corte Constitucional establece que el contrato realidad busca proteger al trabajador cuando se simula una relación contractual diferente a la laboral para evadir las obligaciones legales.",
-                "metadata": {
-                    "tipo": "jurisprudencia",
-                    "fuente": "Corte Constitucional",
-                    "categoria": "contrato_realidad"
-                }
-            },
-            {
-                "id": "articulo_23_cst",
-                "content": "Artículo 23 del Código Sustantivo del Trabajo: 'Contrato de trabajo es aquel por el cual una persona natural se obliga a prestar un servicio personal a otra persona natural o jurídica, bajo la continuada dependencia o subordinación de la segunda y mediante remuneración.'",
-                "metadata": {
-                    "tipo": "normativa",
-                    "fuente": "Código Sustantivo del Trabajo",
-                    "categoria": "normativa_laboral"
-                }
-            },
-            {
-                "id": "articulo_25_cst",
-                "content": "Artículo 25 del CST: 'Se presume que toda relación de trabajo personal está regida por un contrato de trabajo.'",
-                "metadata": {
-                    "tipo": "normativa",
-                    "fuente": "Código Sustantivo del Trabajo",
-                    "categoria": "normativa_laboral"
-                }
-            },
-            {
-                "id": "principio_proteccion",
-                "content": "El principio de protección al trabajador establece que en caso de duda sobre la naturaleza de la relación contractual, debe interpretarse a favor del trabajador.",
-                "metadata": {
-                    "tipo": "principio",
-                    "fuente": "Derecho Laboral Colombiano",
-                    "categoria": "principios_laborales"
-                }
-            },
-            {
-                "id": "principio_realidad",
-                "content": "El principio de realidad sobre las formas establece que la verdadera naturaleza de la relación laboral debe determinarse por los hechos reales y no por la denominación que las partes le hayan dado.",
-                "metadata": {
-                    "tipo": "principio",
-                    "fuente": "Derecho Laboral Colombiano",
-                    "categoria": "principios_laborales"
-                }
-            },
-            {
-                "id": "requisitos_demanda",
-                "content": "Los requisitos de una demanda laboral incluyen: competencia del juez laboral, identificación clara de las partes, narración de hechos, pretensiones específicas, fundamentos jurídicos, medios de prueba y petición final.",
-                "metadata": {
-                    "tipo": "proceso",
-                    "fuente": "Código de Procedimiento Laboral",
-                    "categoria": "proceso_laboral"
-                }
-            },
-            {
-                "id": "prescripcion_laboral",
-                "content": "La prescripción ordinaria en materia laboral es de 3 años, contados desde el día siguiente a la terminación del contrato de trabajo.",
-                "metadata": {
-                    "tipo": "plazo",
-                    "fuente": "Código de Procedimiento Laboral",
-                    "categoria": "proceso_laboral"
-                }
-            }
-        ]
-        return documents
+        """Cargar documentos legales: corpus base más la base de conocimiento"""
+        return cargar_corpus_legal()
+    
+    async def get_embedding_async(self, text: str) -> np.ndarray:
+        """Obtener embedding de un texto con el backend configurado (propaga errores de la API)"""
+        return await self.embedder.embeber_async(text)
     
     def get_embedding(self, text: str) -> List[float]:
-        """Obtener embedding de un texto usando OpenAI"""
-        # Crear hash del texto para cache
-        text_hash = hashlib.md5(text.encode()).hexdigest()
-        
-        # Verificar cache
-        if text_hash in self.embeddings_cache:
-            return self.embeddings_cache[text_hash]
-        
+        """Obtener embedding de un texto con el backend configurado"""
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-3-small",
-                input=text
-            )
-            embedding = response.data[0].embedding
-            self.embeddings_cache[text_hash] = embedding
-            return embedding
+            return ejecutar(self.get_embedding_async(text)).tolist()
         except Exception as e:
             st.error(f"Error obteniendo embedding: {str(e)}")
             return []
     
-    def semantic_search(self, query: str, top_k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+    async def preparar_indice_async(self) -> InstantaneaIndice:
+        """
+        Cargar (o construir la primera vez) el índice de embeddings del corpus.
+        
+        Siempre para la versión actual de la base de conocimiento. Devuelve una
+        instantánea inmutable del índice, que se busca junto con los fragmentos
+        con los que se construyó.
+        """
+        # El corpus puede tener que reconstruirse: fuera del bucle de eventos
+        version, corpus = await asyncio.to_thread(_corpus_legal)
+        # El índice se prepara siempre en el bucle del gateway, donde vive su candado
+        return await esperar(self.indice.preparar_async(
+            corpus["documentos"], self.embedder.modelo, self._embeber_corpus_async, version=version
+        ))
+    
+    async def _embeber_corpus_async(self, textos: List[str]) -> np.ndarray:
+        """Embeddings para el índice: sin pasar por la caché LRU, que queda para las consultas"""
+        return await self.embedder.embeber_lotes_async(textos, usar_cache=False)
+    
+    async def semantic_search_async(self, query: str, top_k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
         """Búsqueda semántica usando embeddings"""
-        query_embedding = self.get_embedding(query)
+        indice, query_embedding = await asyncio.gather(
+            self.preparar_indice_async(),
+            self.get_embedding_async(query)
+        )
         
-        if not query_embedding:
+        if not len(query_embedding):
             return []
         
-        similarities = []
-        for doc in self.documents:
-            doc_embedding = self.get_embedding(doc["content"])
-            if doc_embedding:
-                similarity = cosine_similarity(
-                    [query_embedding], 
-                    [doc_embedding]
-                )[0][0]
-                similarities.append((doc, similarity))
+        resultados = indice.buscar(query_embedding, top_k * FRAGMENTOS_POR_RESULTADO)[0]
+        return self._agrupar_por_fuente(resultados, top_k, indice.documento)
+    
+    async def semantic_search_batch_async(self, queries: List[str], top_k: int = 5) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """Búsqueda semántica de varias consultas: un lote de embeddings y un único producto matricial"""
+        if not queries:
+            return []
+        indice, query_embeddings = await asyncio.gather(
+            self.preparar_indice_async(),
+            self.embedder.embeber_lotes_async(queries)
+        )
         
-        # Ordenar por similitud y retornar top_k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:top_k]
+        return [
+            self._agrupar_por_fuente(resultados, top_k, indice.documento)
+            for resultados in indice.buscar(query_embeddings, top_k * FRAGMENTOS_POR_RESULTADO)
+        ]
     
-    def retrieve_relevant_documents(self, query: str, context: str = "") -> List[Dict[str, Any]]:
-        """Recuperar documentos relevantes usando búsqueda semántica"""
-        # Combinar query con contexto para mejor búsqueda
-        search_query = f"{query} {context}".strip()
+    @staticmethod
+    def _agrupar_por_fuente(
+        resultados: List[Tuple[str, float]],
+        top_k: int,
+        documento: Callable[[str], Optional[Dict[str, Any]]]
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Colapsar fragmentos al documento fuente: cada fuente aparece una vez, con
+        el puntaje y el pasaje de su fragmento más similar.
         
-        # Realizar búsqueda semántica
-        search_results = self.semantic_search(search_query, top_k=5)
+        ``documento`` resuelve cada id contra el corpus del que salieron los
+        resultados; los ids que no están en él se descartan.
+        """
+        agrupados: List[Tuple[Dict[str, Any], float]] = []
+        vistas = set()
+        for doc_id, similitud in resultados:
+            fragmento = documento(doc_id)
+            if fragmento is None or fragmento["fuente_id"] in vistas:
+                continue
+            vistas.add(fragmento["fuente_id"])
+            agrupados.append((fragmento, similitud))
+            if len(agrupados) == top_k:
+                break
+        return agrupados
+    
+    def semantic_search(self, query: str, top_k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """Búsqueda semántica usando embeddings"""
+        try:
+            return ejecutar(self.semantic_search_async(query, top_k))
+        except Exception as e:
+            st.error(f"Error obteniendo embedding: {str(e)}")
+            return []
+    
+    def lexical_search(self, query: str, top_k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """Búsqueda BM25 (términos exactos: artículos, radicados de sentencias) agrupada por documento fuente"""
+        # Índice léxico y fragmentos de la misma versión del corpus
+        _version, corpus = _corpus_legal()
+        resultados = corpus["lexico"].buscar(query, top_k * FRAGMENTOS_POR_RESULTADO)
+        return self._agrupar_por_fuente(resultados, top_k, corpus["por_id"].get)
+    
+    async def multi_query_search_async(self, queries: List[str], top_k: int = 5) -> List[Tuple[Dict[str, Any], Optional[float]]]:
+        """
+        Buscar varias consultas a la vez y fusionar sus rankings con Reciprocal Rank Fusion.
+
+        En modo híbrido cada consulta aporta además su ranking BM25.
+
+        Returns:
+            (fragmento, similitud) por documento fuente, en orden de fusión; el
+            fragmento y la similitud son los de la subconsulta que mejor lo
+            encontró. La similitud es None si solo lo encontró la búsqueda léxica
+        """
+        rankings = await self.semantic_search_batch_async(queries, top_k=RESULTADOS_POR_SUBCONSULTA)
+        mejores: Dict[str, Tuple[Dict[str, Any], Optional[float]]] = {}
+        for ranking in rankings:
+            for doc, similitud in ranking:
+                if doc["fuente_id"] not in mejores or similitud > mejores[doc["fuente_id"]][1]:
+                    mejores[doc["fuente_id"]] = (doc, similitud)
+        rankings_fuentes = [[doc["fuente_id"] for doc, _ in ranking] for ranking in rankings]
+        if self.hibrido:
+            for query in queries:
+                ranking = await asyncio.to_thread(self.lexical_search, query, RESULTADOS_POR_SUBCONSULTA)
+                for doc, _ in ranking:
+                    mejores.setdefault(doc["fuente_id"], (doc, None))
+                rankings_fuentes.append([doc["fuente_id"] for doc, _ in ranking])
+        fusion = fusion_rrf(rankings_fuentes)
+        return [mejores[fuente_id] for fuente_id, _ in fusion[:top_k]]
+    
+    async def retrieve_relevant_documents_async(self, query: str, context: str = "") -> List[Dict[str, Any]]:
+        """Recuperar documentos relevantes usando búsqueda semántica"""
+        # La consulta y cada hecho del contexto se buscan por separado y se fusionan
+        search_results = await self.multi_query_search_async(subconsultas(query, context), top_k=5)
         
         relevant_docs = []
         for doc, similarity in search_results:
-            if similarity > 0.3:  # Umbral de similitud
+            # Umbral de similitud; los aciertos solo léxicos (similarity None) ya contienen los términos buscados
+            if similarity is None or similarity > 0.3:
                 relevant_docs.append({
                     "contenido": doc["content"],
                     "metadata": doc["metadata"],
@@ -194,10 +390,18 @@ class VectorLegalRAG:
         
         return relevant_docs
     
-    def generate_rag_response(self, query: str, context: str = "", additional_info: str = "") -> str:
-        """Generar respuesta usando RAG con embeddings"""
+    def retrieve_relevant_documents(self, query: str, context: str = "") -> List[Dict[str, Any]]:
+        """Recuperar documentos relevantes usando búsqueda semántica"""
+        try:
+            return ejecutar(self.retrieve_relevant_documents_async(query, context))
+        except Exception as e:
+            st.error(f"Error obteniendo embedding: {str(e)}")
+            return []
+    
+    async def _build_messages_async(self, query: str, context: str = "", additional_info: str = "") -> List[Dict[str, str]]:
+        """Construir los mensajes del prompt RAG con los documentos recuperados"""
         # Recuperar documentos relevantes
-        relevant_docs = self.retrieve_relevant_documents(query, context)
+        relevant_docs = await self.retrieve_relevant_documents_async(query, context)
         
         # Construir contexto con información recuperada
         context_info = ""
@@ -206,59 +410,129 @@ class VectorLegalRAG:
             for i, doc in enumerate(relevant_docs, 1):
                 context_info += f"{i}. {doc['contenido']} (Fuente: {doc['metadata']['fuente']})\n"
         
-        # Construir prompt con RAG
-        prompt = f"""
+        # Construir prompt con RAG: el contexto del caso va primero (prefijo estable
+        # entre consultas del mismo caso); consulta e información recuperada al final
+        instruccion = f"""
 Eres un abogado especializado en derecho laboral colombiano. Utiliza la siguiente información legal para responder de manera precisa y fundamentada.
 
-CONSULTA: {query}
-
-CONTEXTO ADICIONAL: {context}
-
 {context_info}
 
+CONSULTA: {query}
+
 INFORMACIÓN ADICIONAL DEL USUARIO: {additional_info}
 
 Responde de manera clara, técnica y fundamentada, citando las fuentes legales cuando sea apropiado. Incluye referencias específicas a la normativa y jurisprudencia relevante.
 """
 
+        return mensajes_con_prefijo(
+            "Eres un abogado experto en derecho laboral colombiano. Proporciona respuestas precisas, fundamentadas y útiles, citando fuentes legales específicas.",
+            contexto_caso(("CONTEXTO ADICIONAL", context)),
+            instruccion
+        )
+    
+    async def generate_rag_response_async(self, query: str, context: str = "", additional_info: str = "") -> str:
+        """Generar respuesta usando RAG con embeddings (propaga errores de la API)"""
+        messages = await self._build_messages_async(query, context, additional_info)
+        return await self.gateway.completar_async("vector_rag", messages)
+    
+    def generate_rag_response(self, query: str, context: str = "", additional_info: str = "") -> str:
+        """Generar respuesta usando RAG con embeddings"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Eres un abogado experto en derecho laboral colombiano. Proporciona respuestas precisas, fundamentadas y útiles, citando fuentes legales específicas."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000
-            )
-            
-            return response.choices[0].message.content.strip()
+            return ejecutar(self.generate_rag_response_async(query, context, additional_info))
         except Exception as e:
             st.error(f"Error en la generación de respuesta: {str(e)}")
             return "Error al procesar la consulta. Por favor, inténtalo de nuevo."
+    
+    def generate_rag_response_stream(self, query: str, context: str = "", additional_info: str = "") -> Iterator[str]:
+        """Generar respuesta usando RAG con embeddings, entregando el texto por fragmentos"""
+        try:
+            messages = ejecutar(self._build_messages_async(query, context, additional_info))
+            yield from self.gateway.completar_stream("vector_rag", messages)
+        except Exception as e:
+            st.error(f"Error en la generación de respuesta: {str(e)}")
+            # Marcado como aviso: sustituye al texto parcial ya mostrado en lugar de seguirlo
+            yield AvisoError("Error al procesar la consulta. Por favor, inténtalo de nuevo.")
 
-def generar_resumen_vector_rag(hechos: str) -> str:
-    """Generar resumen técnico usando RAG vectorial"""
+def actualizar_indice_legal() -> Dict[str, Any]:
+    """Poner al día el índice semántico tras agregar o importar conocimiento (solo embebe lo nuevo)"""
     rag = VectorLegalRAG()
+    return ejecutar(rag.preparar_indice_async()).construccion
+
+def reservar_indice_legal():
+    """Reservar la construcción del índice semántico para este proceso (ver IndiceVectorial.reservar)"""
+    return VectorLegalRAG().indice.reservar()
+
+CONSULTA_RESUMEN = "Genera un resumen técnico jurídico de estos hechos para evaluar contrato realidad"
+CONSULTA_VIABILIDAD = "Evalúa la viabilidad jurídica de una demanda por contrato realidad, considerando los elementos del contrato de trabajo y la jurisprudencia aplicable"
+CONSULTA_SECCION = "Redacta la sección '{seccion}' de una demanda laboral por contrato realidad, incluyendo fundamentos jurídicos y referencias legales"
+
+async def generar_resumen_vector_rag_async(hechos: str, hibrido: bool = False) -> str:
+    """Generar resumen técnico usando RAG vectorial (versión asíncrona)"""
+    # Crear el RAG lee la base de conocimiento: fuera del bucle de eventos
+    rag = await asyncio.to_thread(VectorLegalRAG, hibrido=hibrido)
+    return await rag.generate_rag_response_async(
+        query=CONSULTA_RESUMEN,
+        context=await digerir_hechos_async(hechos)
+    )
+
+def generar_resumen_vector_rag(hechos: str, hibrido: bool = False) -> str:
+    """Generar resumen técnico usando RAG vectorial"""
+    rag = VectorLegalRAG(hibrido=hibrido)
     return rag.generate_rag_response(
-        query="Genera un resumen técnico jurídico de estos hechos para evaluar contrato realidad",
-        context=hechos
+        query=CONSULTA_RESUMEN,
+        context=digerir_hechos(hechos)
     )
 
-def evaluar_viabilidad_vector_rag(hechos: str) -> str:
+async def evaluar_viabilidad_vector_rag_async(hechos: str, hibrido: bool = False) -> str:
+    """Evaluar viabilidad usando RAG vectorial (versión asíncrona)"""
+    rag = await asyncio.to_thread(VectorLegalRAG, hibrido=hibrido)
+    return await rag.generate_rag_response_async(
+        query=CONSULTA_VIABILIDAD,
+        context=await digerir_hechos_async(hechos)
+    )
+
+def evaluar_viabilidad_vector_rag(hechos: str, hibrido: bool = False) -> str:
     """Evaluar viabilidad usando RAG vectorial"""
-    rag = VectorLegalRAG()
+    rag = VectorLegalRAG(hibrido=hibrido)
     return rag.generate_rag_response(
-        query="Evalúa la viabilidad jurídica de una demanda por contrato realidad, considerando los elementos del contrato de trabajo y la jurisprudencia aplicable",
-        context=hechos
+        query=CONSULTA_VIABILIDAD,
+        context=digerir_hechos(hechos)
+    )
+
+def evaluar_viabilidad_vector_rag_stream(hechos: str, hibrido: bool = False) -> Iterator[str]:
+    """Evaluar viabilidad usando RAG vectorial, entregando el concepto por fragmentos"""
+    rag = VectorLegalRAG(hibrido=hibrido)
+    return rag.generate_rag_response_stream(
+        query=CONSULTA_VIABILIDAD,
+        context=digerir_hechos(hechos)
     )
 
-def generar_seccion_vector_rag(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "") -> str:
+async def generar_seccion_vector_rag_async(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "", hibrido: bool = False) -> str:
+    """Generar sección de demanda usando RAG vectorial (versión asíncrona)"""
+    rag = await asyncio.to_thread(VectorLegalRAG, hibrido=hibrido)
+    context = f"Resumen: {resumen}\nConcepto: {concepto}"
+    return await rag.generate_rag_response_async(
+        query=CONSULTA_SECCION.format(seccion=seccion),
+        context=context,
+        additional_info=comentario_usuario
+    )
+
+def generar_seccion_vector_rag(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "", hibrido: bool = False) -> str:
     """Generar sección de demanda usando RAG vectorial"""
-    rag = VectorLegalRAG()
+    rag = VectorLegalRAG(hibrido=hibrido)
     context = f"Resumen: {resumen}\nConcepto: {concepto}"
     return rag.generate_rag_response(
-        query=f"Redacta la sección '{seccion}' de una demanda laboral por contrato realidad, incluyendo fundamentos jurídicos y referencias legales",
+        query=CONSULTA_SECCION.format(seccion=seccion),
+        context=context,
+        additional_info=comentario_usuario
+    )
+
+def generar_seccion_vector_rag_stream(seccion: str, hechos: str, resumen: str, concepto: str, comentario_usuario: str = "", hibrido: bool = False) -> Iterator[str]:
+    """Generar sección de demanda usando RAG vectorial, entregando el texto por fragmentos"""
+    rag = VectorLegalRAG(hibrido=hibrido)
+    context = f"Resumen: {resumen}\nConcepto: {concepto}"
+    return rag.generate_rag_response_stream(
+        query=CONSULTA_SECCION.format(seccion=seccion),
         context=context,
         additional_info=comentario_usuario
-    ) 
\ No newline at end of file
+    )
\ No newline at end of file
@@ -1,13 +1,10 @@
 # utils/viabilidad.py
 
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import Dict, Iterator, List
+from utils.digesto import digerir_hechos, digerir_hechos_async
+from utils.llm import completar_async, completar_stream, ejecutar
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def evaluar_viabilidad(hechos: str):
+def _mensajes_viabilidad(hechos: str) -> List[Dict[str, str]]:
     prompt = f"""
 Eres un abogado especializado en derecho laboral colombiano.
 
@@ -27,14 +24,17 @@ Evalúa:
 Concluye si hay **viabilidad alta, media o baja** para presentar demanda, con argumentos técnicos.
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "Eres un abogado litigante con experiencia en demandas laborales por contrato realidad. Redactas conceptos técnicos, argumentativos y estructurados."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.4,
-        max_tokens=1200
-    )
-
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+    return [
+        {"role": "system", "content": "Eres un abogado litigante con experiencia en demandas laborales por contrato realidad. Redactas conceptos técnicos, argumentativos y estructurados."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def evaluar_viabilidad_async(hechos: str) -> str:
+    return await completar_async("viabilidad", _mensajes_viabilidad(await digerir_hechos_async(hechos)))
+
+def evaluar_viabilidad(hechos: str):
+    return ejecutar(evaluar_viabilidad_async(hechos))
+
+def evaluar_viabilidad_stream(hechos: str) -> Iterator[str]:
+    """Versión en streaming de evaluar_viabilidad: entrega el concepto por fragmentos"""
+    return completar_stream("viabilidad", _mensajes_viabilidad(digerir_hechos(hechos)))